@@ -0,0 +1,2 @@
+"""Offline benchmarks, run from the repository root as modules, for example
+`python -m benchmarks.pipeline`."""
@@ -0,0 +1,96 @@
+"""Benchmark the author index offline: write synthetic posts for a number of
+hashtags, then time building the index, updating it after a scrape merges
+new posts into one hashtag, and answering top-author and cross-hashtag
+queries, compared with reloading every `posts.json` file to count posts by
+author.
+
+Usage:
+    python -m benchmarks.authors --posts 1000000 --hashtags 10
+"""
+
+import time
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+from collections import Counter
+
+from benchmarks.synthetic import PostGenerator, write_posts_json
+from tiktok_hashtag_analysis.authors import AuthorIndex
+from tiktok_hashtag_analysis.base import TikTokDownloader
+from tiktok_hashtag_analysis.storage import open_store
+
+
+def timed(function, repeat: int) -> float:
+    """Return the median number of seconds a function takes."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--posts", type=int, default=1000000)
+    parser.add_argument("--hashtags", type=int, default=10)
+    parser.add_argument("--new-posts", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = Path(tmp_dir)
+        per_hashtag = args.posts // args.hashtags
+        hashtags = [f"bench{i}" for i in range(args.hashtags)]
+        for i, hashtag in enumerate(hashtags):
+            generator = PostGenerator(hashtag=hashtag, seed=args.seed + i)
+            write_posts_json(
+                data_dir / hashtag / "posts.json", generator.posts(per_hashtag)
+            )
+
+        print(f"{'Stage':<28} {'Seconds':<10}")
+        start = time.perf_counter()
+        AuthorIndex(data_dir=data_dir).update()
+        print(f"{'build (with snapshots)':<28} {time.perf_counter() - start:<10.3f}")
+
+        # Merging posts keeps the hashtag's snapshot up to date, so only its
+        # rows are replaced
+        generator = PostGenerator(hashtag=hashtags[0], seed=args.seed)
+        downloader = TikTokDownloader(hashtags=hashtags, data_dir=data_dir)
+        downloader.merge_hashtag_posts(
+            hashtags[0], list(generator.posts(args.new_posts, start=per_hashtag))
+        )
+        start = time.perf_counter()
+        index = AuthorIndex(data_dir=data_dir)
+        index.update()
+        print(f"{'load and update':<28} {time.perf_counter() - start:<10.3f}")
+        start = time.perf_counter()
+        AuthorIndex(data_dir=data_dir).update()
+        print(f"{'load (up to date)':<28} {time.perf_counter() - start:<10.3f}")
+
+        top = index.top_authors(number=1)[0]["author"]
+        queries = {
+            "top_authors (all)": lambda: index.top_authors(number=20),
+            "top_authors (hashtag)": lambda: index.top_authors(hashtags[0]),
+            "top_authors (play_count)": lambda: index.top_authors(by="play_count"),
+            "author": lambda: index.author(top),
+            "shared_authors": lambda: index.shared_authors(number=100),
+            "hashtag_overlap": lambda: index.hashtag_overlap(),
+        }
+        for name, query in queries.items():
+            print(f"{name:<28} {timed(query, args.repeat):<10.3f}")
+
+        def reload_posts():
+            counts: Counter = Counter()
+            for hashtag in hashtags:
+                for post in open_store(data_dir / hashtag).iter_posts():
+                    counts[post["author"]["uniqueId"]] += 1
+            return counts.most_common(20)
+
+        print(f"{'reload posts.json (baseline)':<28} {timed(reload_posts, 1):<10.3f}")
+
+
+if __name__ == "__main__":
+    main()
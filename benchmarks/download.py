@@ -0,0 +1,64 @@
+"""Benchmark media download throughput against a local HTTP server that
+stands in for TikTok's media CDN.
+
+Usage:
+    python -m benchmarks.download --posts 100 --latency 0.05 --workers 1 4 16
+"""
+
+import argparse
+import tempfile
+from pathlib import Path
+
+from benchmarks.synthetic import MediaServer
+from tiktok_hashtag_analysis.download import DownloadEngine, DownloadJob, gallery_jobs
+
+
+def make_jobs(base_url: str, posts: int, images: int, media_dir: Path):
+    """Build a queue that mixes image galleries and directly linked videos."""
+    jobs = []
+    for i in range(posts):
+        if i % 2:
+            gallery = {
+                "id": str(i),
+                "music": {"playUrl": f"{base_url}/audio/{i}.mpeg"},
+                "imagePost": {
+                    "images": [
+                        {"imageURL": {"urlList": [f"{base_url}/image/{i}_{j}.jpeg"]}}
+                        for j in range(images)
+                    ]
+                },
+            }
+            jobs.extend(gallery_jobs(video_data=gallery, video_dir=media_dir))
+        else:
+            url = f"{base_url}/video/{i}.mp4"
+            jobs.append(DownloadJob(url=url, path=media_dir, kind="video"))
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--posts", type=int, default=100)
+    parser.add_argument("--images", type=int, default=4)
+    parser.add_argument("--size", type=int, default=256 * 1024)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--rate-limit", type=float, default=None)
+    args = parser.parse_args()
+
+    print(f"{'Workers':<10} {'Items':<10} {'Seconds':<10} {'Items/s':<10} {'MB/s':<10}")
+    with MediaServer(latency=args.latency, size=args.size) as server:
+        for workers in args.workers:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                jobs = make_jobs(server.url, args.posts, args.images, Path(tmp_dir))
+                engine = DownloadEngine(workers=workers, rate_limit=args.rate_limit)
+                progress = engine.run(jobs)
+                elapsed = progress.elapsed
+                print(
+                    f"{workers:<10} {progress.completed:<10} {elapsed:<10.2f} "
+                    f"{progress.completed / elapsed:<10.1f} "
+                    f"{progress.bytes / 1e6 / elapsed:<10.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
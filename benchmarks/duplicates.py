@@ -0,0 +1,130 @@
+"""Benchmark finding near-duplicate captions offline: write synthetic posts
+whose captions are random sentences, a share of which copy one of a few
+campaign captions with a word changed, then time hashing all captions,
+finding clusters with LSH, and updating the signatures after a scrape adds
+new posts, compared with comparing every pair of captions.
+
+The pairwise baseline is timed on a sample of captions and extrapolated,
+since it grows quadratically.
+
+Usage:
+    python -m benchmarks.duplicates --posts 100000 --hashtags 4 --campaigns 20
+"""
+
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+from typing import List
+
+from benchmarks.synthetic import PostGenerator, write_posts_json
+from tiktok_hashtag_analysis.duplicates import CaptionIndex, normalize_caption
+from tiktok_hashtag_analysis.storage import open_store
+
+WORDS = (
+    "the a new old best great my your our this that video dance song trend day "
+    "night summer winter city park beach food recipe cat dog friend family love "
+    "life work school game team win vote change help share follow like watch "
+    "today tomorrow always never really very so much more fun happy sad"
+).split()
+
+
+def sentence(rng: random.Random, length: int) -> List[str]:
+    return [rng.choice(WORDS) for _ in range(length)]
+
+
+def shingles(caption: str, size: int = 5) -> set:
+    return {caption[i : i + size] for i in range(len(caption) - size + 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--posts", type=int, default=100000)
+    parser.add_argument("--hashtags", type=int, default=4)
+    parser.add_argument("--campaigns", type=int, default=20)
+    parser.add_argument("--campaign-share", type=float, default=0.05)
+    parser.add_argument("--new-posts", type=int, default=1000)
+    parser.add_argument("--sample", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    templates = [sentence(rng, 14) for _ in range(args.campaigns)]
+    campaign_posts = set()
+
+    def with_caption(post):
+        words = sentence(rng, rng.randint(6, 20))
+        if rng.random() < args.campaign_share:
+            words = list(rng.choice(templates))
+            words[rng.randrange(len(words))] = rng.choice(WORDS)
+            campaign_posts.add(post["id"])
+        post["desc"] = " ".join(words) + " " + post["desc"]
+        return post
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = Path(tmp_dir)
+        per_hashtag = args.posts // args.hashtags
+        hashtags = [f"bench{i}" for i in range(args.hashtags)]
+        for i, hashtag in enumerate(hashtags):
+            generator = PostGenerator(hashtag=hashtag, seed=args.seed + i)
+            write_posts_json(
+                data_dir / hashtag / "posts.json",
+                (
+                    with_caption(post)
+                    for post in generator.posts(per_hashtag, start=i * per_hashtag)
+                ),
+            )
+
+        print(f"{'Stage':<22} {'Posts':<10} {'Seconds':<10}")
+        start = time.perf_counter()
+        index = CaptionIndex(data_dir=data_dir)
+        hashed = index.update()
+        print(
+            f"{'hash all captions':<22} {hashed:<10} {time.perf_counter() - start:<10.2f}"
+        )
+
+        start = time.perf_counter()
+        clusters = index.duplicates()
+        print(
+            f"{'find clusters (LSH)':<22} {len(index.ids):<10} "
+            f"{time.perf_counter() - start:<10.2f}"
+        )
+        found = {post["id"] for cluster in clusters for post in cluster["posts"]}
+        print(
+            f"{len(clusters)} clusters, with {len(found & campaign_posts)} of "
+            f"{len(campaign_posts)} campaign posts and "
+            f"{len(found - campaign_posts)} other posts"
+        )
+
+        generator = PostGenerator(hashtag=hashtags[0], seed=args.seed + args.hashtags)
+        new_posts = [
+            with_caption(post)
+            for post in generator.posts(args.new_posts, start=args.posts)
+        ]
+        open_store(data_dir / hashtags[0]).merge(new_posts)
+        start = time.perf_counter()
+        hashed = CaptionIndex(data_dir=data_dir).update()
+        print(
+            f"{'incremental update':<22} {hashed:<10} {time.perf_counter() - start:<10.2f}"
+        )
+
+        # Exact Jaccard similarity of every pair of captions in a sample
+        sample = [
+            shingles(normalize_caption(caption))
+            for caption in index.captions[: args.sample]
+        ]
+        start = time.perf_counter()
+        for i in range(len(sample)):
+            for j in range(i + 1, len(sample)):
+                len(sample[i] & sample[j]) / max(1, len(sample[i] | sample[j]))
+        seconds = time.perf_counter() - start
+        extrapolated = seconds * (len(index.ids) / len(sample)) ** 2
+        print(f"{'pairwise (sample)':<22} {len(sample):<10} {seconds:<10.2f}")
+        print(
+            f"{'pairwise (all, est.)':<22} {len(index.ids):<10} {extrapolated:<10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
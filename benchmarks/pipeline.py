@@ -0,0 +1,136 @@
+"""Benchmark each stage of the pipeline offline, for a hashtag with an
+increasing number of previously scraped posts: merging newly scraped posts
+(served by a fake TikTok API), aggregating co-occurring hashtags from
+`posts.json`, printing the frequency table, plotting, finding the posts with
+pending media, and downloading media from a local HTTP server.
+
+Media is only downloaded for the newest `--download-posts` posts, as the
+download throughput doesn't depend on the number of scraped posts.
+
+Usage:
+    python -m benchmarks.pipeline --posts 1000 100000 1000000 --store json jsonl
+"""
+
+import io
+import time
+import argparse
+import tempfile
+import contextlib
+from pathlib import Path
+from typing import List
+
+from benchmarks.synthetic import FakeTikTokApi, MediaServer, PostGenerator, write_posts_json
+from tiktok_hashtag_analysis.base import (
+    TikTokDownloader,
+    aggregate_cooccurring_hashtags,
+)
+from tiktok_hashtag_analysis.download import DownloadJob, gallery_jobs
+
+HASHTAG = "bench"
+
+
+def media_jobs(posts: List[dict], media_dir: Path) -> List[DownloadJob]:
+    """Build the download jobs of posts. Videos are downloaded with yt-dlp
+    from their direct URL, as the TikTok page URLs that are normally used
+    aren't served locally."""
+    jobs = []
+    for post in posts:
+        if "imagePost" in post:
+            jobs.extend(gallery_jobs(video_data=post, video_dir=media_dir))
+        else:
+            url = post["video"]["playAddr"]
+            jobs.append(
+                DownloadJob(url=url, path=media_dir, kind="video", post_id=post["id"])
+            )
+    return jobs
+
+
+def report(posts: int, store: str, stage: str, items: int, seconds: float):
+    rate = items / seconds if seconds > 0 else float("inf")
+    print(
+        f"{posts:<10} {store:<8} {stage:<16} {items:<10} {seconds:<10.3f} {rate:<10.0f}"
+    )
+
+
+def run(args, posts: int, store: str, server: MediaServer):
+    generator = PostGenerator(hashtag=HASHTAG, media_url=server.url, seed=args.seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = Path(tmp_dir)
+        start = time.perf_counter()
+        write_posts_json(data_dir / HASHTAG / "posts.json", generator.posts(posts))
+        report(posts, store, "generate", posts, time.perf_counter() - start)
+
+        # Each scrape fetches some posts that were already scraped, and some
+        # that are new, as TikTok serves the newest posts first
+        overlap = args.fetch // 2
+        fetches = [
+            list(generator.posts(args.fetch, start=posts - overlap + i * overlap))
+            for i in range(2)
+        ]
+        fake_api = FakeTikTokApi(posts={HASHTAG: fetches[0]})
+        downloader = TikTokDownloader(
+            hashtags=[HASHTAG],
+            data_dir=data_dir,
+            api_factory=lambda: fake_api,
+            store=store,
+        )
+        # The first merge migrates the store if needed and builds the caches
+        for stage, fetched in zip(["merge (cold)", "merge"], fetches):
+            fake_api.posts[HASHTAG] = fetched
+            start = time.perf_counter()
+            downloader.get_hashtag_posts(HASHTAG, limit=args.fetch, headed=False)
+            report(posts, store, stage, args.fetch, time.perf_counter() - start)
+        total = posts + 2 * (args.fetch - overlap)
+
+        posts_file = data_dir / HASHTAG / "posts.json"
+        if posts_file.exists():
+            start = time.perf_counter()
+            aggregate_cooccurring_hashtags(posts_file)
+            report(posts, store, "aggregate", total, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            downloader.frequency_table(HASHTAG, number=args.number)
+        report(posts, store, "table", total, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        downloader.plot(HASHTAG, number=args.number)
+        report(posts, store, "plot", total, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        pending = downloader.get_pending_media(HASHTAG)
+        report(posts, store, "pending", total, time.perf_counter() - start)
+
+        pending.sort(key=lambda post: post["createTime"], reverse=True)
+        jobs = media_jobs(pending[: args.download_posts], data_dir / HASHTAG / "media")
+        progress = downloader.download_jobs(jobs, workers=args.workers)
+        report(posts, store, "download", progress.completed, progress.elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--posts", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument(
+        "--store", nargs="+", choices=["json", "jsonl"], default=["json"]
+    )
+    parser.add_argument("--fetch", type=int, default=500)
+    parser.add_argument("--number", type=int, default=20)
+    parser.add_argument("--download-posts", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--size", type=int, default=64 * 1024)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(
+        f"{'Posts':<10} {'Store':<8} {'Stage':<16} {'Items':<10} {'Seconds':<10} "
+        f"{'Items/s':<10}"
+    )
+    with MediaServer(latency=args.latency, size=args.size) as server:
+        for posts in args.posts:
+            for store in args.store:
+                run(args, posts=posts, store=store, server=server)
+
+
+if __name__ == "__main__":
+    main()
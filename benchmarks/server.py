@@ -0,0 +1,127 @@
+"""Load-test the HTTP query service offline: serve synthetic posts for a
+number of hashtags, and measure the latency and throughput of concurrent
+clients querying co-occurring hashtags, post counts and trends, compared
+with printing a frequency table for every query.
+
+Each client keeps its connection open and queries random hashtags. The
+first query of each hashtag loads its snapshot, which is measured
+separately as the cold latency.
+
+Usage:
+    python -m benchmarks.server --hashtags 20 --posts 10000 --clients 1 8 32
+"""
+
+import io
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+import http.client
+import statistics
+from pathlib import Path
+from typing import List
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.synthetic import PostGenerator, write_posts_json
+from tiktok_hashtag_analysis.base import TikTokDownloader
+from tiktok_hashtag_analysis.server import QueryServer
+
+QUERIES = [
+    "/hashtags/{hashtag}/cooccurrences?number=20",
+    "/hashtags/{hashtag}",
+    "/hashtags/{hashtag}/trends?number=20",
+]
+
+
+def percentile(latencies: List[float], share: float) -> float:
+    return sorted(latencies)[min(len(latencies) - 1, int(share * len(latencies)))]
+
+
+def report(stage: str, clients: int, latencies: List[float], seconds: float):
+    print(
+        f"{stage:<16} {clients:<8} {len(latencies):<10} "
+        f"{len(latencies) / seconds:<10.0f} "
+        f"{statistics.median(latencies) * 1000:<10.2f} "
+        f"{percentile(latencies, 0.95) * 1000:<10.2f} "
+        f"{percentile(latencies, 0.99) * 1000:<10.2f}"
+    )
+
+
+def client(server: QueryServer, hashtags: List[str], requests: int, seed: int):
+    rng = random.Random(seed)
+    host, port = server.server_address[:2]
+    connection = http.client.HTTPConnection(host, port)
+    latencies = []
+    for _ in range(requests):
+        path = rng.choice(QUERIES).format(hashtag=rng.choice(hashtags))
+        start = time.perf_counter()
+        connection.request("GET", path)
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        assert response.status == 200, path
+    connection.close()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--hashtags", type=int, default=20)
+    parser.add_argument("--posts", type=int, default=10000)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--baseline", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = Path(tmp_dir)
+        hashtags = [f"bench{i}" for i in range(args.hashtags)]
+        for i, hashtag in enumerate(hashtags):
+            generator = PostGenerator(hashtag=hashtag, seed=args.seed + i)
+            write_posts_json(
+                data_dir / hashtag / "posts.json", generator.posts(args.posts)
+            )
+
+        print(
+            f"{'Stage':<16} {'Clients':<8} {'Requests':<10} {'Req/s':<10} "
+            f"{'p50 (ms)':<10} {'p95 (ms)':<10} {'p99 (ms)':<10}"
+        )
+
+        with QueryServer(data_dir=data_dir, port=0) as server:
+            server.start()
+            start = time.perf_counter()
+            latencies = []
+            for hashtag in hashtags:
+                latencies.extend(client(server, [hashtag], requests=1, seed=args.seed))
+            report("cold", 1, latencies, time.perf_counter() - start)
+
+            for clients in args.clients:
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=clients) as executor:
+                    results = executor.map(
+                        lambda seed: client(
+                            server, hashtags, requests=args.requests, seed=seed
+                        ),
+                        range(clients),
+                    )
+                    latencies = [latency for result in results for latency in result]
+                report("warm", clients, latencies, time.perf_counter() - start)
+            server.shutdown()
+
+        # Printing a frequency table reads the cached counts on every
+        # query
+        downloader = TikTokDownloader(hashtags=hashtags, data_dir=data_dir)
+        latencies = []
+        start = time.perf_counter()
+        for i in range(args.baseline):
+            query_start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                downloader.frequency_table(hashtags[i % len(hashtags)], number=20)
+            latencies.append(time.perf_counter() - query_start)
+        report("frequency_table", 1, latencies, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Benchmark the startup cost of each command-line mode: the wall time and
+peak RSS of a fresh interpreter that imports what the mode needs and does a
+small amount of offline work, and which of the slow-to-import backends it
+loads.
+
+Usage:
+    python -m benchmarks.startup --repeat 5
+"""
+
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+import time
+from pathlib import Path
+
+# Backends that should only be imported by the modes that use them
+HEAVY_MODULES = ["matplotlib", "seaborn", "scipy", "TikTokApi", "playwright", "yt_dlp"]
+
+# Code run for each mode, with the data directory as `data_dir`
+MODES = {
+    "help": """
+sys.argv = ["tiktok-hashtag-analysis", "--help"]
+from tiktok_hashtag_analysis.cli import main
+try:
+    main()
+except SystemExit:
+    pass
+""",
+    "table": """
+from tiktok_hashtag_analysis.base import TikTokDownloader
+TikTokDownloader(hashtags=["bench"], data_dir=data_dir).frequency_table("bench", 10)
+""",
+    "plot": """
+from tiktok_hashtag_analysis.base import TikTokDownloader
+TikTokDownloader(hashtags=["bench"], data_dir=data_dir).plot("bench", 10)
+""",
+    "download": """
+from pathlib import Path
+from tiktok_hashtag_analysis.download import DownloadEngine
+DownloadEngine()._ydl(Path(data_dir))
+""",
+    "scrape": """
+from tiktok_hashtag_analysis.base import _tiktok_api
+_tiktok_api()
+""",
+}
+
+RUNNER = """
+import sys, json, resource, contextlib, io
+data_dir, code, heavy_modules = sys.argv[1], sys.argv[2], json.loads(sys.argv[3])
+with contextlib.redirect_stdout(io.StringIO()):
+    exec(code)
+print(json.dumps({
+    "rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "heavy": [name for name in heavy_modules if name in sys.modules],
+}))
+"""
+
+
+def run_mode(code: str, data_dir: Path):
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", RUNNER, str(data_dir), code, json.dumps(HEAVY_MODULES)],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    seconds = time.perf_counter() - start
+    return seconds, json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    args = parser.parse_args()
+
+    print(f"{'Mode':<10} {'Seconds':<10} {'RSS MB':<10} {'Backends loaded'}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = Path(tmp_dir)
+        (data_dir / "bench").mkdir()
+        posts = [
+            {
+                "id": str(i),
+                "textExtra": [
+                    {"hashtagName": "bench"},
+                    {"hashtagName": f"tag{i % 50}"},
+                ],
+            }
+            for i in range(1000)
+        ]
+        with open(data_dir / "bench" / "posts.json", "w", encoding="utf-8") as f:
+            json.dump(posts, f)
+
+        for mode in args.modes:
+            runs = [run_mode(MODES[mode], data_dir) for _ in range(args.repeat)]
+            seconds = statistics.median(seconds for seconds, _ in runs)
+            rss = max(result["rss"] for _, result in runs) / 1024
+            heavy = ", ".join(runs[-1][1]["heavy"]) or "-"
+            print(f"{mode:<10} {seconds:<10.2f} {rss:<10.1f} {heavy}")
+
+
+if __name__ == "__main__":
+    main()
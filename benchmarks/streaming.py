@@ -0,0 +1,82 @@
+"""Benchmark peak memory use of aggregating co-occurring hashtags from
+`posts.json` files of increasing size, loading the whole file at once versus
+streaming it one post at a time.
+
+Usage:
+    python -m benchmarks.streaming --posts 1000 10000 50000
+"""
+
+import sys
+import json
+import random
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+# Each method is run in a fresh interpreter, which reports its peak RSS (in
+# KiB on Linux) before and after aggregating
+AGGREGATE = """
+import sys, json, resource
+from collections import Counter
+from tiktok_hashtag_analysis.storage import json_iter
+from tiktok_hashtag_analysis.counters import video_hashtags
+
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.argv[1] == "load":
+    with open(sys.argv[2], "r", encoding="utf-8") as f:
+        videos = json.load(f)
+else:
+    videos = json_iter(sys.argv[2], fields=["textExtra"])
+counts = Counter(tag for video in videos for tag in video_hashtags(video))
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(before, after)
+"""
+
+
+def make_post(i: int, vocabulary: list) -> dict:
+    """Build a post padded with nested metadata, roughly the size of a raw
+    TikTok API response."""
+    hashtags = random.sample(vocabulary, k=random.randint(1, 8))
+    return {
+        "id": str(7_000_000_000_000_000_000 + i),
+        "desc": " ".join(f"#{hashtag}" for hashtag in hashtags),
+        "createTime": 1_700_000_000 + i,
+        "author": {"uniqueId": f"user{i % 1000}", "signature": "x" * 200},
+        "stats": {"playCount": i, "diggCount": i // 2},
+        "music": {"playUrl": "", "title": "y" * 100},
+        "video": {"bitrateInfo": [{"PlayAddr": {"UrlList": ["z" * 300] * 3}}] * 2},
+        "textExtra": [{"hashtagName": hashtag, "start": 0} for hashtag in hashtags],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--posts", type=int, nargs="+", default=[1000, 10000, 50000])
+    args = parser.parse_args()
+
+    random.seed(0)
+    vocabulary = [f"tag{i}" for i in range(5000)]
+    print(f"{'Posts':<10} {'File MB':<10} {'Load MB':<10} {'Stream MB':<10}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for posts in args.posts:
+            file_path = Path(tmp_dir) / "posts.json"
+            with open(file_path, "w", encoding="utf-8") as f:
+                json.dump([make_post(i, vocabulary) for i in range(posts)], f)
+
+            peaks = []
+            for method in ["load", "stream"]:
+                output = subprocess.run(
+                    [sys.executable, "-c", AGGREGATE, method, str(file_path)],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                ).stdout
+                before, after = map(int, output.split())
+                peaks.append((after - before) / 1024)
+            size = file_path.stat().st_size / 1e6
+            print(f"{posts:<10} {size:<10.1f} {peaks[0]:<10.1f} {peaks[1]:<10.1f}")
+
+
+if __name__ == "__main__":
+    main()
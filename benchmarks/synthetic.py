@@ -0,0 +1,383 @@
+"""Synthetic data for offline benchmarks: a generator of raw TikTok post API
+responses with realistic shapes, a fake `TikTokApi` that serves them without
+a browser, and a local HTTP server that stands in for TikTok's media CDN.
+
+The generator can also be run on its own, to write a data directory with a
+`posts.json` file for a hashtag.
+
+Usage:
+    python -m benchmarks.synthetic --posts 100000 --output-dir bench_data --hashtag bench
+"""
+
+import json
+import time
+import zlib
+import random
+import asyncio
+import argparse
+import threading
+from pathlib import Path
+from itertools import accumulate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
+
+# First ID and creation time of generated posts
+FIRST_POST_ID = 7_000_000_000_000_000_000
+FIRST_CREATE_TIME = 1_700_000_000
+
+
+class PostGenerator:
+    """Generate raw TikTok post API responses. Hashtags are drawn from a
+    vocabulary with Zipf-distributed popularity, like real hashtag use, and
+    every post also uses `hashtag`. A share of posts are image galleries
+    (`imagePost`), the rest are videos, and some posts mention other users,
+    which adds `textExtra` entries without a hashtag name.
+
+    Media URLs point to `media_url`, so that the media of generated posts
+    can be downloaded from a `MediaServer`."""
+
+    def __init__(
+        self,
+        hashtag: str = "bench",
+        vocabulary_size: int = 10000,
+        gallery_share: float = 0.2,
+        mention_share: float = 0.3,
+        max_hashtags: int = 10,
+        images: int = 4,
+        media_url: str = "http://127.0.0.1",
+        seed: int = 0,
+    ):
+        self.hashtag = hashtag
+        self.vocabulary = [f"tag{i}" for i in range(vocabulary_size)]
+        self.cum_weights = list(
+            accumulate(1 / rank for rank in range(1, vocabulary_size + 1))
+        )
+        self.gallery_share = gallery_share
+        self.mention_share = mention_share
+        self.max_hashtags = max_hashtags
+        self.images = images
+        self.media_url = media_url
+        self.random = random.Random(seed)
+
+    def hashtags(self) -> List[str]:
+        k = self.random.randint(1, self.max_hashtags)
+        drawn = self.random.choices(self.vocabulary, cum_weights=self.cum_weights, k=k)
+        return [self.hashtag] + list(dict.fromkeys(drawn))
+
+    def post(self, index: int) -> Dict:
+        """Generate the post with a specified index. Posts with higher
+        indices are newer."""
+
+        post_id = str(FIRST_POST_ID + index)
+        author = f"user{self.random.randrange(max(1, index // 10 + 1))}"
+        hashtags = self.hashtags()
+        desc = " ".join(f"#{hashtag}" for hashtag in hashtags)
+        text_extra = []
+        offset = 0
+        for hashtag in hashtags:
+            text_extra.append(
+                {
+                    "awemeId": "",
+                    "hashtagId": str(zlib.crc32(hashtag.encode())),
+                    "hashtagName": hashtag,
+                    "isCommerce": False,
+                    "start": offset,
+                    "end": offset + len(hashtag) + 1,
+                    "subType": 0,
+                    "type": 1,
+                    "userId": "",
+                    "userUniqueId": "",
+                }
+            )
+            offset += len(hashtag) + 2
+        if self.random.random() < self.mention_share:
+            mentioned = f"user{self.random.randrange(1000)}"
+            desc += f" @{mentioned}"
+            text_extra.append(
+                {
+                    "awemeId": "",
+                    "hashtagName": "",
+                    "isCommerce": False,
+                    "start": offset,
+                    "end": offset + len(mentioned) + 1,
+                    "subType": 0,
+                    "type": 0,
+                    "userId": str(self.random.randrange(10**18)),
+                    "userUniqueId": mentioned,
+                }
+            )
+
+        play_count = int(self.random.paretovariate(1.2) * 100)
+        post = {
+            "id": post_id,
+            "desc": desc,
+            "createTime": FIRST_CREATE_TIME + index * 60,
+            "author": {
+                "id": str(zlib.crc32(author.encode())),
+                "uniqueId": author,
+                "nickname": author.title(),
+                "signature": "Posting every day " * 3,
+                "verified": False,
+                "avatarThumb": f"{self.media_url}/avatar/{author}.jpeg",
+            },
+            "authorStats": {
+                "followerCount": play_count // 3,
+                "followingCount": 120,
+                "heartCount": play_count,
+                "videoCount": 42,
+            },
+            "stats": {
+                "playCount": play_count,
+                "diggCount": play_count // 10,
+                "commentCount": play_count // 100,
+                "shareCount": play_count // 200,
+                "collectCount": play_count // 150,
+            },
+            "music": {
+                "id": str(self.random.randrange(10**18)),
+                "title": f"original sound - {author}",
+                "authorName": author,
+                "duration": 30,
+                "original": True,
+                "playUrl": f"{self.media_url}/audio/{post_id}.mpeg",
+            },
+            "textExtra": text_extra,
+            "duetEnabled": True,
+            "stitchEnabled": True,
+            "isAd": False,
+        }
+        if self.random.random() < self.gallery_share:
+            post["imagePost"] = {
+                "images": [
+                    {
+                        "imageURL": {
+                            "urlList": [
+                                f"{self.media_url}/image/{post_id}_{i}.jpeg",
+                                f"{self.media_url}/image/{post_id}_{i}.jpeg?mirror",
+                            ]
+                        },
+                        "imageWidth": 1080,
+                        "imageHeight": 1440,
+                    }
+                    for i in range(self.images)
+                ],
+                "title": "",
+            }
+        else:
+            video_url = f"{self.media_url}/video/{post_id}.mp4"
+            post["video"] = {
+                "id": post_id,
+                "duration": self.random.randint(5, 180),
+                "width": 576,
+                "height": 1024,
+                "ratio": "540p",
+                "format": "mp4",
+                "playAddr": video_url,
+                "downloadAddr": video_url,
+                "cover": f"{self.media_url}/cover/{post_id}.jpeg",
+                "bitrateInfo": [
+                    {
+                        "Bitrate": bitrate,
+                        "GearName": f"normal_{quality}_0",
+                        "PlayAddr": {"UrlList": [video_url, f"{video_url}?backup"]},
+                    }
+                    for bitrate, quality in [(1_200_000, 720), (600_000, 540)]
+                ],
+            }
+        return post
+
+    def posts(self, number: int, start: int = 0) -> Iterator[Dict]:
+        """Generate `number` posts, starting at index `start`."""
+        for index in range(start, start + number):
+            yield self.post(index)
+
+
+def write_posts_json(file_path: Path, posts: Iterable[Dict]) -> int:
+    """Write posts to a `posts.json` file one at a time, so that files with
+    millions of posts can be written without holding them all in memory.
+    Returns the number of posts written."""
+
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for post in posts:
+            if written:
+                f.write(",")
+            json.dump(post, f)
+            written += 1
+        f.write("]")
+    return written
+
+
+class FakeVideo:
+    def __init__(self, data: Dict):
+        self.as_dict = data
+
+
+class FakeHashtag:
+    def __init__(self, api: "FakeTikTokApi", name: str):
+        self.api = api
+        self.name = name
+
+    async def videos(
+        self,
+        count: int = 30,
+        cursor: int = 0,
+        session_index: Optional[int] = None,
+        **kwargs,
+    ):
+        api = self.api
+        api.active += 1
+        api.peak_active = max(api.peak_active, api.active)
+        api.calls.append((self.name, session_index))
+        try:
+            # Posts are served in pages, like TikTok's hashtag feed
+            await asyncio.sleep(api.latency)
+            if api.failures.get(self.name, 0) > 0:
+                api.failures[self.name] -= 1
+                raise RuntimeError(f"Simulated failure for {self.name}")
+            posts = api.posts.get(self.name, [])[cursor : cursor + count]
+            for i, post in enumerate(posts):
+                await asyncio.sleep(api.latency if i and i % api.page_size == 0 else 0)
+                if i == api.fail_after.get(self.name):
+                    del api.fail_after[self.name]
+                    raise RuntimeError(f"Simulated failure for {self.name}")
+                yield FakeVideo(post)
+        finally:
+            api.active -= 1
+
+
+class FakeTikTokApi:
+    """Stand-in for `TikTokApi.TikTokApi` that serves posts for each hashtag
+    from memory, with `latency` seconds of delay for every page of
+    `page_size` posts. Pass `api_factory=lambda: FakeTikTokApi(...)` to
+    `TikTokDownloader` to scrape without a browser.
+
+    The scrape of a hashtag in `failures` fails that many times before it
+    succeeds, and the next scrape of a hashtag in `fail_after` fails after
+    that many posts. Every scrape is recorded in `calls`, with the session
+    it used."""
+
+    def __init__(
+        self,
+        posts: Optional[Dict[str, List[Dict]]] = None,
+        latency: float = 0.0,
+        page_size: int = 30,
+        failures: Optional[Dict[str, int]] = None,
+        fail_after: Optional[Dict[str, int]] = None,
+    ):
+        self.posts = posts or {}
+        self.latency = latency
+        self.page_size = page_size
+        self.failures = dict(failures or {})
+        self.fail_after = dict(fail_after or {})
+        self.calls: List[Tuple[str, Optional[int]]] = []
+        self.sessions_created = 0
+        # Number of scrapes running, and the most that ran at once
+        self.active = 0
+        self.peak_active = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+    async def create_sessions(self, num_sessions: int = 1, **kwargs):
+        self.sessions_created += num_sessions
+        self.sessions = list(range(num_sessions))
+
+    def hashtag(self, name: str) -> FakeHashtag:
+        return FakeHashtag(api=self, name=name)
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    """Serve `size` bytes for any path, after `latency` seconds, with a
+    Content-Type matching the path's extension. Paths under `/forbidden/`
+    return a 403, like media that TikTok refuses access to. Requested paths
+    are recorded in `paths`, and opened connections counted in
+    `connections`."""
+
+    protocol_version = "HTTP/1.1"
+    content_types = {"jpeg": "image/jpeg", "mpeg": "audio/mpeg", "mp4": "video/mp4"}
+    latency = 0.0
+    size = 256 * 1024
+    connections = 0
+    paths: List[str] = []
+
+    def setup(self):
+        super().setup()
+        type(self).connections += 1
+
+    def do_GET(self):
+        type(self).paths.append(self.path)
+        time.sleep(self.latency)
+        if self.path.startswith("/forbidden/"):
+            self.send_response(403)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        ext = self.path.split("?")[0].rsplit(".", 1)[-1]
+        self.send_response(200)
+        self.send_header("Content-Type", self.content_types.get(ext, "image/jpeg"))
+        self.send_header("Content-Length", str(self.size))
+        self.end_headers()
+        self.wfile.write(b"\0" * self.size)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients closing keep-alive connections early is expected
+        pass
+
+
+class MediaServer:
+    """Local HTTP server for media downloads, run in a background thread
+    while used as a context manager."""
+
+    def __init__(self, latency: float = 0.0, size: int = 256 * 1024):
+        handler = type(
+            "MediaHandler",
+            (MediaHandler,),
+            {"latency": latency, "size": size, "connections": 0, "paths": []},
+        )
+        self.server = QuietServer(("127.0.0.1", 0), handler)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--output-dir", type=str, required=True)
+    parser.add_argument("--hashtag", type=str, default="bench")
+    parser.add_argument("--gallery-share", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generator = PostGenerator(
+        hashtag=args.hashtag, gallery_share=args.gallery_share, seed=args.seed
+    )
+    file_path = Path(args.output_dir) / args.hashtag / "posts.json"
+    written = write_posts_json(file_path, generator.posts(args.posts))
+    print(f"Wrote {written} posts to {file_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -24,6 +24,7 @@ setup(
     install_requires=[
         "seaborn",
         "matplotlib",
+        "numpy",
         "TikTokApi",
         "requests",
         "yt_dlp",
@@ -31,6 +32,7 @@ setup(
         "msvc-runtime; os_name=='nt'",
     ],
     extras_require={
+        "analysis": ["numpy", "scipy"],
         "dev": [
             "pytest",
             "pytest-cov",
@@ -38,6 +40,7 @@ setup(
             "pytest-metadata",
             "black",
             "mypy",
+            "scipy",
         ]
     },
     classifiers=[
@@ -0,0 +1,68 @@
+import csv
+import math
+
+import pytest
+
+from tiktok_hashtag_analysis.storage import json_dump
+from .conftest import make_post
+
+pytest.importorskip("scipy")
+
+from tiktok_hashtag_analysis.associations import AssociationMatrix  # noqa: E402
+
+
+@pytest.fixture
+def matrix(tmp_path):
+    # Posts 2 and 3 were scraped for both watched hashtags
+    posts = {
+        "a": [
+            make_post(1, ["a", "x"]),
+            make_post(2, ["a", "B", "x"]),
+            make_post(3, ["a", "b"]),
+        ],
+        "b": [
+            make_post(2, ["a", "B", "x"]),
+            make_post(3, ["a", "b"]),
+            make_post(4, ["b", "y"]),
+        ],
+    }
+    for hashtag, hashtag_posts in posts.items():
+        (tmp_path / hashtag).mkdir()
+        json_dump(tmp_path / hashtag / "posts.json", hashtag_posts)
+    return AssociationMatrix.from_data_dir(tmp_path)
+
+
+def test_matrix_counts(matrix):
+    assert matrix.total_posts == 4
+    post_counts = dict(zip(matrix.vocabulary, matrix.post_counts))
+    assert post_counts == {"a": 3, "x": 2, "b": 3, "y": 1}
+
+    a, b = matrix.vocabulary.index("a"), matrix.vocabulary.index("b")
+    assert matrix.cooccurrences[a, b] == 2
+    assert matrix.cooccurrences[a, a] == 0
+
+
+def test_neighbours(matrix):
+    neighbours = matrix.neighbours("A", metric="count")
+    assert [n["neighbour"] for n in neighbours] == ["x", "b"]
+    assert neighbours[0]["count"] == 2
+    assert neighbours[0]["jaccard"] == pytest.approx(2 / 3)
+    assert neighbours[0]["lift"] == pytest.approx(2 * 4 / (3 * 2))
+    assert neighbours[0]["pmi"] == pytest.approx(math.log(8 / 6))
+
+    # `#y` only co-occurs with `#b`, and is the rarest hashtag
+    assert [n["neighbour"] for n in matrix.neighbours("b", k=1)] == ["y"]
+    assert matrix.neighbours("y", min_count=2) == []
+
+
+def test_export_csv(matrix, tmp_path):
+    file_path = tmp_path / "associations.csv"
+    matrix.export_csv(file_path, k=2, metric="lift")
+    with open(file_path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+
+    ranks = {(row["hashtag"], row["neighbour"]): int(row["rank"]) for row in rows}
+    assert ranks[("b", "y")] == 0
+    assert ("b", "x") not in ranks
+    assert max(ranks.values()) == 1
+    assert len(rows) == 7
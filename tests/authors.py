@@ -0,0 +1,129 @@
+import csv
+
+import pytest
+
+from tiktok_hashtag_analysis.authors import AuthorIndex
+from tiktok_hashtag_analysis.storage import open_store
+from .conftest import make_post
+
+
+def post(post_id, hashtags, author, plays=10):
+    data = make_post(post_id, hashtags, author=author, create_time=post_id)
+    data["stats"]["playCount"] = plays
+    return data
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    open_store(tmp_path / "a").merge(
+        [
+            post(1, ["a"], "alice", plays=100),
+            post(2, ["a", "b"], "bob"),
+            post(3, ["a"], "alice"),
+            post(4, ["a"], "carol", plays=500),
+        ]
+    )
+    open_store(tmp_path / "b", backend="jsonl").merge(
+        [post(2, ["a", "b"], "bob"), post(5, ["b"], "alice"), post(6, ["b"], "dave")]
+    )
+    open_store(tmp_path / "c").merge([post(7, ["c"], "bob"), post(8, ["c"], "alice")])
+    return tmp_path
+
+
+def test_top_authors(data_dir):
+    index = AuthorIndex(data_dir)
+    assert index.update() == ["a", "b", "c"]
+
+    top = index.top_authors("a")
+    assert [(row["author"], row["posts"]) for row in top] == [
+        ("alice", 2),
+        ("bob", 1),
+        ("carol", 1),
+    ]
+    assert top[0]["play_count"] == 110
+    assert top[0]["hashtags"] == 3
+
+    # Post 2 was scraped for both a and b, but is counted once
+    top = index.top_authors(number=2)
+    assert [(row["author"], row["posts"]) for row in top] == [("alice", 4), ("bob", 2)]
+    top = index.top_authors(number=1, by="play_count")
+    assert [(row["author"], row["play_count"]) for row in top] == [("carol", 500)]
+
+    with pytest.raises(KeyError):
+        index.top_authors("d")
+    with pytest.raises(ValueError):
+        index.top_authors(by="likes")
+
+
+def test_author(data_dir):
+    index = AuthorIndex(data_dir)
+    index.update()
+    assert index.author("bob") == {
+        "author": "bob",
+        "posts": 2,
+        "play_count": 20,
+        "digg_count": 4,
+        "comment_count": 2,
+        "share_count": 0,
+        "collect_count": 0,
+        "hashtags": {"a": 1, "b": 1, "c": 1},
+        "post_ids": ["7", "2"],
+    }
+    with pytest.raises(KeyError):
+        index.author("erin")
+
+
+def test_overlap(data_dir):
+    index = AuthorIndex(data_dir)
+    index.update()
+    assert index.shared_authors() == [
+        {"author": "alice", "hashtags": ["a", "b", "c"], "posts": 4},
+        {"author": "bob", "hashtags": ["a", "b", "c"], "posts": 2},
+    ]
+    assert index.shared_authors(["b", "c"], number=1) == [
+        {"author": "alice", "hashtags": ["b", "c"], "posts": 2}
+    ]
+    assert index.hashtag_overlap() == [
+        {"hashtag": "a", "other": "b", "shared_authors": 2, "jaccard": 0.5},
+        {"hashtag": "a", "other": "c", "shared_authors": 2, "jaccard": 2 / 3},
+        {"hashtag": "b", "other": "c", "shared_authors": 2, "jaccard": 2 / 3},
+    ]
+
+
+def test_index_updated_incrementally(data_dir):
+    AuthorIndex(data_dir).update()
+    assert (data_dir / "authors.npz").exists()
+
+    # Only hashtags whose posts changed are read again
+    open_store(data_dir / "b").merge([post(9, ["b"], "erin"), post(10, ["b"], "dave")])
+    index = AuthorIndex(data_dir)
+    assert index.update() == ["b"]
+    assert index.update() == []
+    assert index.author("dave")["hashtags"] == {"b": 2}
+    assert AuthorIndex(data_dir).author("erin")["posts"] == 1
+
+    (data_dir / "c" / "posts.json").unlink()
+    index = AuthorIndex(data_dir)
+    assert index.update() == []
+    assert index.hashtags == ["a", "b"]
+    assert index.author("bob")["post_ids"] == ["2"]
+
+
+def test_export_csv(data_dir, tmp_path):
+    index = AuthorIndex(data_dir)
+    index.update()
+    index.export_csv(tmp_path / "authors.csv", number=1)
+    with open(tmp_path / "authors.csv", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [(row["hashtag"], row["author"]) for row in rows] == [
+        ("", "alice"),
+        ("a", "alice"),
+        ("b", "alice"),
+        ("c", "alice"),
+    ]
+
+    index.export_shared_csv(tmp_path / "shared.csv", min_hashtags=3)
+    with open(tmp_path / "shared.csv", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["author"] for row in rows] == ["alice", "bob"]
+    assert rows[0]["hashtags"] == "a b c"
@@ -1,4 +1,12 @@
-from tiktok_hashtag_analysis.base import TikTokDownloader, load_hashtags_from_file
+import asyncio
+
+from tiktok_hashtag_analysis.base import (
+    TikTokDownloader,
+    _fetch_hashtags_concurrently,
+    load_hashtags_from_file,
+    json_load,
+)
+from .conftest import make_post
 
 
 def test_scrape(tmp_path, hashtags):
@@ -22,3 +30,81 @@ def test_load_hashtags_from_file(tmp_path, hashtags):
 
     loaded_hashtags = load_hashtags_from_file(file=file)
     assert loaded_hashtags == hashtags
+
+
+def test_concurrent_scrape(tmp_path, fake_api):
+    hashtags = [f"tag{i}" for i in range(6)]
+    fake_api.reset(
+        posts={
+            hashtag: [
+                make_post(f"{hashtag}_{j}", [hashtag, "shared"]) for j in range(5)
+            ]
+            for hashtag in hashtags
+        },
+        failures={"tag3": 1},
+    )
+    downloader = TikTokDownloader(
+        hashtags=hashtags, data_dir=tmp_path, api_factory=fake_api
+    )
+    failed = downloader.get_hashtags_posts_concurrently(
+        hashtags=downloader.hashtags, limit=3, headed=False, sessions=2, retries=2
+    )
+
+    assert failed == []
+    assert fake_api.instances == 1
+    assert fake_api.sessions_created == 2
+    assert fake_api.peak_active == 2
+    assert {session for _, session in fake_api.calls} == {0, 1}
+    for hashtag in hashtags:
+        posts = json_load(tmp_path / hashtag / "posts.json")
+        assert [post["id"] for post in posts] == [f"{hashtag}_{j}" for j in range(3)]
+
+
+def test_concurrent_scrape_gives_up(tmp_path, fake_api):
+    fake_api.reset(posts={"good": [make_post(1, ["good"])]}, failures={"bad": 10})
+    downloader = TikTokDownloader(
+        hashtags=["good", "bad"], data_dir=tmp_path, api_factory=fake_api
+    )
+    failed = downloader.get_hashtags_posts_concurrently(
+        hashtags=downloader.hashtags, limit=3, headed=True, sessions=2, retries=2
+    )
+
+    assert failed == ["bad"]
+    assert (tmp_path / "good" / "posts.json").is_file()
+    assert not (tmp_path / "bad" / "posts.json").exists()
+
+
+def test_concurrent_scrape_reads_known_ids_per_session(fake_api):
+    hashtags = ["a", "b", "c"]
+    fake_api.reset(posts={hashtag: [make_post(1, [hashtag])] for hashtag in hashtags})
+    # Number of fetches started before each hashtag's known posts are read
+    fetches_before = []
+
+    def known_ids(hashtag):
+        fetches_before.append(len(fake_api.calls))
+        return set()
+
+    results, failed = asyncio.run(
+        _fetch_hashtags_concurrently(
+            hashtags=hashtags,
+            limit=3,
+            num_sessions=1,
+            on_batch=lambda hashtag, batch: None,
+            api_factory=fake_api,
+            known_ids=known_ids,
+        )
+    )
+    assert (results, failed) == ({}, [])
+    assert fetches_before == [0, 1, 2]
+
+
+def test_fetch_with_api_factory(tmp_path, fake_api):
+    fake_api.reset(posts={"a": [make_post(i, ["a", "b"]) for i in range(5)]})
+    downloader = TikTokDownloader(
+        hashtags=["a"], data_dir=tmp_path, api_factory=fake_api
+    )
+    downloader.get_hashtag_posts(hashtag="a", limit=3, headed=False)
+
+    assert fake_api.instances == 1
+    posts = json_load(tmp_path / "a" / "posts.json")
+    assert [post["id"] for post in posts] == ["0", "1", "2"]
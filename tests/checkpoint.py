@@ -0,0 +1,151 @@
+import os
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+from tiktok_hashtag_analysis.base import TikTokDownloader, json_load
+from tiktok_hashtag_analysis.checkpoint import ScrapeCheckpoints, PendingPosts
+from tiktok_hashtag_analysis.storage import open_store
+from .conftest import make_post
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def feed(number):
+    return [make_post(i, ["a", "b"]) for i in range(number)]
+
+
+def test_posts_are_saved_in_batches(tmp_path, fake_api):
+    fake_api.reset(posts={"a": feed(60)})
+    downloader = TikTokDownloader(
+        hashtags=["a"],
+        data_dir=tmp_path,
+        api_factory=fake_api,
+        batch_size=25,
+        store="jsonl",
+    )
+    downloader.get_hashtag_posts("a", limit=100, headed=False)
+    assert len(open_store(tmp_path / "a").load()) == 60
+    assert downloader.metrics.stages["merge"].items == 3
+    assert downloader.checkpoints.checkpoints == {}
+
+
+def test_json_store_is_written_once_per_scrape(tmp_path, fake_api, monkeypatch):
+    downloader = TikTokDownloader(
+        hashtags=["a"], data_dir=tmp_path, api_factory=fake_api, batch_size=25
+    )
+    fake_api.reset(posts={"a": feed(10)})
+    downloader.get_hashtag_posts("a", limit=100, headed=False)
+
+    # Count the files in the hashtag's folder that are written by replacing
+    # them, i.e. the store and its caches
+    replace = os.replace
+    rewrites: Counter = Counter()
+
+    def counting_replace(src, dst):
+        if Path(dst).parent == tmp_path / "a":
+            rewrites[Path(dst).name] += 1
+        replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", counting_replace)
+    fake_api.reset(posts={"a": feed(60)})
+    downloader.get_hashtag_posts("a", limit=100, headed=False)
+    assert rewrites["posts.json"] == 1
+    assert set(rewrites.values()) == {1}
+    assert len(json_load(tmp_path / "a" / "posts.json")) == 60
+    assert not PendingPosts(tmp_path / "a").exists()
+
+
+def test_failed_scrape_resumes(tmp_path, fake_api):
+    fake_api.reset(posts={"a": feed(60)}, fail_after={"a": 40})
+    downloader = TikTokDownloader(
+        hashtags=["a"], data_dir=tmp_path, api_factory=fake_api, batch_size=25
+    )
+    downloader.get_hashtag_posts("a", limit=100, headed=False)
+
+    # The retry only fetches the posts after the first saved batch
+    assert len(fake_api.calls) == 2
+    assert downloader.metrics.stages["fetch"].posts == 60
+    assert len(json_load(tmp_path / "a" / "posts.json")) == 60
+    assert downloader.checkpoints.checkpoints == {}
+
+
+def test_concurrent_scrape_resumes(tmp_path, fake_api):
+    fake_api.reset(posts={"a": feed(60)}, fail_after={"a": 40})
+    downloader = TikTokDownloader(
+        hashtags=["a"], data_dir=tmp_path, api_factory=fake_api, batch_size=25
+    )
+    failed = downloader.get_hashtags_posts_concurrently(
+        ["a"], limit=100, headed=False, sessions=1
+    )
+
+    assert failed == []
+    assert len(fake_api.calls) == 2
+    assert downloader.metrics.stages["fetch"].posts == 60
+    assert len(json_load(tmp_path / "a" / "posts.json")) == 60
+    assert downloader.checkpoints.checkpoints == {}
+
+
+def test_crashed_scrape_resumes_in_next_run(tmp_path, fake_api):
+    # The first attempt fails right away, and the retry fails after saving
+    # the first batch
+    fake_api.reset(posts={"a": feed(60)}, failures={"a": 1}, fail_after={"a": 40})
+    downloader = TikTokDownloader(
+        hashtags=["a"], data_dir=tmp_path, api_factory=fake_api, batch_size=25
+    )
+    with pytest.raises(RuntimeError):
+        downloader.get_hashtag_posts("a", limit=100, headed=False)
+    # The saved batch is kept until the scrape finishes
+    assert not (tmp_path / "a" / "posts.json").exists()
+    assert len(PendingPosts(tmp_path / "a").load()) == 25
+
+    # The progress is saved in the data directory
+    fake_api.reset(posts={"a": feed(60)})
+    downloader = TikTokDownloader(
+        hashtags=["a"], data_dir=tmp_path, api_factory=fake_api, batch_size=25
+    )
+    assert downloader.checkpoints.cursor("a", limit=100) == 25
+    downloader.get_hashtag_posts("a", limit=100, headed=False)
+    assert downloader.metrics.stages["fetch"].posts == 35
+    assert len(json_load(tmp_path / "a" / "posts.json")) == 60
+    assert not PendingPosts(tmp_path / "a").exists()
+
+
+def test_checkpoint_expires(tmp_path):
+    clock = Clock()
+    checkpoints = ScrapeCheckpoints(
+        state_file=tmp_path / "checkpoints.json", max_age=60, clock=clock
+    )
+    checkpoints.advance("a", cursor=30, limit=100)
+    assert checkpoints.cursor("a", limit=100) == 30
+
+    # Scrapes of a different number of posts start from the beginning
+    assert checkpoints.cursor("a", limit=200) == 0
+    assert checkpoints.cursor("b", limit=100) == 0
+
+    clock.now += 60
+    assert checkpoints.cursor("a", limit=100) == 0
+
+    checkpoints.clear("a")
+    assert ScrapeCheckpoints(state_file=tmp_path / "checkpoints.json").checkpoints == {}
+
+
+def test_checkpoints_shared_by_workers(tmp_path):
+    state_file = tmp_path / "checkpoints.json"
+    worker_a = ScrapeCheckpoints(state_file=state_file)
+    worker_b = ScrapeCheckpoints(state_file=state_file)
+    worker_a.advance("a", cursor=30, limit=100)
+    worker_b.advance("b", cursor=30, limit=100)
+    worker_a.clear("a")
+
+    # Checkpoints cleared by another worker aren't saved again
+    worker_b.advance("b", cursor=60, limit=100)
+    assert list(ScrapeCheckpoints(state_file=state_file).checkpoints) == ["b"]
+    assert [path.name for path in tmp_path.iterdir()] == ["checkpoints.json"]
@@ -1,9 +1,13 @@
 import os
+import sys
+import subprocess
 from pathlib import Path
 
 import pytest
 
+from tiktok_hashtag_analysis import cli
 from tiktok_hashtag_analysis.cli import (
+    main,
     create_parser,
     process_output_dir,
     DEFAULT_OUTPUT_DIR,
@@ -25,6 +29,48 @@ PARSER_ARGUMENTS = [
     ("output_dir", "/tmp/tiktok_download", "--output-dir"),
     ("config", "~/.tiktok", "--config"),
     ("log", "../logfile.log", "--log"),
+    ("sessions", 4, "--sessions"),
+    ("retries", 5, "--retries"),
+    ("download_workers", 8, "--download-workers"),
+    ("rate_limit", 2.5, "--rate-limit"),
+    ("store", "jsonl", "--store"),
+    ("compact", True, "--compact"),
+    ("database", True, "--database"),
+    ("import_database", True, "--import-database"),
+    ("associations", True, "--associations"),
+    ("association_metric", "jaccard", "--association-metric"),
+    ("min_cooccurrences", 2, "--min-cooccurrences"),
+    ("trends", True, "--trends"),
+    ("trend_bucket", "hour", "--trend-bucket"),
+    ("trend_window", 24, "--trend-window"),
+    ("plot_workers", 4, "--plot-workers"),
+    ("plot_dpi", 100, "--plot-dpi"),
+    ("plot_format", "svg", "--plot-format"),
+    ("watch", True, "--watch"),
+    ("min_interval", 5.0, "--min-interval"),
+    ("max_interval", 120.0, "--max-interval"),
+    ("shared_media", True, "--shared-media"),
+    ("verify_media", True, "--verify-media"),
+    ("metrics", "metrics.prom", "--metrics"),
+    ("profile", True, "--profile"),
+    ("stop_after_known", 20, "--stop-after-known"),
+    ("full_refresh", 24.0, "--full-refresh"),
+    ("worker", True, "--worker"),
+    ("lease_ttl", 5.0, "--lease-ttl"),
+    ("batch_size", 100, "--batch-size"),
+    ("crawl", True, "--crawl"),
+    ("crawl_depth", 3, "--crawl-depth"),
+    ("crawl_hashtags", 200, "--crawl-hashtags"),
+    ("crawl_posts", 50000, "--crawl-posts"),
+    ("crawl_expand", 5, "--crawl-expand"),
+    ("serve", True, "--serve"),
+    ("host", "0.0.0.0", "--host"),
+    ("port", 8080, "--port"),
+    ("duplicates", True, "--duplicates"),
+    ("duplicate_threshold", 0.5, "--duplicate-threshold"),
+    ("duplicate_authors", 3, "--duplicate-authors"),
+    ("authors", True, "--authors"),
+    ("author_metric", "play_count", "--author-metric"),
 ]
 
 
@@ -42,6 +88,51 @@ def test_parser(hashtags, attribute, value, flag):
     assert args.get("hashtags") == hashtags
 
 
+@pytest.mark.parametrize("mode", ["--watch", "--crawl"])
+@pytest.mark.parametrize("flag", ["--download", "--plot", "--table", "--trends"])
+def test_modes_reject_analyses(monkeypatch, tmp_path, capsys, mode, flag):
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["tiktok-hashtag-analysis", "a", mode, flag, "--output-dir", str(tmp_path)],
+    )
+    with pytest.raises(SystemExit):
+        main()
+    assert f"`{flag}` can't be used with `{mode}`" in capsys.readouterr().err
+
+
+def test_trend_window_must_be_positive(monkeypatch, capsys):
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["tiktok-hashtag-analysis", "a", "--trends", "--trend-window", "0"],
+    )
+    with pytest.raises(SystemExit):
+        main()
+    assert "`--trend-window` flag must be a positive integer" in capsys.readouterr().err
+
+
+def test_serve_after_analyses(monkeypatch, tmp_path):
+    served = []
+    monkeypatch.setattr(
+        cli, "serve", lambda data_dir, host, port: served.append(data_dir)
+    )
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        [
+            "tiktok-hashtag-analysis",
+            "--import-database",
+            "--serve",
+            "--output-dir",
+            str(tmp_path),
+        ],
+    )
+    main()
+    assert served == [tmp_path]
+    assert (tmp_path / "posts.sqlite").is_file()
+
+
 def test_output_dir_unspec_nowrite(monkeypatch, tmp_path):
     # Unspecified, in current directory without write permissions
     parser = create_parser()
@@ -74,3 +165,16 @@ def test_output_dir_unspec_write(monkeypatch, tmp_path):
     result = process_output_dir(specified_output_dir=None, parser=parser)
     monkeypatch.chdir(cwd)
     assert result == DEFAULT_OUTPUT_DIR
+
+
+def test_cli_imports_no_backends():
+    # Slow-to-import backends are only imported by the modes that use them
+    code = (
+        "import sys, tiktok_hashtag_analysis.cli; "
+        "print(*[m for m in ['matplotlib', 'seaborn', 'scipy', 'TikTokApi', "
+        "'playwright', 'yt_dlp'] if m in sys.modules])"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.strip() == ""
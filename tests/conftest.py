@@ -1,11 +1,76 @@
 import os
 import tempfile
+import threading
+from http.server import ThreadingHTTPServer
 
 import pytest
 
+from benchmarks import synthetic
+from benchmarks.synthetic import FakeTikTokApi
+
 TEST_HASHTAGS = ["embraceeuropa", "francisparkeryockey"]
 
 
 @pytest.fixture(scope="package")
 def hashtags():
     return TEST_HASHTAGS
+
+
+def make_post(post_id, hashtags, author="user", create_time=1700000000):
+    """Build a minimal raw TikTok post API response."""
+    return {
+        "id": str(post_id),
+        "desc": " ".join(f"#{hashtag}" for hashtag in hashtags),
+        "createTime": create_time,
+        "author": {"uniqueId": author},
+        "stats": {"playCount": 10, "diggCount": 2, "commentCount": 1, "shareCount": 0},
+        "music": {"playUrl": ""},
+        "textExtra": [{"hashtagName": hashtag} for hashtag in hashtags],
+    }
+
+
+class FakeApiFactory:
+    """`api_factory` for `TikTokDownloader` that serves canned posts with a
+    `FakeTikTokApi` without a browser. Every instance it creates is the same
+    `FakeTikTokApi`, whose attributes tests can configure and inspect
+    through the factory."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, posts=None, failures=None, fail_after=None):
+        self.api = FakeTikTokApi(
+            posts=posts, latency=0.01, failures=failures, fail_after=fail_after
+        )
+        self.instances = 0
+
+    def __call__(self):
+        self.instances += 1
+        return self.api
+
+    def __getattr__(self, name):
+        return getattr(self.api, name)
+
+
+@pytest.fixture
+def fake_api():
+    return FakeApiFactory()
+
+
+class MediaHandler(synthetic.MediaHandler):
+    size = 2048
+
+
+MEDIA_SIZE = MediaHandler.size
+
+
+@pytest.fixture
+def media_server():
+    MediaHandler.connections = 0
+    MediaHandler.paths = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MediaHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
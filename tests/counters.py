@@ -0,0 +1,115 @@
+import pytest
+
+from tiktok_hashtag_analysis.base import (
+    TikTokDownloader,
+    aggregate_cooccurring_hashtags,
+)
+from tiktok_hashtag_analysis import counters
+from tiktok_hashtag_analysis.counters import CooccurrenceCounter
+from tiktok_hashtag_analysis.snapshot import PostSnapshot
+from tiktok_hashtag_analysis.storage import JsonLinesPostStore, JsonPostStore
+from .conftest import make_post
+
+
+def no_rebuilds(monkeypatch):
+    def fail(self):
+        raise AssertionError("Counts were recomputed from all posts")
+
+    monkeypatch.setattr(CooccurrenceCounter, "rebuild", fail)
+
+
+@pytest.mark.parametrize("store", ["json", "jsonl"])
+def test_counts_updated_after_scrape(tmp_path, monkeypatch, store):
+    downloader = TikTokDownloader(hashtags=["a"], data_dir=tmp_path, store=store)
+    downloader.save_hashtag_posts("a", [make_post(i, ["a", "b"]) for i in range(3)])
+    assert downloader.cooccurrences("a") == {"a": 3, "b": 3}
+
+    # Post 2 is scraped again without `#b`, and post 3 is new
+    no_rebuilds(monkeypatch)
+    downloader.save_hashtag_posts("a", [make_post(2, ["a"]), make_post(3, ["a", "c"])])
+    assert downloader.cooccurrences("a") == {"a": 4, "b": 2, "c": 1}
+
+    monkeypatch.undo()
+    assert downloader.cooccurrences("a") == aggregate_cooccurring_hashtags(
+        tmp_path / "a" / "posts.json"
+    )
+
+
+def test_post_hashtags_are_appended_to_log(tmp_path, monkeypatch):
+    downloader = TikTokDownloader(hashtags=["a"], data_dir=tmp_path)
+    downloader.save_hashtag_posts("a", [make_post(i, ["a", "b"]) for i in range(20)])
+    downloader.cooccurrences("a")
+
+    # Count the times the map of each post's hashtags is rewritten
+    rewrites = []
+    write_json = counters.write_json
+
+    def counting_write_json(file_path, data, **kwargs):
+        rewrites.append(file_path.name)
+        write_json(file_path, data, **kwargs)
+
+    monkeypatch.setattr(counters, "write_json", counting_write_json)
+    no_rebuilds(monkeypatch)
+
+    # Updated posts are appended to the log rather than rewriting the map
+    downloader.save_hashtag_posts("a", [make_post(2, ["a"]), make_post(20, ["c"])])
+    assert "cooccurrence_posts.json" not in rewrites
+    log = (tmp_path / "a" / "cooccurrence_posts.jsonl").read_text()
+    assert len(log.splitlines()) == 2
+    assert downloader.cooccurrences("a") == {"a": 20, "b": 19, "c": 1}
+
+    # The map is rewritten once the log grows larger than it
+    for i in range(21, 40):
+        downloader.save_hashtag_posts("a", [make_post(i, ["d"])])
+    assert 0 < rewrites.count("cooccurrence_posts.json") < 19
+    assert downloader.cooccurrences("a") == {"a": 20, "b": 19, "c": 1, "d": 19}
+    monkeypatch.undo()
+    counter = CooccurrenceCounter(downloader.get_store("a"))
+    assert downloader.cooccurrences("a") == counter.rebuild()
+
+
+def test_counts_cached_until_store_changes(tmp_path, monkeypatch):
+    store = JsonPostStore(tmp_path)
+    store.merge([make_post(1, ["a", "b"])])
+    assert CooccurrenceCounter(store).counts() == {"a": 1, "b": 1}
+
+    with monkeypatch.context() as m:
+        no_rebuilds(m)
+        assert CooccurrenceCounter(store).counts() == {"a": 1, "b": 1}
+
+    # Changes made without updating the cache are picked up
+    store.merge([make_post(2, ["a", "c"])])
+    assert CooccurrenceCounter(store).counts() == {"a": 2, "b": 1, "c": 1}
+
+
+def test_counts_read_appended_posts(tmp_path, monkeypatch):
+    store = JsonLinesPostStore(tmp_path)
+    store.merge([make_post(1, ["a", "b"]), make_post(2, ["a"])])
+    CooccurrenceCounter(store).counts()
+    store.merge([make_post(1, ["a"]), make_post(3, ["a", "c"])])
+
+    with monkeypatch.context() as m:
+        no_rebuilds(m)
+        assert CooccurrenceCounter(store).counts() == {"a": 3, "c": 1}
+
+    # Compaction rewrites the index, so the counts are recomputed
+    store.compact()
+    store.merge([make_post(4, ["d"])])
+    assert CooccurrenceCounter(store).counts() == {"a": 3, "c": 1, "d": 1}
+
+
+def test_merge_during_rebuild_outdates_counts(tmp_path, monkeypatch):
+    store = JsonPostStore(tmp_path)
+    store.merge([make_post(1, ["a"])])
+    columns = PostSnapshot.columns
+
+    # Another process merges a post while the counts are being computed
+    def merge_while_reading(self, save=True):
+        result = columns(self, save=save)
+        monkeypatch.setattr(PostSnapshot, "columns", columns)
+        JsonPostStore(tmp_path).merge([make_post(2, ["b"])])
+        return result
+
+    monkeypatch.setattr(PostSnapshot, "columns", merge_while_reading)
+    assert CooccurrenceCounter(store).rebuild() == {"a": 1}
+    assert CooccurrenceCounter(store).counts() == {"a": 1, "b": 1}
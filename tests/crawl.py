@@ -0,0 +1,129 @@
+from collections import Counter
+
+from tiktok_hashtag_analysis.base import TikTokDownloader, load_hashtags_from_file
+from tiktok_hashtag_analysis.crawl import CrawlFrontier
+from .conftest import make_post
+
+
+def test_frontier_order(tmp_path):
+    frontier = CrawlFrontier(seeds=["a"], max_depth=2, expand=2, min_cooccurrences=2)
+    assert frontier.pop() == ("a", 0)
+    assert frontier.pop() is None
+
+    # Only the most often co-occurring hashtags are followed
+    frontier.record(
+        "a",
+        fetched=10,
+        cooccurrences=Counter({"a": 10, "B": 3, "c": 5, "d": 2, "e": 1}),
+    )
+    assert len(frontier) == 2
+    assert frontier.pop() == ("c", 1)
+
+    # Hashtags that co-occur with several crawled hashtags are crawled first,
+    # but deeper hashtags are crawled after shallower ones
+    frontier.record("c", fetched=5, cooccurrences=Counter({"c": 5, "d": 4, "f": 3}))
+    assert frontier.nodes["d"].priority == 4
+    assert frontier.pop() == ("b", 1)
+    frontier.record("b", fetched=3, cooccurrences=Counter({"b": 3, "f": 2, "a": 3}))
+    assert frontier.nodes["f"].priority == 5
+    assert [frontier.pop()[0] for _ in range(2)] == ["f", "d"]
+
+    # Hashtags at the maximum depth aren't expanded
+    frontier.record("f", fetched=5, cooccurrences=Counter({"f": 5, "g": 5}))
+    frontier.record_failure("d")
+    assert frontier.pop() is None
+    assert frontier.posts == 23
+    assert frontier.crawled() == ["a", "c", "b", "f"]
+
+
+def test_frontier_budget(tmp_path):
+    frontier = CrawlFrontier(seeds=["a", "b", "c"], max_hashtags=2)
+    assert frontier.pop() == ("a", 0)
+    assert frontier.pop() == ("b", 0)
+    assert frontier.pop() is None
+    assert frontier.ready() is False
+
+    frontier = CrawlFrontier(seeds=["a", "b", "c"], max_posts=10)
+    frontier.pop()
+    frontier.record("a", fetched=10, cooccurrences=Counter())
+    assert frontier.pop() is None
+
+
+def test_frontier_resumes(tmp_path):
+    state_file = tmp_path / "crawl.json"
+    frontier = CrawlFrontier(seeds=["a"], state_file=state_file)
+    frontier.pop()
+    frontier.record("a", fetched=2, cooccurrences=Counter({"a": 2, "b": 2, "c": 1}))
+    frontier.pop()
+    frontier.save()
+
+    # Hashtags that were being crawled are crawled again, and crawled
+    # hashtags aren't
+    frontier = CrawlFrontier(seeds=["a"], state_file=state_file)
+    assert frontier.posts == 2
+    assert [frontier.pop(), frontier.pop(), frontier.pop()] == [
+        ("b", 1),
+        ("c", 1),
+        None,
+    ]
+
+
+def test_crawl(tmp_path, fake_api):
+    fake_api.reset(
+        posts={
+            "a": [make_post(i, ["a", "b"]) for i in range(3)]
+            + [make_post(3, ["a", "c"])],
+            "b": [make_post(i, ["b", "d"]) for i in range(10, 12)],
+            "c": [make_post(20, ["c"])],
+            "d": [make_post(30, ["d", "e"])],
+        }
+    )
+    downloader = TikTokDownloader(
+        hashtags=["a"], data_dir=tmp_path, api_factory=fake_api
+    )
+    crawled = downloader.crawl(limit=10, headed=False, sessions=2, max_depth=2)
+    assert crawled == ["a", "b", "c", "d"]
+    assert sorted(name for name, _ in fake_api.calls) == ["a", "b", "c", "d"]
+    assert fake_api.instances == 1
+    assert load_hashtags_from_file(str(tmp_path / "crawl_hashtags.txt")) == crawled
+    assert (tmp_path / "d" / "posts.json").exists()
+
+    # Crawling again with a larger budget continues the crawl
+    crawled = downloader.crawl(limit=10, headed=False, sessions=2, max_depth=3)
+    assert crawled == ["a", "b", "c", "d", "e"]
+    assert sorted(name for name, _ in fake_api.calls) == ["a", "b", "c", "d", "e"]
+
+
+def test_crawl_failures(tmp_path, fake_api):
+    fake_api.reset(
+        posts={"a": [make_post(1, ["a", "b"])], "b": [make_post(2, ["b"])]},
+        failures={"b": 2},
+    )
+    downloader = TikTokDownloader(
+        hashtags=["a"], data_dir=tmp_path, api_factory=fake_api
+    )
+    crawled = downloader.crawl(limit=10, headed=False, retries=2)
+    assert crawled == ["a"]
+    assert downloader.metrics.retries() == {"fetch": 1}
+
+
+def test_crawl_survives_save_errors(tmp_path, fake_api):
+    fake_api.reset(
+        posts={
+            "a": [make_post(1, ["a", "b", "c"])],
+            "b": [make_post(2, ["b"])],
+            "c": [make_post(3, ["c"])],
+        }
+    )
+    downloader = TikTokDownloader(
+        hashtags=["a"], data_dir=tmp_path, api_factory=fake_api
+    )
+    finish_scrape = downloader.finish_scrape
+
+    def save_failing(hashtag, fetched, counts):
+        if hashtag == "b":
+            raise OSError("disk full")
+        return finish_scrape(hashtag=hashtag, fetched=fetched, counts=counts)
+
+    downloader.finish_scrape = save_failing
+    assert downloader.crawl(limit=10, headed=False, sessions=2) == ["a", "c"]
@@ -0,0 +1,38 @@
+from tiktok_hashtag_analysis.base import TikTokDownloader
+from tiktok_hashtag_analysis.database import PostDatabase
+from tiktok_hashtag_analysis.storage import json_dump
+from .conftest import make_post
+
+
+def test_import_data_dir(tmp_path):
+    # Post 2 was scraped for both watched hashtags
+    posts = {
+        "a": [make_post(1, ["a"], "x", 100), make_post(2, ["a", "B"], "y", 200)],
+        "b": [make_post(2, ["a", "B"], "y", 200), make_post(3, ["b"], "y", 300)],
+    }
+    for hashtag, hashtag_posts in posts.items():
+        (tmp_path / hashtag).mkdir()
+        json_dump(tmp_path / hashtag / "posts.json", hashtag_posts)
+
+    with PostDatabase(tmp_path / "posts.sqlite") as database:
+        assert database.import_data_dir(tmp_path) == {"a": 2, "b": 2}
+        assert database.count_posts() == 3
+        assert database.count_posts(hashtag="b") == 2
+        assert database.post_ids_with_hashtags(["a", "b"]) == ["2"]
+        assert database.posts_with_hashtags(["b"]) == [posts["b"][1], posts["b"][0]]
+        assert [post["id"] for post in database.posts_by_author("y")] == ["3", "2"]
+        assert database.cooccurring_hashtags("a") == {"a": 2, "b": 1}
+
+
+def test_downloader_writes_database(tmp_path, fake_api):
+    fake_api.reset(posts={"a": [make_post(1, ["a", "c"]), make_post(2, ["a"])]})
+    downloader = TikTokDownloader(
+        hashtags=["a"],
+        data_dir=tmp_path,
+        api_factory=fake_api,
+        database=tmp_path / "posts.sqlite",
+    )
+    downloader.get_hashtags_posts_concurrently(
+        hashtags=["a"], limit=10, headed=True, sessions=1
+    )
+    assert downloader.database.cooccurring_hashtags("a") == {"a": 2, "c": 1}
@@ -0,0 +1,107 @@
+import sys
+import subprocess
+
+import pytest
+
+from tiktok_hashtag_analysis.dataset import Dataset
+from tiktok_hashtag_analysis.storage import open_store
+from .conftest import make_post
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    open_store(tmp_path / "a").merge(
+        [make_post(1, ["a", "b"]), make_post(2, ["a", "b", "c"]), make_post(3, ["a"])]
+    )
+    open_store(tmp_path / "c", backend="jsonl").merge(
+        [make_post(2, ["a", "b", "c"]), make_post(4, ["c", "d"])]
+    )
+    return tmp_path
+
+
+def test_queries(data_dir):
+    dataset = Dataset(data_dir)
+    assert dataset.hashtags() == ["a", "c"]
+    assert "a" in dataset and "b" not in dataset
+    assert dataset.post_count("a") == 3
+    assert dataset.cooccurrences("a") == {"a": 3, "b": 2, "c": 1}
+    assert dataset.top_cooccurring("a", number=2) == [("a", 3), ("b", 2)]
+    assert [post["id"] for post in dataset.posts("c", fields=["id"])] == ["2", "4"]
+    assert [row["hashtag"] for row in dataset.emerging("a", number=5)] == ["b", "c"]
+    with pytest.raises(KeyError):
+        dataset.top_cooccurring("b")
+    with pytest.raises(ValueError):
+        dataset.top_posts("a", by="likes")
+
+
+def test_top_posts(tmp_path):
+    posts = [make_post(i, ["a"], author=f"user{i}") for i in range(3)]
+    for i, post in enumerate(posts):
+        post["stats"]["playCount"] = [5, 20, 10][i]
+    open_store(tmp_path / "a").merge(posts)
+    top = Dataset(tmp_path).top_posts("a", number=2)
+    assert [(post["id"], post["play_count"]) for post in top] == [("1", 20), ("2", 10)]
+    assert top[0]["author"] == "user1"
+
+
+def test_results_are_memoized(data_dir):
+    dataset = Dataset(data_dir)
+    top = dataset.top_cooccurring("a")
+    assert dataset.top_cooccurring("a") is top
+    assert dataset.cache_info()["misses"] == 1
+    assert dataset.cache_info()["hits"] == 1
+
+    # Cached counts can't be changed by callers
+    dataset.cooccurrences("a")["a"] = 100
+    assert dataset.cooccurrences("a")["a"] == 3
+
+
+def test_cache_invalidated_when_posts_change(data_dir):
+    dataset = Dataset(data_dir)
+    assert dataset.post_count("c") == 2
+    open_store(data_dir / "c").merge([make_post(5, ["c", "e"])])
+    assert dataset.post_count("c") == 3
+    assert dataset.cooccurrences("c")["e"] == 1
+    assert dataset.cache_info()["invalidations"] == 1
+
+
+def test_least_recently_used_evicted(data_dir):
+    dataset = Dataset(data_dir, cache_size=1)
+    dataset.post_count("a")
+    dataset.post_count("c")
+    dataset.post_count("c")
+    dataset.post_count("a")
+    info = dataset.cache_info()
+    assert (info["misses"], info["hits"], info["size"]) == (3, 1, 1)
+
+
+def test_batch_queries(data_dir):
+    dataset = Dataset(data_dir)
+    assert dataset.post_counts() == {"a": 3, "c": 2}
+    assert dataset.top_cooccurring_many(number=1) == {
+        "a": [("a", 3)],
+        "c": [("c", 2)],
+    }
+    # Post 2 was scraped for both hashtags, but is counted once
+    assert dataset.combined_cooccurrences() == {"a": 3, "b": 2, "c": 2, "d": 1}
+
+
+def test_read_only(data_dir):
+    dataset = Dataset(data_dir)
+    assert dataset.post_count("a") == 3
+    assert not (data_dir / "a" / "snapshot.npz").exists()
+
+    Dataset(data_dir, save_snapshots=True).post_count("a")
+    assert (data_dir / "a" / "snapshot.npz").exists()
+
+
+def test_dataset_imports_no_scraping_stack():
+    code = (
+        "import sys, tiktok_hashtag_analysis.dataset; "
+        "print(*[m for m in ['tiktok_hashtag_analysis.base', 'TikTokApi', "
+        "'playwright', 'yt_dlp', 'requests', 'tenacity'] if m in sys.modules])"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.strip() == ""
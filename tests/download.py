@@ -0,0 +1,77 @@
+import time
+
+from tiktok_hashtag_analysis.download import (
+    DownloadEngine,
+    DownloadJob,
+    HostRateLimiter,
+    download_file_and_save,
+    gallery_jobs,
+)
+from .conftest import MEDIA_SIZE, MediaHandler
+
+
+def make_gallery(post_id, base_url, images=3):
+    return {
+        "id": post_id,
+        "music": {"playUrl": f"{base_url}/audio/{post_id}.mpeg"},
+        "imagePost": {
+            "images": [
+                {"imageURL": {"urlList": [f"{base_url}/image/{post_id}_{i}.jpeg"]}}
+                for i in range(images)
+            ]
+        },
+    }
+
+
+def test_gallery_jobs(tmp_path):
+    jobs = gallery_jobs(make_gallery("1", "http://host", images=2), tmp_path)
+    assert [job.path.name for job in jobs] == ["1", "1_00", "1_01"]
+    assert all(job.kind == "file" for job in jobs)
+
+
+def test_download_engine(tmp_path, media_server):
+    jobs = []
+    for i in range(5):
+        jobs.extend(gallery_jobs(make_gallery(str(i), media_server), tmp_path))
+    jobs.append(
+        DownloadJob(url=f"{media_server}/forbidden/x.jpeg", path=tmp_path / "x")
+    )
+    jobs.append(
+        DownloadJob(url=f"{media_server}/video/123.mp4", path=tmp_path, kind="video")
+    )
+
+    progress = DownloadEngine(workers=4).run(jobs)
+
+    # Forbidden media is reported as a failure
+    assert progress.completed == len(jobs)
+    assert progress.failed == 1
+    assert progress.bytes == MEDIA_SIZE * (len(jobs) - 1)
+    assert len(list(tmp_path.glob("*.jpeg"))) == 15
+    assert len(list(tmp_path.glob("*.mpeg"))) == 5
+    assert (tmp_path / "123.mp4").stat().st_size == MEDIA_SIZE
+
+
+def test_host_rate_limiter():
+    limiter = HostRateLimiter(rate=50)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.wait("a")
+    limiter.wait("b")
+    assert time.monotonic() - start >= 5 / 50
+
+
+def test_download_file_and_save(tmp_path, media_server):
+    for i in range(5):
+        nbytes = download_file_and_save(
+            f"{media_server}/image/{i}.jpeg", tmp_path / str(i)
+        )
+        assert nbytes == MEDIA_SIZE
+    assert (
+        download_file_and_save(f"{media_server}/forbidden/x.jpeg", tmp_path / "x") == 0
+    )
+
+    # Connections are reused, and no partially written files are left behind
+    assert MediaHandler.connections == 1
+    assert sorted(file.name for file in tmp_path.iterdir()) == [
+        f"{i}.jpeg" for i in range(5)
+    ]
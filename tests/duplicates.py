@@ -0,0 +1,124 @@
+import csv
+
+import numpy as np
+
+from tiktok_hashtag_analysis.duplicates import (
+    CaptionIndex,
+    band_rows,
+    minhash_signatures,
+    normalize_caption,
+)
+from tiktok_hashtag_analysis.storage import open_store
+from .conftest import make_post
+
+CAMPAIGN = "Vote for the new park, it will change our neighbourhood for the better"
+
+
+def captioned(post_id, hashtags, caption, author="user"):
+    post = make_post(post_id, hashtags, author=author)
+    post["desc"] = caption
+    return post
+
+
+def test_normalize_caption():
+    assert normalize_caption("Hello,   WORLD! #fyp @someone https://t.co/x") == (
+        "hello world"
+    )
+
+
+def test_signatures_estimate_similarity():
+    captions = [
+        normalize_caption(CAMPAIGN),
+        normalize_caption(CAMPAIGN.upper() + "!!"),
+        normalize_caption(CAMPAIGN.replace("new", "big")),
+        "an unrelated caption about cooking pasta at home",
+        "abc",
+    ]
+    signatures = minhash_signatures(captions)
+    assert signatures.shape == (5, 128)
+    similarity = (signatures[:, None] == signatures[None]).mean(axis=2)
+    assert similarity[0, 1] == 1
+    assert 0.6 < similarity[0, 2] < 1
+    assert similarity[0, 3] < 0.2
+    # Captions without shingles are never similar to anything
+    assert (signatures[4] == np.iinfo(np.uint32).max).all()
+
+    # Signatures don't depend on the other captions of a batch
+    assert (minhash_signatures(captions[2:3]) == signatures[2]).all()
+
+
+def test_band_rows():
+    assert band_rows(0.8) == 8
+    assert band_rows(0.5) < band_rows(0.8) < band_rows(0.95)
+
+
+def test_duplicates(tmp_path):
+    open_store(tmp_path / "a").merge(
+        [
+            captioned(1, ["a"], CAMPAIGN, author="bot1"),
+            captioned(2, ["a", "b"], CAMPAIGN + " #b", author="bot2"),
+            captioned(3, ["a"], "my cat learned to open the fridge today"),
+            captioned(4, ["a"], "follow me"),
+            captioned(5, ["a"], "follow me"),
+        ]
+    )
+    open_store(tmp_path / "b", backend="jsonl").merge(
+        [
+            captioned(2, ["a", "b"], CAMPAIGN + " #b", author="bot2"),
+            captioned(6, ["b"], CAMPAIGN + " today", author="bot3"),
+            captioned(7, ["b"], "my cat learned to open the fridge today"),
+        ]
+    )
+    index = CaptionIndex(tmp_path)
+    assert index.update() == 7
+
+    # Short captions like "follow me" aren't compared
+    clusters = index.duplicates()
+    assert [len(cluster["posts"]) for cluster in clusters] == [3, 2]
+    campaign = clusters[0]
+    assert campaign["authors"] == ["bot1", "bot2", "bot3"]
+    assert campaign["hashtags"] == ["a", "b"]
+    assert {post["id"]: post["hashtags"] for post in campaign["posts"]} == {
+        "1": ["a"],
+        "2": ["a", "b"],
+        "6": ["b"],
+    }
+    assert index.duplicates(min_authors=2) == [campaign]
+    assert index.duplicates(threshold=1.0)[0]["authors"] == ["bot1", "bot2"]
+
+    file_path = tmp_path / "duplicates.csv"
+    assert index.export_csv(file_path, min_authors=2) == 1
+    with open(file_path, encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["id"] for row in rows] == ["1", "2", "6"]
+    assert rows[1]["hashtags"] == "a b"
+
+
+def test_signatures_updated_incrementally(tmp_path):
+    open_store(tmp_path / "a").merge(
+        [captioned(1, ["a"], CAMPAIGN), captioned(2, ["a"], "a different caption")]
+    )
+    open_store(tmp_path / "b").merge([captioned(3, ["b"], "something else entirely")])
+    assert CaptionIndex(tmp_path).update() == 3
+
+    # Only the new and edited posts of the changed hashtag are hashed
+    open_store(tmp_path / "a").merge(
+        [captioned(2, ["a"], CAMPAIGN, author="bot"), captioned(4, ["a"], CAMPAIGN)]
+    )
+    index = CaptionIndex(tmp_path)
+    assert index.update() == 2
+    assert CaptionIndex(tmp_path).update() == 0
+    assert [post["id"] for post in index.duplicates()[0]["posts"]] == ["1", "2", "4"]
+
+    # Posts of hashtags removed from the data directory are forgotten
+    (tmp_path / "a" / "posts.json").unlink()
+    index = CaptionIndex(tmp_path)
+    index.update()
+    assert index.duplicates() == []
+    assert list(index.members) == ["b"]
+
+
+def test_parameters_change_rehashes(tmp_path):
+    open_store(tmp_path / "a").merge([captioned(1, ["a"], CAMPAIGN)])
+    CaptionIndex(tmp_path).update()
+    assert CaptionIndex(tmp_path, num_perm=64).update() == 1
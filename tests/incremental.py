@@ -0,0 +1,124 @@
+import json
+import asyncio
+
+from tiktok_hashtag_analysis.base import (
+    TikTokDownloader,
+    _fetch_hashtags_concurrently,
+    json_load,
+)
+from tiktok_hashtag_analysis.incremental import IncrementalScrapes
+from tiktok_hashtag_analysis.storage import open_store
+from .conftest import make_post
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def feed(start, end):
+    # TikTok serves the newest posts first
+    return [make_post(i, ["a", "b"]) for i in reversed(range(start, end))]
+
+
+def test_stop_after_known_posts(tmp_path, fake_api):
+    fake_api.reset(posts={"a": feed(0, 10)})
+    downloader = TikTokDownloader(
+        hashtags=["a"], data_dir=tmp_path, api_factory=fake_api, stop_after_known=3
+    )
+    downloader.get_hashtag_posts("a", limit=50, headed=False)
+    assert len(json_load(tmp_path / "a" / "posts.json")) == 10
+
+    # Only the new posts and the first 3 known posts are fetched
+    fake_api.reset(posts={"a": feed(0, 15)})
+    downloader.get_hashtag_posts("a", limit=50, headed=False)
+    assert downloader.metrics.stages["fetch"].posts == 10 + 8
+    assert len(json_load(tmp_path / "a" / "posts.json")) == 15
+    assert fake_api.active == 0
+
+    # Concurrent scrapes stop early too
+    fake_api.reset(posts={"a": feed(0, 16)})
+    downloader.get_hashtags_posts_concurrently(
+        ["a"], limit=50, headed=False, sessions=1
+    )
+    assert downloader.metrics.stages["fetch"].posts == 10 + 8 + 4
+
+
+def test_known_posts_separated_by_new_posts(tmp_path, fake_api):
+    # A run of known posts interrupted by a new post starts over
+    fake_api.reset(posts={"a": feed(0, 3)})
+    downloader = TikTokDownloader(
+        hashtags=["a"], data_dir=tmp_path, api_factory=fake_api, stop_after_known=2
+    )
+    downloader.get_hashtag_posts("a", limit=50, headed=False)
+    posts = [make_post(i, ["a"]) for i in [10, 2, 11, 1, 0, 12]]
+    fake_api.reset(posts={"a": posts})
+    downloader.get_hashtag_posts("a", limit=50, headed=False)
+    assert len(json_load(tmp_path / "a" / "posts.json")) == 5
+
+
+def test_known_ids_without_stop_after_known(fake_api):
+    # Known posts don't stop a scrape unless a number of them is specified
+    fake_api.reset(posts={"a": feed(0, 10)})
+    results, failed = asyncio.run(
+        _fetch_hashtags_concurrently(
+            hashtags=["a"],
+            limit=50,
+            num_sessions=1,
+            api_factory=fake_api,
+            known_ids=lambda hashtag: set(),
+        )
+    )
+    assert failed == []
+    assert len(results["a"]) == 10
+
+
+def test_full_refresh(tmp_path):
+    clock = Clock()
+    store = open_store(tmp_path / "a")
+    store.merge([make_post(1, ["a"])])
+    incremental = IncrementalScrapes(
+        stop_after_known=5,
+        state_file=tmp_path / "full_scrapes.json",
+        full_refresh=3600,
+        clock=clock,
+    )
+
+    # Hashtags that were never scraped in full are due a full scrape
+    assert incremental.known_ids("a", store) is None
+    incremental.record("a")
+    assert incremental.known_ids("a", store) == {"1"}
+    incremental.record("a")
+
+    # The time of the last full scrape survives restarts
+    clock.now += 3600
+    incremental = IncrementalScrapes(
+        stop_after_known=5,
+        state_file=tmp_path / "full_scrapes.json",
+        full_refresh=3600,
+        clock=clock,
+    )
+    assert incremental.full_scrapes == {"a": 1000.0}
+    assert incremental.known_ids("a", store) is None
+
+
+def test_full_scrapes_shared_by_workers(tmp_path):
+    clock = Clock()
+    store = open_store(tmp_path / "a")
+    state_file = tmp_path / "full_scrapes.json"
+    workers = [
+        IncrementalScrapes(
+            stop_after_known=5, state_file=state_file, full_refresh=3600, clock=clock
+        )
+        for _ in range(2)
+    ]
+    assert workers[0].known_ids("a", store) is None
+    assert workers[1].known_ids("b", store) is None
+    workers[0].record("a")
+    workers[1].record("b")
+
+    # Neither worker's full scrape is lost
+    assert json.loads(state_file.read_text()) == {"a": 1000.0, "b": 1000.0}
@@ -0,0 +1,170 @@
+import json
+
+from tiktok_hashtag_analysis.base import TikTokDownloader, json_dump, json_load
+from tiktok_hashtag_analysis import leases
+from tiktok_hashtag_analysis.leases import LeaseManager
+from .conftest import make_post
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lease_is_exclusive(tmp_path):
+    first = LeaseManager(data_dir=tmp_path, owner="first")
+    second = LeaseManager(data_dir=tmp_path, owner="second")
+    assert first.acquire("a")
+    assert first.acquire("a")
+    assert not second.acquire("a")
+    assert first.read("a")["owner"] == "first"
+
+    # Released leases can be leased by other workers
+    first.release("a")
+    assert first.read("a") is None
+    assert second.acquire("a")
+    assert not first.acquire("a")
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    clock = Clock()
+    first = LeaseManager(data_dir=tmp_path, ttl=60, owner="first", clock=clock)
+    second = LeaseManager(data_dir=tmp_path, ttl=60, owner="second", clock=clock)
+    assert first.acquire("a")
+
+    # Renewed leases don't expire
+    clock.now += 50
+    assert first.renew("a")
+    clock.now += 50
+    assert not second.acquire("a")
+
+    # The first worker stopped renewing its lease
+    clock.now += 60
+    assert second.acquire("a")
+    assert second.read("a")["owner"] == "second"
+    assert not first.renew("a")
+    assert "a" not in first.held
+
+    # Releasing a lost lease leaves the new owner's lease alone
+    first.release("a")
+    assert second.read("a")["owner"] == "second"
+    assert list(tmp_path.glob("leases/*.broken")) == []
+
+
+def test_renewal_never_overwrites_another_lease(tmp_path, monkeypatch):
+    first = LeaseManager(data_dir=tmp_path, owner="first")
+    second = LeaseManager(data_dir=tmp_path, owner="second")
+    assert first.acquire("a")
+
+    # The second worker leases the hashtag while the first renews its lease
+    write_json = leases.write_json
+
+    def acquire_while_renewing(file_path, data, **kwargs):
+        assert second.acquire("a")
+        write_json(file_path, data, **kwargs)
+
+    monkeypatch.setattr(leases, "write_json", acquire_while_renewing)
+    assert not first.renew("a")
+    assert "a" not in first.held
+    assert second.read("a")["owner"] == "second"
+    assert [path.name for path in tmp_path.glob("leases/*")] == ["a.lease"]
+    assert list(tmp_path.glob("leases/.*")) == []
+
+    # The second worker renews its lease as usual
+    monkeypatch.undo()
+    assert second.renew("a")
+    assert second.read("a")["owner"] == "second"
+
+
+def test_unreadable_lease_expires_after_ttl(tmp_path):
+    clock = Clock()
+    leases = LeaseManager(data_dir=tmp_path, ttl=60, owner="first", clock=clock)
+    leases.lease_file("a").write_text("")
+    clock.now = leases.lease_file("a").stat().st_mtime + 30
+    assert not leases.acquire("a")
+    clock.now += 30
+    assert leases.acquire("a")
+
+
+def test_stop_releases_leases(tmp_path):
+    with LeaseManager(data_dir=tmp_path) as leases:
+        assert list(leases.claim(["a", "b"])) == ["a", "b"]
+        assert len(list(tmp_path.glob("leases/*.lease"))) == 2
+    assert list(tmp_path.glob("leases/*.lease")) == []
+
+
+def test_worker_skips_leased_hashtags(tmp_path, fake_api):
+    fake_api.reset(posts={name: [make_post(1, [name])] for name in "abc"})
+    other = LeaseManager(data_dir=tmp_path, owner="other")
+    assert other.acquire("b")
+
+    for sessions in [None, 2]:
+        fake_api.reset(posts=fake_api.posts)
+        downloader = TikTokDownloader(
+            hashtags=["a", "b", "c"],
+            data_dir=tmp_path,
+            api_factory=fake_api,
+            worker=True,
+        )
+        downloader.run(
+            limit=10,
+            download=False,
+            plot=False,
+            table=False,
+            number=10,
+            headed=False,
+            sessions=sessions,
+        )
+        assert sorted(name for name, _ in fake_api.calls) == ["a", "c"]
+        # Leases are released at the end of the run
+        assert [path.name for path in tmp_path.glob("leases/*.lease")] == ["b.lease"]
+    assert not (tmp_path / "b" / "posts.json").exists()
+
+
+def test_worker_skips_hashtags_scraped_during_run(tmp_path, fake_api):
+    downloader = TikTokDownloader(
+        hashtags=["a", "b"], data_dir=tmp_path, api_factory=fake_api, worker=True
+    )
+    (tmp_path / "a").mkdir()
+    json_dump(tmp_path / "a" / "posts.json", [make_post(1, ["a"])])
+    since = downloader.get_store("a").last_modified()
+    claimed = list(downloader.claim_hashtags(["a", "b"], since=since))
+    assert claimed == ["b"]
+    assert downloader.leases.held == {"b"}
+
+
+def test_workers_use_rollback_journal(tmp_path):
+    # The write-ahead log doesn't work for databases shared over NFS
+    downloader = TikTokDownloader(
+        hashtags=["a"], data_dir=tmp_path, database=tmp_path / "posts.sqlite"
+    )
+    with downloader.open_manifest() as manifest:
+        journal = manifest.connection.execute("PRAGMA journal_mode").fetchone()
+        assert journal[0] == "wal"
+    downloader.database.close()
+
+    downloader = TikTokDownloader(
+        hashtags=["b"],
+        data_dir=tmp_path / "shared",
+        database=tmp_path / "shared" / "posts.sqlite",
+        worker=True,
+    )
+    with downloader.open_manifest() as manifest:
+        journal = manifest.connection.execute("PRAGMA journal_mode").fetchone()
+        assert journal[0] == "delete"
+    journal = downloader.database.connection.execute("PRAGMA journal_mode").fetchone()
+    assert journal[0] == "delete"
+    downloader.database.close()
+
+
+def test_json_dump_is_atomic(tmp_path):
+    file_path = tmp_path / "posts.json"
+    json_dump(file_path, [make_post(1, ["a"])])
+    json_dump(file_path, [make_post(2, ["a"])])
+    assert [post["id"] for post in json_load(file_path)] == ["2"]
+    # No temporary files are left behind
+    assert [path.name for path in tmp_path.iterdir()] == ["posts.json"]
+    assert json.loads(file_path.read_text())[0]["id"] == "2"
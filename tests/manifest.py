@@ -0,0 +1,128 @@
+from tiktok_hashtag_analysis.base import TikTokDownloader
+from tiktok_hashtag_analysis.manifest import (
+    DownloadManifest,
+    RETRY_DELAY,
+    MAX_RETRY_DELAY,
+)
+from .conftest import MEDIA_SIZE, MediaHandler, make_post
+from .download import make_gallery
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_manifest_backoff(tmp_path):
+    clock = Clock()
+    with DownloadManifest(tmp_path / "downloads.sqlite", clock=clock) as manifest:
+        manifest.record_failure("a/media", "1", "MediaUnavailable: 403")
+        assert manifest.skipped_ids("a/media") == {"1"}
+        assert manifest.entry("a/media", "1")["retry_after"] == 1000 + RETRY_DELAY
+
+        # Failed downloads are retried once their delay has passed, and the
+        # delay doubles with each further failure
+        clock.now += RETRY_DELAY
+        assert manifest.skipped_ids("a/media") == set()
+        manifest.record_failure("a/media", "1", "MediaUnavailable: 403")
+        entry = manifest.entry("a/media", "1")
+        assert entry["attempts"] == 2
+        assert entry["retry_after"] == clock.now + 2 * RETRY_DELAY
+
+        for _ in range(20):
+            manifest.record_failure("a/media", "1", "MediaUnavailable: 403")
+        entry = manifest.entry("a/media", "1")
+        assert entry["retry_after"] == clock.now + MAX_RETRY_DELAY
+
+        manifest.record_success("a/media", "1", nbytes=10, files=["1.mp4"])
+        entry = manifest.entry("a/media", "1")
+        assert entry["status"] == "downloaded"
+        assert entry["attempts"] == 23
+        assert entry["last_error"] is None
+        assert entry["files"] == ["1.mp4"]
+        assert manifest.skipped_ids("b/media") == set()
+
+
+def test_manifest_adopts_existing_media(tmp_path):
+    media_dir = tmp_path / "a" / "media"
+    media_dir.mkdir(parents=True)
+    for file in ["1.mp4", "2.mpeg", "2_00.jpeg", ".3.mp4.part"]:
+        (media_dir / file).write_bytes(b"\0" * 10)
+
+    with DownloadManifest(tmp_path / "downloads.sqlite") as manifest:
+        assert manifest.adopt_directory("a/media", media_dir) == 2
+        assert manifest.downloaded_ids("a/media") == {"1", "2"}
+        assert manifest.entry("a/media", "2")["bytes"] == 20
+        # Folders are only listed the first time they are used
+        (media_dir / "4.mp4").write_bytes(b"\0")
+        assert manifest.adopt_directory("a/media", media_dir) == 0
+
+
+def test_forbidden_media_not_retried(tmp_path, media_server):
+    forbidden = make_gallery("2", media_server)
+    forbidden["imagePost"]["images"][0]["imageURL"]["urlList"] = [
+        f"{media_server}/forbidden/2_0.jpeg"
+    ]
+    downloader = TikTokDownloader(hashtags=["a"], data_dir=tmp_path)
+    downloader.save_hashtag_posts("a", [make_gallery("1", media_server), forbidden])
+
+    progress = downloader.get_hashtag_videos("a")
+    assert progress.failed == 1
+    assert progress.bytes == 7 * MEDIA_SIZE
+    with DownloadManifest(tmp_path / "downloads.sqlite") as manifest:
+        assert manifest.entry("a/media", "1")["bytes"] == 4 * MEDIA_SIZE
+        entry = manifest.entry("a/media", "2")
+        assert entry["status"] == "failed"
+        assert "403" in entry["last_error"]
+
+    # The post that failed is backed off, rather than requested again
+    assert downloader.get_pending_media("a") == []
+    assert downloader.get_hashtag_videos("a").completed == 0
+    assert len(MediaHandler.paths) == 8
+
+
+def test_forbidden_shared_media_not_retried(tmp_path, media_server):
+    forbidden = make_gallery("2", media_server, images=1)
+    forbidden["music"]["playUrl"] = f"{media_server}/forbidden/2.mpeg"
+    downloader = TikTokDownloader(
+        hashtags=["a", "b"], data_dir=tmp_path, shared_media=True
+    )
+    downloader.save_hashtag_posts("a", [make_gallery("1", media_server), forbidden])
+    downloader.save_hashtag_posts("b", [forbidden])
+
+    downloader.get_hashtags_videos(["a"])
+    assert len(MediaHandler.paths) == 6
+    # Media that failed to download to the store isn't requested for other
+    # hashtags either
+    assert downloader.get_hashtags_videos(["b"]).completed == 0
+    assert len(MediaHandler.paths) == 6
+    with DownloadManifest(tmp_path / "downloads.sqlite") as manifest:
+        assert manifest.entry("a/media", "1")["status"] == "downloaded"
+        assert manifest.entry("media_store", "2")["status"] == "failed"
+
+
+def test_posts_without_media_skipped(tmp_path, media_server):
+    no_author = make_post(2, ["a"])
+    del no_author["author"]
+    for shared_media in [False, True]:
+        data_dir = tmp_path / str(shared_media)
+        downloader = TikTokDownloader(
+            hashtags=["a"], data_dir=data_dir, shared_media=shared_media
+        )
+        downloader.save_hashtag_posts(
+            "a", [make_gallery("1", media_server), make_post(3, ["a"], author=None)]
+        )
+        downloader.save_hashtag_posts("a", [no_author])
+
+        # Posts whose video URL can't be built are recorded as skipped, rather
+        # than listed as pending on every run
+        assert downloader.get_hashtags_videos(["a"]).completed == 4
+        with DownloadManifest(data_dir / "downloads.sqlite") as manifest:
+            for post_id in ["2", "3"]:
+                entry = manifest.entry("a/media", post_id)
+                assert entry["status"] == "skipped"
+                assert entry["attempts"] == 0
+        assert downloader.get_pending_media("a") == []
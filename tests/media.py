@@ -0,0 +1,131 @@
+import os
+
+from tiktok_hashtag_analysis.base import TikTokDownloader
+from tiktok_hashtag_analysis.manifest import DownloadManifest
+from tiktok_hashtag_analysis.media import MediaStore, is_media_file, media_post_id
+from .conftest import MEDIA_SIZE, MediaHandler
+from .download import make_gallery
+
+
+def test_media_post_id():
+    assert media_post_id("123.mp4") == "123"
+    assert media_post_id("123_04.jpeg") == "123"
+
+
+def test_is_media_file():
+    assert is_media_file("123_04.jpeg")
+    assert not is_media_file(".sha256.json")
+    assert not is_media_file(".123.mp4.x8d2k.part")
+    assert not is_media_file("123.mp4.part")
+    assert not is_media_file("123.f137.mp4.part-Frag3")
+    assert not is_media_file("123.mp4.ytdl")
+
+
+def make_downloader(tmp_path, media_server, verify_media=False):
+    # Gallery 2 was scraped for both hashtags
+    posts = {
+        "a": [
+            make_gallery("1", media_server, images=2),
+            make_gallery("2", media_server),
+        ],
+        "b": [make_gallery("2", media_server), make_gallery("3", media_server)],
+    }
+    downloader = TikTokDownloader(
+        hashtags=["a", "b"],
+        data_dir=tmp_path,
+        shared_media=True,
+        verify_media=verify_media,
+    )
+    for hashtag, hashtag_posts in posts.items():
+        downloader.save_hashtag_posts(hashtag, hashtag_posts)
+    return downloader
+
+
+def test_shared_media_downloaded_once(tmp_path, media_server):
+    downloader = make_downloader(tmp_path, media_server)
+    progress = downloader.get_hashtags_videos(["a", "b"], workers=2)
+
+    # 3 files for gallery 1, and 4 files each for galleries 2 and 3
+    assert progress.completed == 11
+    assert len(MediaHandler.paths) == 11
+    assert progress.bytes == 11 * MEDIA_SIZE
+    stored = tmp_path / "media_store" / "2.mpeg"
+    for hashtag in ["a", "b"]:
+        linked = tmp_path / hashtag / "media" / "2.mpeg"
+        assert os.path.samefile(linked, stored)
+    assert len(os.listdir(tmp_path / "a" / "media")) == 7
+    assert len(os.listdir(tmp_path / "b" / "media")) == 8
+
+    # Nothing is downloaded again
+    assert downloader.get_hashtags_videos(["a", "b"]).completed == 0
+    assert len(MediaHandler.paths) == 11
+
+
+def test_shared_media_reuses_existing_media(tmp_path, media_server):
+    # Media was downloaded for `#a` before the media store was used
+    downloader = make_downloader(tmp_path, media_server)
+    downloader.shared_media = False
+    downloader.get_hashtags_videos(["a"])
+    assert len(MediaHandler.paths) == 7
+
+    downloader.shared_media = True
+    downloader.get_hashtags_videos(["a", "b"])
+    assert len(MediaHandler.paths) == 11
+    assert all("/2" not in path for path in MediaHandler.paths[7:])
+    assert os.path.samefile(
+        tmp_path / "a" / "media" / "2.mpeg", tmp_path / "b" / "media" / "2.mpeg"
+    )
+
+
+def test_verify_media(tmp_path, media_server):
+    downloader = make_downloader(tmp_path, media_server, verify_media=True)
+    downloader.get_hashtags_videos(["a"])
+    assert len(MediaHandler.paths) == 7
+
+    # Corrupted stored media is downloaded again instead of being linked
+    with open(tmp_path / "media_store" / "2_00.jpeg", "wb") as f:
+        f.write(b"corrupted")
+    store = MediaStore(tmp_path / "media_store", verify=True)
+    assert not store.has("2")
+    assert store.has("1")
+    assert not (tmp_path / "media_store" / "2.mpeg").exists()
+
+    downloader.get_hashtags_videos(["b"])
+    assert (tmp_path / "media_store" / "2_00.jpeg").stat().st_size == MEDIA_SIZE
+    assert any(path.startswith("/image/2_") for path in MediaHandler.paths[7:])
+
+
+def test_shared_media_partial_download(tmp_path, media_server):
+    downloader = make_downloader(tmp_path, media_server)
+    gallery = make_gallery("4", media_server)
+    gallery["imagePost"]["images"][1]["imageURL"]["urlList"] = [
+        f"{media_server}/forbidden/4_1.jpeg"
+    ]
+    downloader.merge_hashtag_posts("a", [gallery])
+    downloader.merge_hashtag_posts("b", [gallery])
+    progress = downloader.get_hashtags_videos(["a", "b"])
+    assert progress.failed == 1
+
+    # The files that were downloaded aren't linked or reused
+    assert (tmp_path / "media_store" / "4_00.jpeg").exists()
+    assert not (tmp_path / "a" / "media" / "4_00.jpeg").exists()
+    assert not MediaStore(tmp_path / "media_store").has("4", expected=4)
+    with DownloadManifest(downloader.manifest_file) as manifest:
+        for hashtag in ["a", "b"]:
+            assert manifest.entry(f"{hashtag}/media", "4")["status"] == "failed"
+
+
+def test_partial_downloads_are_not_stored_media(tmp_path, media_server):
+    # A download by another tool was interrupted, in the store and in a
+    # hashtag's media folder
+    downloader = make_downloader(tmp_path, media_server)
+    for media_dir in [tmp_path / "media_store", tmp_path / "a" / "media"]:
+        media_dir.mkdir(parents=True, exist_ok=True)
+        (media_dir / "2.mpeg.part").write_bytes(b"partial")
+    store = MediaStore(tmp_path / "media_store")
+    assert not store.has("2")
+    assert store.adopt(tmp_path / "a" / "media") == 0
+
+    downloader.get_hashtags_videos(["a", "b"])
+    assert len(MediaHandler.paths) == 11
+    assert (tmp_path / "b" / "media" / "2.mpeg").stat().st_size == MEDIA_SIZE
@@ -0,0 +1,93 @@
+import json
+import pstats
+
+from tenacity import Retrying, stop_after_attempt
+
+from tiktok_hashtag_analysis.base import TikTokDownloader
+from tiktok_hashtag_analysis.metrics import RunMetrics, record_retry
+from .conftest import make_post
+
+
+def retry_flaky(failures: int):
+    remaining = [failures]
+    for attempt in Retrying(stop=stop_after_attempt(5), before_sleep=record_retry("x")):
+        with attempt:
+            if remaining[0] > 0:
+                remaining[0] -= 1
+                raise RuntimeError("Simulated failure")
+
+
+def test_retries_counted_per_run():
+    retry_flaky(failures=2)
+    metrics = RunMetrics()
+    assert "x" not in metrics.retries()
+    retry_flaky(failures=1)
+    assert metrics.retries() == {"x": 1}
+
+
+def test_run_metrics(tmp_path, fake_api):
+    fake_api.reset(posts={"a": [make_post(i, ["a", "b"]) for i in range(4)]})
+    downloader = TikTokDownloader(
+        hashtags=["a"],
+        data_dir=tmp_path,
+        api_factory=fake_api,
+        profile_dir=tmp_path / "profiles",
+    )
+    downloader.run(
+        limit=3, download=False, plot=False, table=True, number=5, headed=False
+    )
+
+    stages = downloader.metrics.to_dict()["stages"]
+    assert set(stages) == {"fetch", "browser", "merge", "table"}
+    assert stages["fetch"]["posts"] == 3
+    assert stages["merge"]["posts"] == 3
+    assert stages["fetch"]["seconds"] >= stages["browser"]["seconds"] > 0
+    assert stages["merge"]["posts_per_second"] > 0
+
+    downloader.metrics.export(tmp_path / "metrics.json")
+    with open(tmp_path / "metrics.json", "r", encoding="utf-8") as f:
+        assert json.load(f)["stages"]["table"]["calls"] == 1
+
+    downloader.metrics.export(tmp_path / "metrics.prom")
+    lines = (tmp_path / "metrics.prom").read_text().splitlines()
+    assert 'tiktok_hashtag_analysis_stage_posts{stage="merge"} 3' in lines
+    assert "# TYPE tiktok_hashtag_analysis_stage_seconds gauge" in lines
+
+    # The browser is started and posts are merged within the fetch stage, but
+    # they have their own profiles
+    downloader.metrics.save_profiles()
+    assert sorted(path.name for path in (tmp_path / "profiles").iterdir()) == [
+        f"{stage}.{extension}"
+        for stage in ("browser", "fetch", "merge", "table")
+        for extension in ("prof", "txt")
+    ]
+    stats = pstats.Stats(str(tmp_path / "profiles" / "merge.prof"))
+    assert any(name == "merge" for _, _, name in stats.stats)
+
+
+def inner_work():
+    return sum(range(1000))
+
+
+def outer_work(metrics):
+    with metrics.stage("inner"):
+        inner_work()
+    with metrics.stage("inner"):
+        inner_work()
+
+
+def test_nested_stage_profiles(tmp_path):
+    metrics = RunMetrics(profile_dir=tmp_path)
+    with metrics.stage("outer"):
+        outer_work(metrics)
+    metrics.save_profiles()
+
+    def functions(stage):
+        stats = pstats.Stats(str(tmp_path / f"{stage}.prof"))
+        return {name: stat[1] for (_, _, name), stat in stats.stats.items()}
+
+    # The nested stage's work is only in its own profile
+    assert functions("inner")["inner_work"] == 2
+    assert "inner_work" not in functions("outer")
+    assert "outer_work" in functions("outer")
+    assert metrics.stages["inner"].calls == 2
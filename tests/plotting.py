@@ -0,0 +1,48 @@
+from tiktok_hashtag_analysis.base import TikTokDownloader
+from tiktok_hashtag_analysis.plotting import get_pyplot, render_cooccurrence_plot
+from .conftest import make_post
+
+
+def test_render_closes_figure(tmp_path):
+    plt = get_pyplot()
+    frequencies = {"a": 3, "b": 2, "c": 1}
+    for plot_format in ["png", "svg"]:
+        plot_file = tmp_path / "plots" / f"a.{plot_format}"
+        render_cooccurrence_plot("a", frequencies, number=5, plot_file=plot_file)
+        assert plot_file.stat().st_size > 0
+    assert plt.get_fignums() == []
+    assert (tmp_path / "plots" / "a.svg").read_text().lstrip().startswith("<?xml")
+
+
+def test_plot_all(tmp_path):
+    hashtags = ["a", "b", "c"]
+    downloader = TikTokDownloader(hashtags=hashtags, data_dir=tmp_path)
+    for hashtag in hashtags:
+        downloader.save_hashtag_posts(
+            hashtag, [make_post(i, [hashtag, "x", "y"]) for i in range(3)]
+        )
+
+    plot_files = downloader.plot_all(hashtags, number=5, workers=2, plot_format="svg")
+    assert sorted(plot_file.parent.parent.name for plot_file in plot_files) == hashtags
+    for hashtag in hashtags:
+        assert len(list((tmp_path / hashtag / "plots").glob(f"{hashtag}__*.svg"))) == 1
+
+
+def test_run_renders_plots_in_background(tmp_path, fake_api):
+    fake_api.reset(posts={hashtag: [make_post(1, [hashtag, "x"])] for hashtag in "ab"})
+    downloader = TikTokDownloader(
+        hashtags=["a", "b"], data_dir=tmp_path, api_factory=fake_api
+    )
+    downloader.run(
+        limit=3,
+        download=False,
+        plot=True,
+        table=False,
+        number=5,
+        headed=False,
+        sessions=2,
+        plot_workers=2,
+        plot_dpi=50,
+    )
+    for hashtag in ["a", "b"]:
+        assert len(list((tmp_path / hashtag / "plots").glob(f"{hashtag}__*.png"))) == 1
@@ -0,0 +1,127 @@
+import json
+
+from tiktok_hashtag_analysis.base import TikTokDownloader
+from tiktok_hashtag_analysis.scheduler import ScrapeScheduler
+from .conftest import make_post
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_intervals_adapt_to_yield(tmp_path):
+    clock = Clock()
+    scheduler = ScrapeScheduler(
+        hashtags=["busy", "quiet", "dead"],
+        min_interval=100,
+        max_interval=10000,
+        clock=clock,
+    )
+    assert [scheduler.pop()[0] for _ in range(3)] == ["busy", "quiet", "dead"]
+
+    scheduler.record("busy", fetched=30, new=20)
+    scheduler.record("quiet", fetched=30, new=5)
+    scheduler.record("dead", fetched=0, new=0)
+    states = scheduler.states
+    assert states["busy"].interval == 1800
+    assert states["quiet"].interval == 3600
+    assert states["dead"].interval == 7200
+    assert scheduler.pop() == ("busy", 2800)
+
+    # Intervals stay within bounds
+    for _ in range(10):
+        scheduler.record("busy", fetched=30, new=30)
+        scheduler.pop()
+    assert states["busy"].interval == 100
+
+
+def test_failures_back_off(tmp_path):
+    clock = Clock()
+    scheduler = ScrapeScheduler(
+        hashtags=["a"], min_interval=10, max_interval=50, clock=clock
+    )
+    delays = []
+    for _ in range(4):
+        scheduler.pop()
+        scheduler.record_failure("a")
+        delays.append(scheduler.states["a"].next_due - clock.now)
+    assert delays == [10, 20, 40, 50]
+
+    # A successful scrape resets the back-off
+    scheduler.pop()
+    scheduler.record("a", fetched=1, new=1)
+    assert scheduler.states["a"].failures == 0
+
+
+def test_schedule_is_saved(tmp_path):
+    clock = Clock()
+    state_file = tmp_path / "schedule.json"
+    scheduler = ScrapeScheduler(hashtags=["a", "b"], state_file=state_file, clock=clock)
+    scheduler.pop()
+    scheduler.record("a", fetched=10, new=0)
+    scheduler.save()
+    assert json.loads(state_file.read_text())["a"]["last_new"] == 0
+
+    # After a restart, `b` is still due before `a`
+    scheduler = ScrapeScheduler(hashtags=["a", "b"], state_file=state_file, clock=clock)
+    assert scheduler.pop()[0] == "b"
+
+
+def test_watch(tmp_path, fake_api):
+    fake_api.reset(
+        posts={"a": [make_post(i, ["a"]) for i in range(3)]}, failures={"b": 1}
+    )
+    downloader = TikTokDownloader(
+        hashtags=["a", "b"], data_dir=tmp_path, api_factory=fake_api
+    )
+    downloader.watch(
+        limit=3,
+        headed=False,
+        sessions=2,
+        min_interval=0,
+        max_interval=0,
+        max_scrapes=4,
+    )
+
+    # One browser is kept open for every scrape
+    assert fake_api.instances == 1
+    assert len(fake_api.calls) == 4
+    schedule = json.loads((tmp_path / "schedule.json").read_text())
+    assert schedule["a"]["scrapes"] == 2
+    assert schedule["a"]["last_new"] == 0
+    assert schedule["b"]["scrapes"] == 1
+    assert schedule["b"]["last_fetched"] == 0
+
+
+def test_watch_survives_save_errors(tmp_path, fake_api):
+    fake_api.reset(posts={hashtag: [make_post(1, [hashtag])] for hashtag in "ab"})
+    downloader = TikTokDownloader(
+        hashtags=["a", "b"], data_dir=tmp_path, api_factory=fake_api
+    )
+    finish_scrape = downloader.finish_scrape
+
+    def save_failing(hashtag, fetched, counts):
+        if hashtag == "b":
+            raise OSError("disk full")
+        return finish_scrape(hashtag=hashtag, fetched=fetched, counts=counts)
+
+    downloader.finish_scrape = save_failing
+    downloader.watch(
+        limit=3,
+        headed=False,
+        sessions=1,
+        min_interval=0,
+        max_interval=0,
+        max_scrapes=4,
+    )
+
+    # Hashtags keep being watched, and failed saves are retried
+    assert len(fake_api.calls) == 4
+    schedule = json.loads((tmp_path / "schedule.json").read_text())
+    assert schedule["a"]["scrapes"] == 2
+    assert schedule["b"]["scrapes"] == 0
+    assert schedule["b"]["failures"] == 2
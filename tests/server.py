@@ -0,0 +1,91 @@
+import json
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from tiktok_hashtag_analysis.base import TikTokDownloader
+from tiktok_hashtag_analysis.server import QueryServer
+from tiktok_hashtag_analysis.storage import open_store
+from .conftest import make_post
+
+
+@pytest.fixture
+def server(tmp_path):
+    open_store(tmp_path / "a").merge(
+        [make_post(1, ["a", "b"]), make_post(2, ["a", "b", "c"]), make_post(3, ["a"])]
+    )
+    with QueryServer(data_dir=tmp_path, port=0) as server:
+        server.start()
+        yield server
+        server.shutdown()
+
+
+def get(server, path):
+    try:
+        with urllib.request.urlopen(server.url + path) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_queries(server):
+    assert server.warm() == (1, 3)
+    assert get(server, "/hashtags") == (200, {"hashtags": ["a"]})
+    assert get(server, "/hashtags/a") == (200, {"hashtag": "a", "posts": 3})
+
+    status, data = get(server, "/hashtags/a/cooccurrences?number=2")
+    assert status == 200
+    assert data["cooccurrences"] == [
+        {"hashtag": "a", "count": 3, "frequency": 1.0},
+        {"hashtag": "b", "count": 2, "frequency": 2 / 3},
+    ]
+
+    status, data = get(server, "/hashtags/a/trends?bucket=hour&window=1")
+    assert [trend["hashtag"] for trend in data["trends"]] == ["b", "c"]
+    status, data = get(server, "/hashtags/a/top-posts?number=1&by=digg_count")
+    assert len(data["top_posts"]) == 1
+    assert get(server, "/cache")[1]["hits"] > 0
+
+
+def test_errors(server):
+    assert get(server, "/hashtags/b")[0] == 404
+    assert get(server, "/hashtags/..")[0] == 404
+    assert get(server, "/hashtags/a/likes")[0] == 404
+    assert get(server, "/posts")[0] == 404
+    status, data = get(server, "/hashtags/a/cooccurrences?number=many")
+    assert status == 400
+    assert "number" in data["error"]
+    assert get(server, "/hashtags/a/trends?bucket=week")[0] == 400
+    assert get(server, "/hashtags/a/trends?window=0")[0] == 400
+
+
+def test_results_follow_changes(server, tmp_path):
+    assert get(server, "/hashtags/a")[1]["posts"] == 3
+    open_store(tmp_path / "a").merge([make_post(4, ["a", "d"])])
+    assert get(server, "/hashtags/a")[1]["posts"] == 4
+    status, data = get(server, "/hashtags/a/cooccurrences")
+    assert {"hashtag": "d", "count": 1, "frequency": 0.25} in data["cooccurrences"]
+
+
+def test_frequencies_match_table(server, tmp_path, capsys):
+    # Posts found for a hashtag don't always use the hashtag itself
+    open_store(tmp_path / "a").merge([make_post(4, ["d"])])
+    status, data = get(server, "/hashtags/a/cooccurrences")
+    assert {"hashtag": "d", "count": 1, "frequency": 1 / 3} in data["cooccurrences"]
+
+    TikTokDownloader(hashtags=["a"], data_dir=tmp_path).frequency_table("a", 20)
+    table = capsys.readouterr().out
+    for row in data["cooccurrences"]:
+        assert f"{row['count']:<15} {row['frequency']:.4f}" in table
+
+
+def test_concurrent_requests(server):
+    # Hashtags are only loaded once, even when first queried concurrently
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(
+            executor.map(lambda _: get(server, "/hashtags/a/cooccurrences"), range(40))
+        )
+    assert all(result == results[0] for result in results)
+    assert server.dataset.cache_info()["misses"] == 1
@@ -0,0 +1,105 @@
+import pytest
+
+from tiktok_hashtag_analysis.base import TikTokDownloader
+from tiktok_hashtag_analysis.snapshot import (
+    PostSnapshot,
+    extract_columns,
+    hashtag_counts,
+    post_hashtag_lists,
+)
+from tiktok_hashtag_analysis.storage import JsonLinesPostStore, JsonPostStore
+from .conftest import make_post
+
+
+def test_extract_columns():
+    gallery = make_post(2, ["b", "a", "b"], author="y", create_time=200)
+    gallery["imagePost"] = {"images": []}
+    columns = extract_columns([make_post(1, ["a"]), gallery, make_post(3, [])])
+
+    assert columns["id"].tolist() == ["1", "2", "3"]
+    assert columns["author"].tolist() == ["user", "y", "user"]
+    assert columns["create_time"].tolist() == [1700000000, 200, 1700000000]
+    assert columns["is_gallery"].tolist() == [False, True, False]
+    assert columns["play_count"].tolist() == [10, 10, 10]
+    assert columns["collect_count"].tolist() == [0, 0, 0]
+    assert post_hashtag_lists(columns) == {"1": ["a"], "2": ["a", "b"], "3": []}
+    assert hashtag_counts(columns) == {"a": 2, "b": 1}
+
+
+@pytest.mark.parametrize("store", ["json", "jsonl"])
+def test_snapshot_updated_after_scrape(tmp_path, monkeypatch, store):
+    downloader = TikTokDownloader(hashtags=["a"], data_dir=tmp_path, store=store)
+    downloader.save_hashtag_posts("a", [make_post(i, ["a", "b"]) for i in range(3)])
+    assert hashtag_counts(downloader.snapshot("a")) == {"a": 3, "b": 3}
+
+    # Post 2 is scraped again without `#b`, and post 3 is new
+    def fail(self):
+        raise AssertionError("Snapshot was rebuilt from all posts")
+
+    monkeypatch.setattr(PostSnapshot, "rebuild", fail)
+    downloader.save_hashtag_posts("a", [make_post(2, ["a"]), make_post(3, ["a", "c"])])
+    columns = downloader.snapshot("a")
+    assert sorted(columns["id"].tolist()) == ["0", "1", "2", "3"]
+    assert hashtag_counts(columns) == {"a": 4, "b": 2, "c": 1}
+    assert post_hashtag_lists(columns)["2"] == ["a"]
+
+
+def test_shards_hold_scraped_posts(tmp_path, monkeypatch):
+    downloader = TikTokDownloader(hashtags=["a"], data_dir=tmp_path)
+    downloader.save_hashtag_posts("a", [make_post(i, ["a", "b"]) for i in range(3)])
+    downloader.snapshot("a")
+    snapshot_file = tmp_path / "a" / "snapshot.npz"
+    written = snapshot_file.read_bytes()
+
+    def fail(self):
+        raise AssertionError("Snapshot was rebuilt from all posts")
+
+    # Each scrape adds a shard rather than rewriting the snapshot
+    monkeypatch.setattr(PostSnapshot, "rebuild", fail)
+    downloader.save_hashtag_posts("a", [make_post(2, ["a"]), make_post(3, ["c"])])
+    assert snapshot_file.read_bytes() == written
+    assert (tmp_path / "a" / "snapshot.1.npz").is_file()
+    columns = downloader.snapshot("a")
+    assert columns["id"].tolist() == ["0", "1", "2", "3"]
+    assert post_hashtag_lists(columns)["2"] == ["a"]
+    assert hashtag_counts(columns) == {"a": 3, "b": 2, "c": 1}
+
+    # Shards are merged into the snapshot once they are larger than it
+    for i in range(4, 10):
+        downloader.save_hashtag_posts("a", [make_post(i, ["d"])])
+    assert snapshot_file.read_bytes() != written
+    assert len(list((tmp_path / "a").glob("snapshot.*.npz"))) < 6
+    columns = downloader.snapshot("a")
+    assert columns["id"].tolist() == [str(i) for i in range(10)]
+    assert hashtag_counts(columns) == {"a": 3, "b": 2, "c": 1, "d": 6}
+
+
+def test_snapshot_rebuilt_when_store_changes(tmp_path):
+    store = JsonPostStore(tmp_path)
+    store.merge([make_post(1, ["a"])])
+    snapshot = PostSnapshot(store)
+    assert snapshot.columns()["id"].tolist() == ["1"]
+    assert (tmp_path / "snapshot.npz").exists()
+
+    # Changes that weren't made through a scrape are picked up on the next read
+    JsonLinesPostStore(tmp_path).migrate()
+    JsonLinesPostStore(tmp_path).append([make_post(2, ["b"])])
+    snapshot = PostSnapshot(JsonLinesPostStore(tmp_path))
+    assert sorted(snapshot.columns()["id"].tolist()) == ["1", "2"]
+
+
+def test_merge_during_rebuild_outdates_snapshot(tmp_path, monkeypatch):
+    store = JsonPostStore(tmp_path)
+    store.merge([make_post(1, ["a"])])
+    iter_posts = JsonPostStore.iter_posts
+
+    # Another process merges a post while the snapshot is being built
+    def merge_while_reading(self, fields=None):
+        posts = list(iter_posts(self, fields=fields))
+        monkeypatch.setattr(JsonPostStore, "iter_posts", iter_posts)
+        JsonPostStore(tmp_path).merge([make_post(2, ["b"])])
+        return iter(posts)
+
+    monkeypatch.setattr(JsonPostStore, "iter_posts", merge_while_reading)
+    assert PostSnapshot(store).rebuild()["id"].tolist() == ["1"]
+    assert PostSnapshot(store).columns()["id"].tolist() == ["1", "2"]
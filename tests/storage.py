@@ -0,0 +1,169 @@
+import os
+import json
+import shutil
+
+import pytest
+
+from tiktok_hashtag_analysis import storage
+from tiktok_hashtag_analysis.storage import (
+    JsonLinesPostStore,
+    JsonPostStore,
+    PostStore,
+    atomic_write,
+    file_lock,
+    json_dump,
+    json_iter,
+    json_load,
+    open_store,
+)
+from .conftest import make_post
+
+
+def scrape_history():
+    """Successive scrapes of a hashtag, with some posts fetched repeatedly."""
+    return [
+        [make_post(i, ["a"]) for i in range(0, 5)],
+        [make_post(i, ["a", "b"]) for i in range(3, 8)],
+        [make_post(i, ["a", "c"]) for i in (1, 9)],
+    ]
+
+
+def test_post_store_is_abstract(tmp_path):
+    with pytest.raises(TypeError):
+        PostStore(tmp_path)
+
+
+@pytest.mark.parametrize("store_class", [JsonPostStore, JsonLinesPostStore])
+def test_store_merge(tmp_path, store_class):
+    store = store_class(tmp_path)
+    counts = [store.merge(posts) for posts in scrape_history()]
+
+    assert counts == [(5, 0), (3, 5), (1, 8)]
+    assert [post["id"] for post in store.load()] == [
+        "0", "2", "3", "4", "5", "6", "7", "1", "9"
+    ]  # fmt: skip
+    assert store.load()[-2]["textExtra"][-1]["hashtagName"] == "c"
+
+
+def test_jsonl_store_matches_json_store(tmp_path):
+    json_store = JsonPostStore(tmp_path / "json")
+    jsonl_store = JsonLinesPostStore(tmp_path / "jsonl")
+    for posts in scrape_history():
+        json_store.merge(posts)
+        jsonl_store.merge(posts)
+    assert jsonl_store.load() == json_store.load()
+    assert json_load(tmp_path / "jsonl" / "posts.json") == json_store.load()
+
+
+def test_jsonl_store_segments_and_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "SEGMENT_SIZE", 1000)
+    store = JsonLinesPostStore(tmp_path)
+    for posts in scrape_history():
+        store.merge(posts)
+    expected = store.load()
+
+    assert len(store.segments()) > 1
+    assert store.get("3") == expected[2]
+    store.compact()
+    assert store.load() == expected
+    assert sum(1 for _ in open(store.index_file)) == len(expected)
+
+
+def test_interrupted_compaction_is_recovered(tmp_path):
+    store = JsonLinesPostStore(tmp_path)
+    for posts in scrape_history():
+        store.merge(posts)
+    expected = store.load()
+
+    # Compaction stopped after moving the store out of the way
+    os.replace(store.store_dir, store.old_dir)
+    store = open_store(tmp_path)
+    assert isinstance(store, JsonLinesPostStore)
+    assert store.load() == expected
+    assert not store.old_dir.exists()
+
+    # Compaction stopped after moving the compacted store into place
+    shutil.copytree(store.store_dir, store.old_dir)
+    store.compact()
+    assert store.load() == expected
+    assert not store.old_dir.exists()
+
+
+def test_jsonl_store_skips_interrupted_append(tmp_path):
+    store = JsonLinesPostStore(tmp_path)
+    store.merge([make_post(1, ["a"])])
+    with open(store.segments()[-1], "ab") as f:
+        f.write(b'{"id": "2", "textEx')
+    store.merge([make_post(3, ["a"])])
+    assert [post["id"] for post in store.load()] == ["1", "3"]
+
+
+def test_migrate_posts_json(tmp_path, monkeypatch):
+    posts = [make_post(i, ["a"]) for i in range(3)]
+    json_dump(tmp_path / "posts.json", posts)
+    # Posts are streamed rather than loaded into memory at once
+    monkeypatch.setattr(storage, "json_load", None)
+
+    assert isinstance(open_store(tmp_path), JsonPostStore)
+    store = open_store(tmp_path, backend="jsonl")
+    assert isinstance(store, JsonLinesPostStore)
+    assert not (tmp_path / "posts.json").exists()
+    assert (tmp_path / "posts.json.migrated").is_file()
+    assert store.load() == posts
+    # Once migrated, the store is used whichever backend is requested
+    assert isinstance(open_store(tmp_path), JsonLinesPostStore)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1024 * 1024])
+def test_json_iter(tmp_path, monkeypatch, chunk_size):
+    monkeypatch.setattr(storage, "READ_CHUNK_SIZE", chunk_size)
+    data = [make_post(i, ["a", "ünï", "日本"]) for i in range(5)] + [[], 12, "x"]
+    with open(tmp_path / "data.json", "w", encoding="utf-8") as f:
+        f.write(" [\n" + ",\n ".join(json.dumps(item) for item in data) + " ]\n")
+
+    assert list(json_iter(tmp_path / "data.json")) == data
+    selected = json_iter(tmp_path / "data.json", fields=["id", "author"])
+    assert next(selected) == {"id": "0", "author": {"uniqueId": "user"}}
+
+
+def test_json_iter_truncated(tmp_path):
+    with open(tmp_path / "data.json", "w", encoding="utf-8") as f:
+        f.write('[{"id": "1"}, {"id": ')
+    with pytest.raises(ValueError):
+        list(json_iter(tmp_path / "data.json"))
+
+
+def test_json_store_merge_format(tmp_path):
+    # Streaming merges write the same bytes as `json_dump`
+    store = JsonPostStore(tmp_path)
+    for posts in scrape_history():
+        store.merge(posts)
+    json_dump(tmp_path / "expected.json", store.load())
+    assert (tmp_path / "posts.json").read_bytes() == (
+        tmp_path / "expected.json"
+    ).read_bytes()
+
+
+def test_atomic_write_failure_keeps_file(tmp_path):
+    file_path = tmp_path / "state.json"
+    file_path.write_text("old", encoding="utf-8")
+    with pytest.raises(RuntimeError):
+        with atomic_write(file_path) as f:
+            f.write("new")
+            raise RuntimeError
+    assert file_path.read_text(encoding="utf-8") == "old"
+    assert [path.name for path in tmp_path.iterdir()] == ["state.json"]
+
+    with atomic_write(file_path) as f:
+        f.write("new")
+    assert file_path.read_text(encoding="utf-8") == "new"
+    assert [path.name for path in tmp_path.iterdir()] == ["state.json"]
+
+
+def test_file_lock_removes_stale_lock(tmp_path):
+    lock_file = tmp_path / ".state.json.lock"
+    lock_file.touch()
+    os.utime(lock_file, (0, 0))
+    with file_lock(tmp_path / "state.json"):
+        assert lock_file.exists()
+    assert not lock_file.exists()
@@ -0,0 +1,75 @@
+import pytest
+
+from tiktok_hashtag_analysis.base import TikTokDownloader
+from tiktok_hashtag_analysis.snapshot import extract_columns
+from tiktok_hashtag_analysis.trends import HashtagTrends
+from .conftest import make_post
+
+DAY = 86400
+
+
+def daily_posts():
+    # `#old` is used every day, `#new` only in the last two days
+    posts = [
+        make_post(day, ["seed", "old"], create_time=day * DAY) for day in range(10)
+    ]
+    posts += [
+        make_post(100 + day, ["seed", "New"], create_time=day * DAY + 60)
+        for day in [8, 8, 9, 9]
+    ]
+    # Posts without a creation time are ignored
+    posts.append(make_post(200, ["seed", "undated"], create_time=0))
+    return posts
+
+
+@pytest.fixture
+def trends():
+    return HashtagTrends(extract_columns(daily_posts()), bucket="day", window=2)
+
+
+def test_counts(trends):
+    assert trends.bucket_starts().tolist() == [day * DAY for day in range(1, 10)]
+    counts = trends.counts(["old", "New", "missing"])
+    assert counts[0].tolist() == [1] * 9
+    assert counts[1].tolist() == [0] * 7 + [2, 2]
+    assert counts[2].sum() == 0
+    assert trends.rolling_counts(["old", "New"]).tolist() == [
+        [1] + [2] * 8,
+        [0] * 7 + [2, 4],
+    ]
+
+
+def test_emerging(trends):
+    emerging = trends.emerging(exclude=("SEED",))
+    assert [trend["hashtag"] for trend in emerging] == ["New", "old"]
+    assert emerging[0]["recent"] == 4
+    assert emerging[0]["expected"] == 0
+    # `#old` is used in 2 of 6 recent posts, and in all 7 earlier posts
+    assert emerging[1]["expected"] == pytest.approx(6)
+    assert emerging[1]["score"] < 0
+    assert trends.emerging(min_count=3, exclude=("seed",))[0]["hashtag"] == "New"
+    assert len(trends.emerging(number=1)) == 1
+
+
+@pytest.mark.parametrize("window", [0, -1, 1.5])
+def test_invalid_window(window):
+    with pytest.raises(ValueError):
+        HashtagTrends(extract_columns(daily_posts()), window=window)
+
+
+def test_end_time():
+    trends = HashtagTrends(
+        extract_columns(daily_posts()), bucket="day", window=2, end_time=8 * DAY
+    )
+    assert trends.bucket_starts()[-1] == 7 * DAY
+    assert "New" not in [trend["hashtag"] for trend in trends.emerging()]
+
+
+def test_trend_table_and_plot(tmp_path, capsys):
+    downloader = TikTokDownloader(hashtags=["seed"], data_dir=tmp_path)
+    downloader.save_hashtag_posts("seed", daily_posts())
+    downloader.trend_table("seed", number=5, window=2)
+    assert "0        New" in capsys.readouterr().out
+
+    downloader.trend_plot("seed", number=5, window=2)
+    assert len(list((tmp_path / "seed" / "plots").glob("seed__trends__*.png"))) == 1
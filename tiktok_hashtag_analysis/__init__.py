@@ -1 +1,15 @@
-from .base import TikTokDownloader
+def __getattr__(name):
+    # Import lazily, so that read-only analyses don't import the scraping
+    # stack
+    if name == "TikTokDownloader":
+        from .base import TikTokDownloader
+
+        return TikTokDownloader
+    if name == "Dataset":
+        from .dataset import Dataset
+
+        return Dataset
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = ["TikTokDownloader", "Dataset"]
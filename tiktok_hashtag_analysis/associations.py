@@ -0,0 +1,182 @@
+import csv
+import logging
+from array import array
+from pathlib import Path
+from typing import List, Dict
+
+from .storage import open_store, scraped_hashtags
+from .database import post_hashtags
+
+logger = logging.getLogger(__name__)
+
+# Name of the file that associations are exported to by default
+ASSOCIATIONS_FILE = "associations.csv"
+METRICS = ["count", "pmi", "jaccard", "lift"]
+
+
+def _import_scipy():
+    try:
+        import numpy as np
+        import scipy.sparse as sparse  # type: ignore[import-untyped]
+    except ImportError as e:
+        raise ImportError(
+            "Corpus-wide hashtag associations require numpy and scipy, which "
+            "can be installed with `pip install tiktok-hashtag-analysis[analysis]`"
+        ) from e
+    return np, sparse
+
+
+class AssociationMatrix:
+    """Co-occurrence counts and association metrics for every pair of
+    hashtags used in the posts scraped into a data directory.
+
+    Posts are de-duplicated across the folders of the hashtags they were
+    scraped for, and collected into a sparse post x hashtag incidence matrix
+    `X`, so that all pairwise co-occurrence counts are given by `X.T @ X`.
+    Hashtags are in lowercase."""
+
+    def __init__(self, incidence, vocabulary: List[str]):
+        np, _ = _import_scipy()
+        self.incidence = incidence
+        self.vocabulary = vocabulary
+        self.total_posts = incidence.shape[0]
+
+        # Co-occurrence counts, with the number of posts using each hashtag
+        # on the diagonal
+        cooccurrences = (incidence.T @ incidence).tocsr()
+        self.post_counts = cooccurrences.diagonal()
+        cooccurrences.setdiag(0)
+        cooccurrences.eliminate_zeros()
+        self.cooccurrences = cooccurrences
+        self._np = np
+
+    @classmethod
+    def from_data_dir(cls, data_dir: Path) -> "AssociationMatrix":
+        """Build the matrix from the posts of all hashtags in a data directory."""
+
+        np, sparse = _import_scipy()
+        vocabulary: Dict[str, int] = {}
+        other_ids: Dict[str, int] = {}
+        post_ids = array("q")
+        hashtag_indices = array("q")
+
+        for hashtag in scraped_hashtags(data_dir=data_dir):
+            store = open_store(hashtag_dir=Path(data_dir) / hashtag)
+            for post in store.iter_posts(fields=["id", "textExtra"]):
+                # Post IDs are numeric, which keeps them compact in memory
+                try:
+                    post_id = int(post["id"])
+                except ValueError:
+                    post_id = other_ids.setdefault(post["id"], -len(other_ids) - 1)
+                for tag in post_hashtags(post):
+                    post_ids.append(post_id)
+                    hashtag_indices.append(vocabulary.setdefault(tag, len(vocabulary)))
+
+        # Posts scraped for several hashtags get a single row
+        unique_ids, rows = np.unique(
+            np.frombuffer(post_ids, dtype=np.int64), return_inverse=True
+        )
+        columns = np.frombuffer(hashtag_indices, dtype=np.int64)
+        incidence = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int32), (rows.ravel(), columns)),
+            shape=(len(unique_ids), len(vocabulary)),
+        )
+        incidence.sum_duplicates()
+        incidence.data[:] = 1
+        logger.info(
+            f"Built incidence matrix of {incidence.shape[0]} posts and "
+            f"{incidence.shape[1]} hashtags"
+        )
+        return cls(incidence=incidence, vocabulary=list(vocabulary))
+
+    def metrics(self, min_count: int = 1) -> Dict:
+        """Compute association metrics for every ordered pair of distinct
+        hashtags that co-occur in at least `min_count` posts. Returns arrays
+        of the pairs' row (`source`) and column (`target`) indices, and of
+        each metric."""
+
+        np = self._np
+        pairs = self.cooccurrences.tocoo()
+        keep = pairs.data >= min_count
+        source, target = pairs.row[keep], pairs.col[keep]
+        count = pairs.data[keep].astype(np.float64)
+        source_count = self.post_counts[source].astype(np.float64)
+        target_count = self.post_counts[target].astype(np.float64)
+
+        lift = count * self.total_posts / (source_count * target_count)
+        return {
+            "source": source,
+            "target": target,
+            "count": pairs.data[keep],
+            "pmi": np.log(lift),
+            "jaccard": count / (source_count + target_count - count),
+            "lift": lift,
+        }
+
+    def top_neighbours(
+        self, k: int = 20, metric: str = "pmi", min_count: int = 1
+    ) -> Dict:
+        """Select the `k` strongest associations of every hashtag according
+        to `metric`, as arrays like those returned by `metrics`, with an
+        additional `rank` array."""
+
+        np = self._np
+        if metric not in METRICS:
+            raise ValueError(f"Unknown association metric '{metric}'")
+        metrics = self.metrics(min_count=min_count)
+
+        # Sort pairs by source hashtag, then by descending score (and count
+        # to break ties), and keep the first `k` pairs of each source
+        order = np.lexsort((-metrics["count"], -metrics[metric], metrics["source"]))
+        sources = metrics["source"][order]
+        starts = np.searchsorted(sources, sources, side="left")
+        rank = np.arange(len(sources)) - starts
+        selected = order[rank < k]
+        top = {name: values[selected] for name, values in metrics.items()}
+        top["rank"] = rank[rank < k]
+        return top
+
+    def export_csv(
+        self,
+        file_path: Path,
+        k: int = 20,
+        metric: str = "pmi",
+        min_count: int = 1,
+    ):
+        """Write the top-`k` neighbours of every hashtag to a CSV file."""
+
+        top = self.top_neighbours(k=k, metric=metric, min_count=min_count)
+        with open(file_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["hashtag", "rank", "neighbour", *METRICS])
+            for i in range(len(top["rank"])):
+                writer.writerow(
+                    [
+                        self.vocabulary[top["source"][i]],
+                        top["rank"][i],
+                        self.vocabulary[top["target"][i]],
+                        top["count"][i],
+                        f"{top['pmi'][i]:.4f}",
+                        f"{top['jaccard'][i]:.4f}",
+                        f"{top['lift'][i]:.4f}",
+                    ]
+                )
+        logger.info(f"Hashtag associations saved to file: {file_path}")
+
+    def neighbours(
+        self, hashtag: str, k: int = 20, metric: str = "pmi", min_count: int = 1
+    ) -> List[Dict]:
+        """Return the `k` strongest associations of a single hashtag."""
+
+        np = self._np
+        metrics = self.metrics(min_count=min_count)
+        index = self.vocabulary.index(hashtag.lower())
+        mask = metrics["source"] == index
+        order = np.lexsort((-metrics["count"][mask], -metrics[metric][mask]))[:k]
+        return [
+            {
+                "neighbour": self.vocabulary[metrics["target"][mask][i]],
+                **{name: metrics[name][mask][i].item() for name in METRICS},
+            }
+            for i in order
+        ]
@@ -0,0 +1,423 @@
+import csv
+import logging
+from pathlib import Path
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from .storage import atomic_write, open_store, scraped_hashtags
+from .snapshot import PostSnapshot, STATS_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# File in the data directory that the author index is saved to
+AUTHOR_INDEX_FILE = "authors.npz"
+AUTHOR_INDEX_VERSION = 1
+
+# Names of the files that author tables are exported to by default
+AUTHORS_FILE = "authors.csv"
+SHARED_AUTHORS_FILE = "shared_authors.csv"
+
+# What authors can be ranked by: their number of posts, or the sum of one
+# of the stats columns over their posts
+AUTHOR_METRICS = ["posts", *STATS_COLUMNS]
+
+ROW_COLUMNS = ["id", "create_time", *STATS_COLUMNS]
+
+
+def _post_keys(ids: np.ndarray) -> np.ndarray:
+    """Return integer keys that are equal for equal post IDs. Post IDs are
+    numeric, which makes comparing them much faster than comparing strings."""
+    try:
+        return ids.astype(np.int64)
+    except (ValueError, OverflowError):
+        return np.unique(ids, return_inverse=True)[1].ravel().astype(np.int64)
+
+
+class AuthorIndex:
+    """Index of the authors of the posts scraped into a data directory, for
+    finding which accounts dominate a hashtag or post across several of the
+    watched hashtags without reading any posts.
+
+    The index has a row for each post scraped for each watched hashtag,
+    with the post's author, creation time and stats, and is saved to the
+    data directory. It is built from the hashtags' post snapshots, which are
+    updated with the posts merged by each scrape, and `update` only reads
+    the snapshots of hashtags whose posts changed since the index was
+    saved. Queries are answered with array operations over the rows, and
+    count posts scraped for several hashtags once."""
+
+    def __init__(self, data_dir: Path):
+        self.data_dir = Path(data_dir)
+        self.index_file = self.data_dir / AUTHOR_INDEX_FILE
+        self.hashtags: List[str] = []
+        self.store_signatures: Dict[str, List[int]] = {}
+        # Sorted names of the authors, which rows refer to by position
+        self.authors = np.array([], dtype=str)
+        self.columns: Dict[str, np.ndarray] = {
+            "hashtag": np.array([], dtype=np.int32),
+            "author": np.array([], dtype=np.int32),
+            "id": np.array([], dtype=str),
+            "create_time": np.array([], dtype=np.int64),
+            **{column: np.array([], dtype=np.int64) for column in STATS_COLUMNS},
+            "post": np.array([], dtype=np.int64),
+            "first": np.array([], dtype=bool),
+        }
+        self._hashtag_counts: Optional[np.ndarray] = None
+        self._load()
+
+    def _load(self):
+        try:
+            saved = np.load(self.index_file, allow_pickle=False)
+            if saved["version"].item() != AUTHOR_INDEX_VERSION:
+                return
+            columns = {name: saved[name] for name in self.columns}
+            hashtags = saved["hashtag_names"].tolist()
+            signatures = saved["store_signatures"].tolist()
+            authors = saved["author_names"]
+        except (OSError, ValueError, KeyError):
+            return
+        self.columns = columns
+        self.hashtags = hashtags
+        self.store_signatures = dict(zip(hashtags, signatures))
+        self.authors = authors
+
+    def save(self):
+        with atomic_write(self.index_file, "wb") as f:
+            np.savez(
+                f,
+                version=np.array(AUTHOR_INDEX_VERSION),
+                hashtag_names=np.array(self.hashtags, dtype=str),
+                store_signatures=np.array(
+                    [self.store_signatures[hashtag] for hashtag in self.hashtags],
+                    dtype=np.int64,
+                ).reshape(-1, 2),
+                author_names=self.authors,
+                **self.columns,
+            )
+
+    def update(self, save: bool = True) -> List[str]:
+        """Bring the index up to date with the posts stored in the data
+        directory, only reading the snapshots of hashtags whose posts
+        changed. Returns the hashtags whose rows were replaced."""
+
+        current = scraped_hashtags(data_dir=self.data_dir)
+        signatures = {
+            hashtag: open_store(hashtag_dir=self.data_dir / hashtag).signature()
+            for hashtag in current
+        }
+        changed = [
+            hashtag
+            for hashtag in current
+            if self.store_signatures.get(hashtag) != signatures[hashtag]
+        ]
+        removed = [hashtag for hashtag in self.hashtags if hashtag not in signatures]
+        if not changed and not removed:
+            return []
+
+        # Drop the rows of changed and removed hashtags, and number the
+        # remaining hashtags again
+        kept = [hashtag for hashtag in self.hashtags if hashtag not in removed]
+        hashtags = kept + [hashtag for hashtag in changed if hashtag not in kept]
+        codes = np.array(
+            [hashtags.index(h) if h in kept else -1 for h in self.hashtags],
+            dtype=np.int32,
+        )
+        stale = np.isin(
+            self.columns["hashtag"],
+            [
+                self.hashtags.index(h)
+                for h in [*removed, *changed]
+                if h in self.hashtags
+            ],
+        )
+        sections = [
+            {
+                "hashtag": codes[self.columns["hashtag"][~stale]],
+                **{name: self.columns[name][~stale] for name in ROW_COLUMNS},
+            }
+        ]
+        section_authors = [self.columns["author"][~stale]]
+
+        for hashtag in changed:
+            store = open_store(hashtag_dir=self.data_dir / hashtag)
+            snapshot = PostSnapshot(store=store).columns(save=save)
+            sections.append(
+                {
+                    "hashtag": np.full(
+                        len(snapshot["id"]), hashtags.index(hashtag), dtype=np.int32
+                    ),
+                    **{name: snapshot[name] for name in ROW_COLUMNS},
+                }
+            )
+            section_authors.append(snapshot["author"])
+            self.store_signatures[hashtag] = signatures[hashtag]
+        for hashtag in removed:
+            del self.store_signatures[hashtag]
+
+        rows = {
+            name: np.concatenate([section[name] for section in sections])
+            for name in sections[0]
+        }
+        # Only the names of the authors are sorted again, not every row's
+        authors = np.unique(np.concatenate([self.authors, *section_authors[1:]]))
+        section_authors[0] = np.searchsorted(authors, self.authors)[section_authors[0]]
+        rows["author"] = np.concatenate(
+            [section_authors[0]]
+            + [np.searchsorted(authors, names) for names in section_authors[1:]]
+        ).astype(np.int32)
+        self.authors = authors
+        rows["post"] = _post_keys(rows["id"])
+        rows["first"] = np.zeros(len(rows["post"]), dtype=bool)
+        rows["first"][np.unique(rows["post"], return_index=True)[1]] = True
+        self.columns = rows
+        self.hashtags = hashtags
+        self._hashtag_counts = None
+
+        logger.info(
+            f"Updated author index with {len(changed)} hashtags: "
+            f"{len(self.authors)} authors of {int(rows['first'].sum())} posts"
+        )
+        if save:
+            self.save()
+        return changed
+
+    def _hashtag_code(self, hashtag: str) -> int:
+        try:
+            return self.hashtags.index(hashtag)
+        except ValueError:
+            raise KeyError(f"No posts were scraped for the hashtag: {hashtag}")
+
+    def _rows(self, hashtags: Optional[List[str]]) -> np.ndarray:
+        """Select the rows of the posts scraped for some of the hashtags (all
+        of them by default)."""
+        if hashtags is None:
+            return np.ones(len(self.columns["id"]), dtype=bool)
+        codes = [self._hashtag_code(hashtag) for hashtag in hashtags]
+        return np.isin(self.columns["hashtag"], codes)
+
+    def _mask(self, hashtags: Optional[List[str]]) -> np.ndarray:
+        """Select the rows of the posts scraped for some of the hashtags (all
+        of them by default), with one row per post."""
+
+        if hashtags is None:
+            return self.columns["first"]
+        mask = self._rows(hashtags)
+        if len(hashtags) > 1:
+            first = np.unique(self.columns["post"][mask], return_index=True)[1]
+            rows = np.flatnonzero(mask)[first]
+            mask = np.zeros(len(mask), dtype=bool)
+            mask[rows] = True
+        return mask
+
+    def _totals(self, mask: np.ndarray) -> Dict[str, np.ndarray]:
+        """Sum the number of posts and the stats of each author over rows."""
+        authors = self.columns["author"][mask]
+        size = len(self.authors)
+        totals = {"posts": np.bincount(authors, minlength=size)}
+        for column in STATS_COLUMNS:
+            totals[column] = np.bincount(
+                authors, weights=self.columns[column][mask], minlength=size
+            ).astype(np.int64)
+        return totals
+
+    def _hashtag_sets(self, mask: np.ndarray) -> np.ndarray:
+        """Return the distinct pairs of author and hashtag among rows, as
+        author codes in the first column and hashtag codes in the second."""
+        pairs = (
+            self.columns["author"][mask].astype(np.int64) * len(self.hashtags)
+            + self.columns["hashtag"][mask]
+        )
+        pairs = np.unique(pairs)
+        return np.stack([pairs // len(self.hashtags), pairs % len(self.hashtags)], 1)
+
+    def hashtag_counts(self) -> np.ndarray:
+        """Count the watched hashtags each author posted in."""
+        if self._hashtag_counts is None:
+            pairs = self._hashtag_sets(self._rows(None))
+            self._hashtag_counts = np.bincount(pairs[:, 0], minlength=len(self.authors))
+        return self._hashtag_counts
+
+    def top_authors(
+        self,
+        hashtag: Optional[str] = None,
+        number: int = 20,
+        by: str = "posts",
+    ) -> List[Dict]:
+        """Return the `number` authors with the most posts scraped for a
+        watched hashtag (all hashtags by default), or the highest sum of one
+        of the stats columns over those posts, such as `play_count`. Each
+        author's number of posts, summed stats, and number of watched
+        hashtags they posted in are included."""
+
+        if by not in AUTHOR_METRICS:
+            raise ValueError(f"Unknown metric '{by}', choose from {AUTHOR_METRICS}")
+        mask = self._mask(None if hashtag is None else [hashtag])
+        totals = self._totals(mask)
+        candidates = np.flatnonzero(totals["posts"])
+        if len(candidates) > number:
+            values = totals[by][candidates]
+            candidates = candidates[np.argpartition(-values, number - 1)[:number]]
+            # Authors tied with the last one are kept, so that ties are
+            # broken by number of posts and name
+            threshold = totals[by][candidates].min()
+            candidates = np.flatnonzero(
+                (totals["posts"] > 0) & (totals[by] >= threshold)
+            )
+        # Authors are numbered in alphabetical order
+        order = np.lexsort(
+            (candidates, -totals["posts"][candidates], -totals[by][candidates])
+        )
+        candidates = candidates[order][:number]
+
+        hashtag_counts = self.hashtag_counts()
+        return [
+            {
+                "author": self.authors[i].item(),
+                **{metric: int(totals[metric][i]) for metric in AUTHOR_METRICS},
+                "hashtags": int(hashtag_counts[i]),
+            }
+            for i in candidates.tolist()
+        ]
+
+    def author(self, author: str) -> Dict:
+        """Return the posts of an author scraped for any watched hashtag,
+        newest first, with the number of posts scraped for each hashtag and
+        their summed stats."""
+
+        code = int(np.searchsorted(self.authors, author))
+        if code == len(self.authors) or self.authors[code] != author:
+            raise KeyError(f"No posts by the author were scraped: {author}")
+        rows = self.columns["author"] == code
+        if not rows.any():
+            raise KeyError(f"No posts by the author were scraped: {author}")
+        hashtag_counts = np.bincount(
+            self.columns["hashtag"][rows], minlength=len(self.hashtags)
+        )
+        posts = rows & self.columns["first"]
+        order = np.argsort(-self.columns["create_time"][posts], kind="stable")
+        return {
+            "author": author,
+            "posts": int(posts.sum()),
+            **{
+                column: int(self.columns[column][posts].sum())
+                for column in STATS_COLUMNS
+            },
+            "hashtags": {
+                self.hashtags[i]: int(hashtag_counts[i])
+                for i in np.flatnonzero(hashtag_counts).tolist()
+            },
+            "post_ids": self.columns["id"][posts][order].tolist(),
+        }
+
+    def shared_authors(
+        self,
+        hashtags: Optional[List[str]] = None,
+        min_hashtags: int = 2,
+        number: Optional[int] = None,
+    ) -> List[Dict]:
+        """Return the authors who posted in at least `min_hashtags` of some
+        watched hashtags (all of them by default), with the hashtags they
+        posted in and their number of posts in those hashtags, sorted by
+        decreasing number of hashtags and posts."""
+
+        pairs = self._hashtag_sets(self._rows(hashtags))
+        hashtag_counts = np.bincount(pairs[:, 0], minlength=len(self.authors))
+        shared = np.flatnonzero(hashtag_counts >= min_hashtags)
+        posts = self._totals(self._mask(hashtags))["posts"]
+        order = np.lexsort((shared, -posts[shared], -hashtag_counts[shared]))
+        shared = shared[order][:number]
+
+        pairs = pairs[np.isin(pairs[:, 0], shared)]
+        author_hashtags: Dict[int, List[str]] = {}
+        for author, hashtag in pairs.tolist():
+            author_hashtags.setdefault(author, []).append(self.hashtags[hashtag])
+        return [
+            {
+                "author": self.authors[i].item(),
+                "hashtags": sorted(author_hashtags[i]),
+                "posts": int(posts[i]),
+            }
+            for i in shared.tolist()
+        ]
+
+    def hashtag_overlap(self, hashtags: Optional[List[str]] = None) -> List[Dict]:
+        """Count the authors shared by every pair of watched hashtags (all of
+        them by default) that have any in common, with the Jaccard index of
+        their sets of authors, sorted by decreasing number of shared
+        authors."""
+
+        pairs = self._hashtag_sets(self._rows(hashtags))
+        author_counts = np.bincount(pairs[:, 1], minlength=len(self.hashtags))
+
+        # Only authors who posted in several hashtags are shared
+        _, inverse, counts = np.unique(
+            pairs[:, 0], return_inverse=True, return_counts=True
+        )
+        inverse = inverse.ravel()
+        several = counts[inverse] > 1
+        _, rows = np.unique(inverse[several], return_inverse=True)
+        incidence = np.zeros(
+            (rows.max() + 1 if rows.size else 0, len(self.hashtags)), dtype=np.float32
+        )
+        incidence[rows.ravel(), pairs[several, 1]] = 1
+        shared = (incidence.T @ incidence).astype(np.int64)
+
+        overlap = []
+        for i, j in zip(*np.nonzero(np.triu(shared, k=1))):
+            union = author_counts[i] + author_counts[j] - shared[i, j]
+            overlap.append(
+                {
+                    "hashtag": self.hashtags[i],
+                    "other": self.hashtags[j],
+                    "shared_authors": int(shared[i, j]),
+                    "jaccard": float(shared[i, j] / union),
+                }
+            )
+        overlap.sort(
+            key=lambda row: (-row["shared_authors"], row["hashtag"], row["other"])
+        )
+        return overlap
+
+    def export_csv(self, file_path: Path, number: int = 20, by: str = "posts"):
+        """Write the top-`number` authors of every watched hashtag, and of
+        all of them together (with an empty hashtag), to a CSV file."""
+
+        with open(file_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["hashtag", "rank", "author", *AUTHOR_METRICS, "hashtags"])
+            for hashtag in [None, *sorted(self.hashtags)]:
+                top = self.top_authors(hashtag=hashtag, number=number, by=by)
+                for rank, row in enumerate(top, start=1):
+                    writer.writerow(
+                        [
+                            hashtag or "",
+                            rank,
+                            row["author"],
+                            *[row[metric] for metric in AUTHOR_METRICS],
+                            row["hashtags"],
+                        ]
+                    )
+        logger.info(f"Top authors saved to file: {file_path}")
+
+    def export_shared_csv(self, file_path: Path, min_hashtags: int = 2):
+        """Write the authors who posted in at least `min_hashtags` watched
+        hashtags to a CSV file."""
+
+        shared = self.shared_authors(min_hashtags=min_hashtags)
+        with open(file_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["author", "hashtag_count", "posts", "hashtags"])
+            for row in shared:
+                writer.writerow(
+                    [
+                        row["author"],
+                        len(row["hashtags"]),
+                        row["posts"],
+                        " ".join(row["hashtags"]),
+                    ]
+                )
+        logger.info(
+            f"{len(shared)} authors who posted in several hashtags saved to file: "
+            f"{file_path}"
+        )
@@ -1,34 +1,70 @@
 import os
-import json
 from pathlib import Path
 from collections import Counter
-from datetime import datetime
-import warnings
+from datetime import datetime, timezone
 import asyncio
 import logging
+import time
 import re
-from urllib.error import HTTPError
-from typing import List, Dict, Optional
-
-import yt_dlp
-from yt_dlp.utils import ExtractorError, DownloadError
-import requests
-import matplotlib.pyplot as plt
-import matplotlib.ticker as mtick
-import seaborn as sns
+from contextlib import asynccontextmanager, nullcontext
+from functools import partial
+from typing import (
+    Any,
+    List,
+    Dict,
+    Iterable,
+    Optional,
+    Awaitable,
+    Callable,
+    Mapping,
+    Set,
+    Tuple,
+)
+
+import numpy as np
 from tenacity import (
+    AsyncRetrying,
+    RetryError,
     retry,
-    retry_if_exception_type,
+    retry_if_exception,
     stop_after_attempt,
-    TryAgain,
     wait_exponential,
 )
-from playwright._impl._errors import Error
-from TikTokApi import TikTokApi
 
-
-warnings.filterwarnings("ignore", message="Glyph (.*) missing from current font")
-sns.set_theme(style="darkgrid")
+from .download import DownloadEngine, DownloadJob, DownloadProgress, video_jobs
+from .storage import (
+    PostStore,
+    JsonPostStore,
+    json_load,
+    json_dump,
+    json_iter,
+    open_store,
+)
+from .database import PostDatabase
+from .media import MediaStore, MEDIA_STORE_DIR
+from .manifest import DownloadManifest, MANIFEST_FILE, DOWNLOADED, NO_MEDIA
+from .counters import CooccurrenceCounter, video_hashtags
+from .snapshot import PostSnapshot
+from .trends import HashtagTrends
+from .scheduler import ScrapeScheduler, SCHEDULE_FILE, MIN_INTERVAL, MAX_INTERVAL
+from .plotting import PlotPool, get_pyplot, render_cooccurrence_plot, save_figure
+from .metrics import RunMetrics, record_retry
+from .incremental import (
+    IncrementalScrapes,
+    FULL_SCRAPES_FILE,
+    BATCH_SIZE,
+    stream_posts,
+)
+from .checkpoint import ScrapeCheckpoints, PendingPosts, CHECKPOINTS_FILE
+from .leases import LeaseManager, LEASE_TTL
+from .crawl import (
+    CrawlFrontier,
+    CRAWL_FILE,
+    CRAWL_HASHTAGS_FILE,
+    MAX_DEPTH,
+    MAX_HASHTAGS,
+    EXPAND,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -50,88 +86,478 @@ def load_hashtags_from_file(file: str) -> List[str]:
     return process_hashtag_list(hashtags=hashtags)
 
 
+def _tiktok_api(*args, **kwargs):
+    """Create a TikTok API client. TikTokApi and playwright are slow to
+    import, so they are only imported once hashtags are scraped."""
+    from TikTokApi import TikTokApi
+
+    return TikTokApi(*args, **kwargs)
+
+
+def _is_playwright_error(exception: BaseException) -> bool:
+    from playwright._impl._errors import Error
+
+    return isinstance(exception, Error)
+
+
 # Retry upon encountering transient playwright errors
-@retry(retry=retry_if_exception_type(Error), stop=stop_after_attempt(3))
+@retry(
+    retry=retry_if_exception(_is_playwright_error),
+    stop=stop_after_attempt(3),
+    before_sleep=record_retry("fetch"),
+)
 async def _fetch_hashtag_data(
-    hashtag: str, limit: int, headed: bool = False
-) -> List[Dict]:
-    """Fetch data for videos containing a specified hashtag, asynchronously."""
-    data = []
-    async with TikTokApi() as api:
-        await api.create_sessions(
-            ms_tokens=[], num_sessions=1, sleep_after=3, headless=not headed
-        )
-        async for video in api.hashtag(name=hashtag).videos(count=limit):
-            data.append(video.as_dict)
-    return data
+    hashtag: str,
+    limit: int,
+    on_batch: Callable[[List[Dict]], None],
+    headed: bool = False,
+    api_factory: Callable = _tiktok_api,
+    metrics: Optional[RunMetrics] = None,
+    known_ids: Optional[Set[str]] = None,
+    stop_after_known: int = 0,
+    checkpoints: Optional[ScrapeCheckpoints] = None,
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    """Fetch data for videos containing a specified hashtag, asynchronously,
+    stopping early if `stop_after_known` posts in `known_ids` are found in a
+    row. The time it takes to start the browser is recorded in `metrics`.
+
+    Posts are passed to `on_batch` in batches of `batch_size` posts as they
+    are fetched, rather than kept in memory. If `checkpoints` is specified,
+    the offset in the feed is saved after each batch, and the scrape resumes
+    from the last saved offset when it is retried. Returns the number of
+    posts fetched."""
+
+    cursor = 0 if checkpoints is None else checkpoints.cursor(hashtag, limit=limit)
+    fetched = 0
+    async with api_factory() as api:
+        with nullcontext() if metrics is None else metrics.stage("browser"):
+            await api.create_sessions(
+                ms_tokens=[], num_sessions=1, sleep_after=3, headless=not headed
+            )
+        async for batch in stream_posts(
+            api.hashtag(name=hashtag).videos(count=limit - cursor, cursor=cursor),
+            hashtag=hashtag,
+            known_ids=known_ids,
+            stop_after_known=stop_after_known,
+            batch_size=batch_size,
+        ):
+            on_batch(batch)
+            fetched += len(batch)
+            if checkpoints is not None:
+                checkpoints.advance(hashtag, cursor=cursor + fetched, limit=limit)
+    if checkpoints is not None:
+        checkpoints.clear(hashtag)
+    return fetched
+
+
+class SessionPool:
+    """Pool of warm TikTok browser sessions that can be shared between
+    hashtags scraped concurrently on a single event loop."""
+
+    def __init__(
+        self,
+        num_sessions: int = 3,
+        headed: bool = False,
+        api_factory: Callable = _tiktok_api,
+        metrics: Optional[RunMetrics] = None,
+    ):
+        self.num_sessions = max(1, num_sessions)
+        self.headed = headed
+        self.api_factory = api_factory
+        self.metrics = metrics
+        self.api: Any = None
+        self._available: Optional[asyncio.Queue] = None
+
+    async def __aenter__(self):
+        self.api = self.api_factory()
+        await self.api.__aenter__()
+        with nullcontext() if self.metrics is None else self.metrics.stage("browser"):
+            await self.api.create_sessions(
+                ms_tokens=[],
+                num_sessions=self.num_sessions,
+                sleep_after=3,
+                headless=not self.headed,
+            )
+        self._available = asyncio.Queue()
+        for session_index in range(self.num_sessions):
+            self._available.put_nowait(session_index)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.api.__aexit__(exc_type, exc, tb)
 
+    @asynccontextmanager
+    async def session(self):
+        """Borrow the index of an idle session, waiting until one is free."""
+        session_index = await self._available.get()
+        try:
+            yield session_index
+        finally:
+            self._available.put_nowait(session_index)
+
+    async def fetch(
+        self,
+        hashtag: str,
+        limit: int,
+        on_batch: Callable[[List[Dict]], Awaitable[None]],
+        known_ids: Optional[Callable[[str], Optional[Set[str]]]] = None,
+        stop_after_known: int = 0,
+        checkpoints: Optional[ScrapeCheckpoints] = None,
+        batch_size: int = BATCH_SIZE,
+    ) -> int:
+        """Fetch data for videos containing a specified hashtag, using the
+        next idle session in the pool, and await `on_batch` with each batch
+        of posts, saving checkpoints as in `_fetch_hashtag_data`. If
+        `known_ids` is specified, it is called with the hashtag once a
+        session is free, and the scrape stops early if `stop_after_known` of
+        the posts it returns are found in a row. Returns the number of posts
+        fetched."""
+        async with self.session() as session_index:
+            hashtag_known_ids = (
+                None
+                if known_ids is None
+                else await asyncio.to_thread(known_ids, hashtag)
+            )
+            cursor = (
+                0 if checkpoints is None else checkpoints.cursor(hashtag, limit=limit)
+            )
+            fetched = 0
+            logger.debug(f"Fetching '{hashtag}' using session {session_index}")
+            async for batch in stream_posts(
+                self.api.hashtag(name=hashtag).videos(
+                    count=limit - cursor, cursor=cursor, session_index=session_index
+                ),
+                hashtag=hashtag,
+                known_ids=hashtag_known_ids,
+                stop_after_known=stop_after_known,
+                batch_size=batch_size,
+            ):
+                await on_batch(batch)
+                fetched += len(batch)
+                if checkpoints is not None:
+                    await asyncio.to_thread(
+                        checkpoints.advance,
+                        hashtag,
+                        cursor=cursor + fetched,
+                        limit=limit,
+                    )
+            if checkpoints is not None:
+                await asyncio.to_thread(checkpoints.clear, hashtag)
+            return fetched
+
+
+async def _fetch_hashtags_concurrently(
+    hashtags: List[str],
+    limit: int,
+    headed: bool = False,
+    num_sessions: int = 3,
+    retries: int = 3,
+    on_batch: Optional[Callable[[str, List[Dict]], None]] = None,
+    on_result: Optional[Callable[[str, int], None]] = None,
+    api_factory: Callable = _tiktok_api,
+    metrics: Optional[RunMetrics] = None,
+    known_ids: Optional[Callable[[str], Optional[Set[str]]]] = None,
+    stop_after_known: int = 0,
+    checkpoints: Optional[ScrapeCheckpoints] = None,
+    batch_size: int = BATCH_SIZE,
+) -> Tuple[Dict[str, List[Dict]], List[str]]:
+    """Fetch data for many hashtags on one event loop, sharing a pool of
+    `num_sessions` browser sessions. At most `num_sessions` hashtags are
+    scraped at once, and each hashtag is attempted up to `retries` times.
+
+    If `on_batch` is specified, it is called with each hashtag and each
+    batch of `batch_size` of its posts as they are fetched, and the posts
+    are not kept in memory. If `checkpoints` is specified, a hashtag that
+    fails part way through is retried after its last saved batch. Once a
+    hashtag is done, `on_result` is called with it and the number of posts
+    fetched for it. Both run in a worker thread, one at a time, so that
+    other hashtags keep being fetched meanwhile. If `known_ids` is
+    specified, it is called with each hashtag when a session is free to
+    scrape it, to get the IDs of its posts at which to stop early. Returns
+    the data of each hashtag that wasn't passed to `on_batch`, and the list
+    of hashtags that failed."""
+
+    results: Dict[str, List[Dict]] = {}
+    failed: List[str] = []
+    merging = asyncio.Lock()
+
+    async def save_batch(hashtag: str, batch: List[Dict]):
+        if on_batch is None:
+            results.setdefault(hashtag, []).extend(batch)
+            return
+        async with merging:
+            await asyncio.to_thread(on_batch, hashtag, batch)
+
+    async with SessionPool(
+        num_sessions=num_sessions,
+        headed=headed,
+        api_factory=api_factory,
+        metrics=metrics,
+    ) as pool:
 
-def json_load(file_path: Path) -> List:
-    """Read a JSON file and return the read data."""
-    with open(file_path, "r", encoding="utf-8") as f:
-        data = json.load(fp=f)
-    return data
+        async def scrape(hashtag: str):
+            fetched = 0
 
+            async def save(batch: List[Dict]):
+                nonlocal fetched
+                await save_batch(hashtag, batch)
+                fetched += len(batch)
 
-def json_dump(file_path: Path, data: List):
-    """Write data to a JSON file."""
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(obj=data, fp=f)
+            try:
+                async for attempt in AsyncRetrying(
+                    stop=stop_after_attempt(retries),
+                    wait=wait_exponential(multiplier=1, max=10),
+                    before_sleep=record_retry("fetch"),
+                ):
+                    with attempt:
+                        if checkpoints is None:
+                            # Each attempt starts the scrape over
+                            fetched = 0
+                            results.pop(hashtag, None)
+                        await pool.fetch(
+                            hashtag=hashtag,
+                            limit=limit,
+                            on_batch=save,
+                            known_ids=known_ids,
+                            stop_after_known=stop_after_known,
+                            checkpoints=checkpoints,
+                            batch_size=batch_size,
+                        )
+            except RetryError as e:
+                logger.warning(
+                    f"Encountered error {e.last_attempt.exception()} when "
+                    f"fetching data for hashtag '{hashtag}', giving up after "
+                    f"{retries} attempts"
+                )
+                failed.append(hashtag)
+                return
+            if on_result is not None:
+                async with merging:
+                    await asyncio.to_thread(on_result, hashtag, fetched)
 
+        await asyncio.gather(*(scrape(hashtag) for hashtag in hashtags))
 
-@retry(wait=wait_exponential(multiplier=1, max=10))
-def _get(url: str) -> requests.Response:
-    """Safe version of requests.get that can handle timeouts and retries"""
+    return results, failed
 
-    r = requests.get(url=url, timeout=30)
-    if r.status_code not in {200, 403}:
-        raise TryAgain
-    else:
-        return r
 
+async def _watch_hashtags(
+    scheduler: ScrapeScheduler,
+    limit: int,
+    on_batch: Callable[[str, List[Dict]], None],
+    on_result: Callable[[str, int], Tuple[int, int]],
+    headed: bool = False,
+    num_sessions: int = 1,
+    api_factory: Callable = _tiktok_api,
+    max_scrapes: Optional[int] = None,
+    metrics: Optional[RunMetrics] = None,
+    known_ids: Optional[Callable[[str], Optional[Set[str]]]] = None,
+    stop_after_known: int = 0,
+    checkpoints: Optional[ScrapeCheckpoints] = None,
+    batch_size: int = BATCH_SIZE,
+):
+    """Scrape hashtags whenever they are due according to a schedule, on a
+    pool of `num_sessions` browser sessions that is kept open throughout.
 
-def download_file_and_save(url: str, filepath: Path):
-    """Download a file from a specified URL and write its contents to a file"""
+    `on_batch` is called with each hashtag and each batch of its posts, and
+    `on_result` with each hashtag and the number of posts fetched once it is
+    done, returning the number of new and old posts, which the schedule
+    adapts to. They run as in `_fetch_hashtags_concurrently`, and a hashtag
+    whose data they fail to save is retried like one that failed to be
+    fetched. Runs until `max_scrapes` hashtags have been scraped, or
+    indefinitely. Scrapes stop early and save checkpoints as in
+    `_fetch_hashtags_concurrently`."""
 
-    r = _get(url=url)
-    if r.status_code == 403:
-        return
-    ext = r.headers["Content-Type"].split("/")[-1]
-    path_with_ext = filepath.with_suffix(f".{ext}")
-    with open(path_with_ext, "wb") as f:
-        f.write(r.content)
-        logger.debug(f"Saved file to: {path_with_ext}")
+    scrapes = 0
+    merging = asyncio.Lock()
 
+    async def save_batch(hashtag: str, batch: List[Dict]):
+        async with merging:
+            await asyncio.to_thread(on_batch, hashtag, batch)
 
-def download_gallery(video_data: Dict, video_dir: Path):
-    """yt-dlp doesn't support downloading images from an image gallery,
-    so this downloads all images and audio files from image galleries."""
+    async with SessionPool(
+        num_sessions=num_sessions,
+        headed=headed,
+        api_factory=api_factory,
+        metrics=metrics,
+    ) as pool:
 
-    video_id = video_data["id"]
-    # A small percentage of image galleries don't have an associated audio file
-    if play_url := video_data["music"]["playUrl"]:
-        filepath = video_dir / f"{video_id}"
-        download_file_and_save(url=play_url, filepath=filepath)
+        async def watch():
+            nonlocal scrapes
+            while max_scrapes is None or scrapes < max_scrapes:
+                scrapes += 1
+                hashtag, next_due = scheduler.pop()
+                delay = next_due - scheduler.clock()
+                if delay > 0:
+                    logger.debug(f"Waiting {delay:.0f}s to scrape hashtag '{hashtag}'")
+                    await asyncio.sleep(delay)
+                try:
+                    with nullcontext() if metrics is None else metrics.stage("fetch"):
+                        fetched = await pool.fetch(
+                            hashtag=hashtag,
+                            limit=limit,
+                            on_batch=partial(save_batch, hashtag),
+                            known_ids=known_ids,
+                            stop_after_known=stop_after_known,
+                            checkpoints=checkpoints,
+                            batch_size=batch_size,
+                        )
+                except Exception as e:
+                    logger.warning(
+                        f"Encountered error {e} when fetching data for hashtag "
+                        f"'{hashtag}'"
+                    )
+                    scheduler.record_failure(hashtag)
+                else:
+                    if metrics is not None:
+                        metrics.count("fetch", posts=fetched, items=1)
+                    try:
+                        async with merging:
+                            new_post_count, _ = await asyncio.to_thread(
+                                on_result, hashtag, fetched
+                            )
+                    except Exception as e:
+                        logger.exception(
+                            f"Encountered error {e} when saving data for hashtag "
+                            f"'{hashtag}'"
+                        )
+                        scheduler.record_failure(hashtag)
+                    else:
+                        scheduler.record(hashtag, fetched=fetched, new=new_post_count)
+                scheduler.save()
+
+        # Each watcher holds at most one hashtag at a time, so there is always
+        # a hashtag left on the schedule for the others
+        watchers = max(1, min(num_sessions, len(scheduler)))
+        await asyncio.gather(*(watch() for _ in range(watchers)))
+
+
+async def _crawl_hashtags(
+    frontier: CrawlFrontier,
+    limit: int,
+    on_batch: Callable[[str, List[Dict]], None],
+    on_result: Callable[[str, int], Counter],
+    headed: bool = False,
+    num_sessions: int = 1,
+    retries: int = 3,
+    api_factory: Callable = _tiktok_api,
+    metrics: Optional[RunMetrics] = None,
+    known_ids: Optional[Callable[[str], Optional[Set[str]]]] = None,
+    stop_after_known: int = 0,
+    checkpoints: Optional[ScrapeCheckpoints] = None,
+    batch_size: int = BATCH_SIZE,
+):
+    """Crawl hashtags from a frontier on a pool of `num_sessions` browser
+    sessions, until the frontier is empty or its budget is used up.
+
+    `on_batch` is called with each hashtag and each batch of its posts, and
+    `on_result` with each hashtag and the number of posts fetched once it is
+    done, returning the counts of the hashtags co-occurring with it, which
+    are added to the frontier. They run as in
+    `_fetch_hashtags_concurrently`, and a hashtag whose data they fail to
+    save counts as failed. Each hashtag is attempted up to `retries` times,
+    and scrapes stop early and save checkpoints as in
+    `_fetch_hashtags_concurrently`. The frontier is saved after each
+    hashtag."""
 
-    for i, image in enumerate(video_data["imagePost"]["images"]):
-        image_url = image["imageURL"]["urlList"][0]
-        filepath = video_dir / f"{video_id}_{i:02d}"
-        download_file_and_save(url=image_url, filepath=filepath)
+    in_flight = 0
+    merging = asyncio.Lock()
+    changed = asyncio.Condition()
+
+    async def save_batch(hashtag: str, batch: List[Dict]):
+        async with merging:
+            await asyncio.to_thread(on_batch, hashtag, batch)
+
+    async with SessionPool(
+        num_sessions=num_sessions,
+        headed=headed,
+        api_factory=api_factory,
+        metrics=metrics,
+    ) as pool:
+
+        async def crawl():
+            nonlocal in_flight
+            while True:
+                # Wait for a hashtag to be added to the frontier, unless no
+                # other hashtags are being crawled that could add one
+                async with changed:
+                    await changed.wait_for(lambda: frontier.ready() or in_flight == 0)
+                    popped = frontier.pop()
+                    if popped is None:
+                        return
+                    in_flight += 1
+                hashtag, depth = popped
+                logger.info(f"Crawling hashtag '{hashtag}' at depth {depth}")
+                fetched = 0
+
+                async def save(batch: List[Dict]):
+                    nonlocal fetched
+                    await save_batch(hashtag, batch)
+                    fetched += len(batch)
+
+                try:
+                    with nullcontext() if metrics is None else metrics.stage("fetch"):
+                        async for attempt in AsyncRetrying(
+                            stop=stop_after_attempt(retries),
+                            wait=wait_exponential(multiplier=1, max=10),
+                            before_sleep=record_retry("fetch"),
+                        ):
+                            with attempt:
+                                if checkpoints is None:
+                                    # Each attempt starts the scrape over
+                                    fetched = 0
+                                await pool.fetch(
+                                    hashtag=hashtag,
+                                    limit=limit,
+                                    on_batch=save,
+                                    known_ids=known_ids,
+                                    stop_after_known=stop_after_known,
+                                    checkpoints=checkpoints,
+                                    batch_size=batch_size,
+                                )
+                except RetryError as e:
+                    logger.warning(
+                        f"Encountered error {e.last_attempt.exception()} when "
+                        f"crawling hashtag '{hashtag}', giving up after {retries} "
+                        f"attempts"
+                    )
+                    frontier.record_failure(hashtag)
+                else:
+                    if metrics is not None:
+                        metrics.count("fetch", posts=fetched, items=1)
+                    try:
+                        async with merging:
+                            cooccurrences = await asyncio.to_thread(
+                                on_result, hashtag, fetched
+                            )
+                    except Exception as e:
+                        logger.exception(
+                            f"Encountered error {e} when saving data for hashtag "
+                            f"'{hashtag}'"
+                        )
+                        frontier.record_failure(hashtag)
+                    else:
+                        frontier.record(
+                            hashtag, fetched=fetched, cooccurrences=cooccurrences
+                        )
+                finally:
+                    frontier.save()
+                    async with changed:
+                        in_flight -= 1
+                        changed.notify_all()
+
+        await asyncio.gather(*(crawl() for _ in range(max(1, num_sessions))))
 
 
 def aggregate_cooccurring_hashtags(hashtag_file: Path) -> Counter:
     """Aggregate how frequently hashtags are used, from a file containing a
-    list of raw TikTok post API responses."""
-    videos = json_load(file_path=hashtag_file)
+    list of raw TikTok post API responses. Posts are read one at a time, so
+    memory use doesn't grow with the size of the file."""
+    videos = json_iter(file_path=hashtag_file, fields=["textExtra"])
 
-    all_hashtags: List[set] = []
+    all_hashtags: List[str] = []
     for video in videos:
-        video_hashtags = set(
-            hashtag["hashtagName"]
-            for hashtag in video.get("textExtra", [])
-            if hashtag.get("hashtagName")
-        )
-        all_hashtags.extend(video_hashtags)
+        all_hashtags.extend(video_hashtags(video))
 
     return Counter(all_hashtags)
 
@@ -140,13 +566,60 @@ class TikTokDownloader:
     """Main class for scraping data from TikTok."""
 
     def __init__(
-        self, hashtags: List[str], data_dir: Path, config_file: Optional[str] = None
+        self,
+        hashtags: List[str],
+        data_dir: Path,
+        config_file: Optional[str] = None,
+        api_factory: Callable = _tiktok_api,
+        store: str = "json",
+        database: Optional[Path] = None,
+        shared_media: bool = False,
+        verify_media: bool = False,
+        profile_dir: Optional[Path] = None,
+        stop_after_known: Optional[int] = None,
+        full_refresh: Optional[float] = None,
+        worker: bool = False,
+        lease_ttl: float = LEASE_TTL,
+        batch_size: int = BATCH_SIZE,
     ):
         self.hashtags = process_hashtag_list(hashtags)
+        self.api_factory = api_factory
+        self.store = store
+        self.shared_media = shared_media
+        self.verify_media = verify_media
 
         self.data_dir = Path(data_dir)
         os.makedirs(self.data_dir, exist_ok=True)
 
+        # Optionally index all scraped posts in a single SQLite database
+        self.database = (
+            None if database is None else PostDatabase(path=database, shared=worker)
+        )
+        # Record of the media downloaded, or failed to download, for each post
+        self.manifest_file = self.data_dir / MANIFEST_FILE
+        # Time and throughput of each stage, optionally profiled
+        self.metrics = RunMetrics(profile_dir=profile_dir)
+        # Optionally stop scraping hashtags once previously scraped posts are
+        # reached, apart from a full scrape every `full_refresh` seconds
+        self.incremental = None
+        if stop_after_known is not None:
+            self.incremental = IncrementalScrapes(
+                stop_after_known=stop_after_known,
+                state_file=self.data_dir / FULL_SCRAPES_FILE,
+                full_refresh=full_refresh,
+            )
+        # Posts are saved in batches while a hashtag is scraped, and the
+        # progress of each scrape is saved so that it can be resumed
+        self.batch_size = batch_size
+        self.checkpoints = ScrapeCheckpoints(
+            state_file=self.data_dir / CHECKPOINTS_FILE
+        )
+        # Optionally share the hashtags with other workers using the same
+        # data directory, leasing each hashtag before scraping it
+        self.leases = None
+        if worker:
+            self.leases = LeaseManager(data_dir=self.data_dir, ttl=lease_ttl)
+
         self.prioritize_hashtags()
         logger.info(f"Hashtags to scrape: {self.hashtags}")
         logger.info(f"Writing data to directory: {self.data_dir}")
@@ -156,125 +629,644 @@ class TikTokDownloader:
         the time they were most recently scraped"""
 
         last_edited = {
-            file.parts[-2]: file.lstat().st_mtime
-            for file in self.data_dir.glob("*/posts.json")
+            hashtag: open_store(hashtag_dir=self.data_dir / hashtag).last_modified()
+            for hashtag in self.hashtags
         }
         self.hashtags.sort(key=lambda h: last_edited.get(h, 0))
 
+    def get_store(self, hashtag: str) -> PostStore:
+        """Open the store of posts scraped for a specified hashtag."""
+        return open_store(hashtag_dir=self.data_dir / hashtag, backend=self.store)
+
+    def claim_hashtags(self, hashtags: List[str], since: float) -> Iterable[str]:
+        """Lease the hashtags that no other worker is scraping, one at a
+        time, skipping hashtags that another worker has already scraped
+        since `since`."""
+
+        if self.leases is None:
+            yield from hashtags
+            return
+        for hashtag in self.leases.claim(hashtags):
+            if self.get_store(hashtag).last_modified() >= since:
+                logger.info(
+                    f"Skipping '{hashtag}', which was just scraped by another worker"
+                )
+                self.leases.release(hashtag)
+                continue
+            yield hashtag
+
+    def known_post_ids(self, hashtag: str) -> Optional[Set[str]]:
+        """Return the IDs of previously scraped posts at which a scrape of a
+        specified hashtag can stop, or None if it should be scraped in full."""
+        if self.incremental is None:
+            return None
+        return self.incremental.known_ids(hashtag, store=self.get_store(hashtag))
+
+    @property
+    def stop_after_known(self) -> int:
+        return 0 if self.incremental is None else self.incremental.stop_after_known
+
     def get_hashtag_posts(self, hashtag: str, limit: int, headed: bool):
         """Fetch data about posts that used a specified hashtag and merge with
-        existing data, if it exists."""
+        existing data, if it exists. Posts are saved in batches as they are
+        fetched (see `save_batch`), so that they are kept even if the scrape
+        fails part way through, and a failed scrape resumes after the last
+        saved batch."""
 
-        # Define file to store hashtags in and create parent directory
-        hashtag_file = self.data_dir / hashtag / "posts.json"
-        hashtag_file.parent.mkdir(exist_ok=True, parents=True)
+        known_ids = self.known_post_ids(hashtag)
+        # Number of new and previously scraped posts of each merged batch
+        counts: List[Tuple[int, int]] = []
+        fetched = 0
 
-        # If there are previously scraped posts, load them
-        if hashtag_file.is_file():
-            already_fetched_data = json_load(file_path=hashtag_file)
-        else:
-            already_fetched_data = []
-        already_fetched_ids = set(video["id"] for video in already_fetched_data)
+        def on_batch(batch: List[Dict]):
+            nonlocal fetched
+            fetched += len(batch)
+            merged = self.save_batch(hashtag=hashtag, posts=batch)
+            if merged is not None:
+                counts.append(merged)
 
-        # Scrape posts that use the specified hashag
-        # Attempt to be robust against TikTok's countermeasures for headless browsing
-        try:
-            fetched_data = asyncio.run(
-                _fetch_hashtag_data(hashtag=hashtag, limit=limit, headed=headed)
+        def fetch(headed: bool):
+            asyncio.run(
+                _fetch_hashtag_data(
+                    hashtag=hashtag,
+                    limit=limit,
+                    on_batch=on_batch,
+                    headed=headed,
+                    api_factory=self.api_factory,
+                    metrics=self.metrics,
+                    known_ids=known_ids,
+                    stop_after_known=self.stop_after_known,
+                    checkpoints=self.checkpoints,
+                    batch_size=self.batch_size,
+                )
             )
-        except Exception as e:
+
+        # Scrape posts that use the specified hashag, merging them as they are
+        # fetched, so the time spent merging is included in the time spent
+        # fetching. Attempt to be robust against TikTok's countermeasures for
+        # headless browsing
+        with self.metrics.stage("fetch"):
+            try:
+                fetch(headed=headed)
+            except Exception as e:
+                logger.warning(
+                    f"Encountered error {e} when fetching data, retrying in headed mode"
+                )
+                fetch(headed=True)
+            self.finish_scrape(hashtag=hashtag, fetched=fetched, counts=counts)
+        self.metrics.count("fetch", posts=fetched, items=1)
+
+    def get_hashtags_posts_concurrently(
+        self,
+        hashtags: List[str],
+        limit: int,
+        headed: bool,
+        sessions: int,
+        retries: int = 3,
+    ) -> List[str]:
+        """Fetch data about posts for many hashtags concurrently, sharing a
+        pool of `sessions` browser sessions, and save each hashtag's posts in
+        batches as they are fetched, as in `get_hashtag_posts`. Returns the
+        hashtags that could not be scraped."""
+
+        on_batch, finish_scrape = self.scrape_savers()
+
+        def on_result(hashtag: str, fetched: int):
+            self.metrics.count("fetch", posts=fetched, items=1)
+            finish_scrape(hashtag, fetched)
+
+        def fetch(hashtags: List[str], headed: bool) -> List[str]:
+            # Posts are merged as each hashtag is fetched, so the time spent
+            # merging is included in the time spent fetching
+            with self.metrics.stage("fetch"):
+                _, failed = asyncio.run(
+                    _fetch_hashtags_concurrently(
+                        hashtags=hashtags,
+                        limit=limit,
+                        headed=headed,
+                        num_sessions=sessions,
+                        retries=retries,
+                        on_batch=on_batch,
+                        on_result=on_result,
+                        api_factory=self.api_factory,
+                        metrics=self.metrics,
+                        known_ids=self.known_post_ids,
+                        stop_after_known=self.stop_after_known,
+                        checkpoints=self.checkpoints,
+                        batch_size=self.batch_size,
+                    )
+                )
+            return failed
+
+        # Attempt to be robust against TikTok's countermeasures for headless browsing
+        failed = fetch(hashtags=hashtags, headed=headed)
+        if failed and not headed:
             logger.warning(
-                f"Encountered error {e} when fetching data, retrying in headed mode"
+                f"Failed to fetch data for hashtags {failed}, retrying in headed mode"
             )
-            fetched_data = asyncio.run(
-                _fetch_hashtag_data(hashtag=hashtag, limit=limit, headed=True)
+            failed = fetch(hashtags=failed, headed=True)
+        if failed:
+            logger.warning(f"Could not fetch data for hashtags: {failed}")
+        return failed
+
+    def watch(
+        self,
+        limit: int,
+        headed: bool,
+        sessions: int = 1,
+        min_interval: float = MIN_INTERVAL,
+        max_interval: float = MAX_INTERVAL,
+        max_scrapes: Optional[int] = None,
+    ):
+        """Keep scraping all hashtags on an adaptive schedule, reusing a pool
+        of `sessions` browser sessions, until interrupted (or until
+        `max_scrapes` hashtags have been scraped). Intervals are in seconds,
+        and the schedule is saved in the data directory after each scrape."""
+
+        scheduler = ScrapeScheduler(
+            hashtags=self.hashtags,
+            state_file=self.data_dir / SCHEDULE_FILE,
+            min_interval=min_interval,
+            max_interval=max_interval,
+        )
+        logger.info(f"Watching {len(self.hashtags)} hashtags")
+        on_batch, on_result = self.scrape_savers()
+        asyncio.run(
+            _watch_hashtags(
+                scheduler=scheduler,
+                limit=limit,
+                on_batch=on_batch,
+                on_result=on_result,
+                headed=headed,
+                num_sessions=sessions,
+                api_factory=self.api_factory,
+                max_scrapes=max_scrapes,
+                metrics=self.metrics,
+                known_ids=self.known_post_ids,
+                stop_after_known=self.stop_after_known,
+                checkpoints=self.checkpoints,
+                batch_size=self.batch_size,
             )
+        )
 
-        fetched_ids = set(video["id"] for video in fetched_data)
+    def crawl(
+        self,
+        limit: int,
+        headed: bool,
+        sessions: int = 1,
+        retries: int = 3,
+        max_depth: int = MAX_DEPTH,
+        max_hashtags: int = MAX_HASHTAGS,
+        max_posts: Optional[int] = None,
+        expand: int = EXPAND,
+        min_cooccurrences: int = 1,
+    ) -> List[str]:
+        """Crawl the hashtags that co-occur with the specified hashtags, as
+        seeds, following the most often co-occurring hashtags of each
+        crawled hashtag (see `CrawlFrontier`). Hashtags are scraped
+        concurrently on a pool of `sessions` browser sessions.
 
-        if len(fetched_data) == 0:
-            logger.warning(f"No posts were found for the hashtag: {hashtag}")
+        The state of the crawl is saved in the data directory, so that an
+        interrupted crawl resumes where it stopped when run again. Returns
+        the crawled hashtags, which are also written to a text file that
+        can be passed to `--file`."""
 
-        # Determine which newly scraped posts haven't been scraped before
-        old_fetched_data = [
-            video for video in already_fetched_data if video["id"] not in fetched_ids
-        ]
-        new_post_count = len(fetched_ids - already_fetched_ids)
-        old_post_count = len(already_fetched_ids)
+        frontier = CrawlFrontier(
+            seeds=self.hashtags,
+            state_file=self.data_dir / CRAWL_FILE,
+            max_depth=max_depth,
+            max_hashtags=max_hashtags,
+            max_posts=max_posts,
+            expand=expand,
+            min_cooccurrences=min_cooccurrences,
+        )
+        # Continue from the hashtags at the maximum depth of an earlier crawl,
+        # if the maximum depth was raised
+        for hashtag in frontier.unexpanded():
+            frontier.expand_hashtag(hashtag, cooccurrences=self.cooccurrences(hashtag))
+
+        on_batch, finish_scrape = self.scrape_savers()
+
+        def on_result(hashtag: str, fetched: int) -> Counter:
+            finish_scrape(hashtag, fetched)
+            return self.cooccurrences(hashtag)
+
+        asyncio.run(
+            _crawl_hashtags(
+                frontier=frontier,
+                limit=limit,
+                on_batch=on_batch,
+                on_result=on_result,
+                headed=headed,
+                num_sessions=sessions,
+                retries=retries,
+                api_factory=self.api_factory,
+                metrics=self.metrics,
+                known_ids=self.known_post_ids,
+                stop_after_known=self.stop_after_known,
+                checkpoints=self.checkpoints,
+                batch_size=self.batch_size,
+            )
+        )
+        crawled = frontier.crawled()
+        hashtags_file = self.data_dir / CRAWL_HASHTAGS_FILE
+        frontier.export_hashtags(hashtags_file)
+        logger.info(
+            f"Crawled {len(crawled)} hashtags with {frontier.posts} posts, "
+            f"{len(frontier)} hashtags left in the frontier. Crawled hashtags "
+            f"saved to file: {hashtags_file}"
+        )
+        return crawled
+
+    def save_hashtag_posts(
+        self, hashtag: str, fetched_data: List[Dict]
+    ) -> Tuple[int, int]:
+        """Merge freshly fetched posts for a specified hashtag with existing
+        data, if it exists, and write the result to file. Returns the number
+        of new and previously scraped posts."""
+
+        counts = [self.merge_hashtag_posts(hashtag=hashtag, posts=fetched_data)]
+        return self.finish_scrape(
+            hashtag=hashtag, fetched=len(fetched_data), counts=counts
+        )
 
-        # Merge new and old data and write to file
-        all_fetched_data = old_fetched_data + fetched_data
-        json_dump(file_path=hashtag_file, data=all_fetched_data)
+    def save_batch(self, hashtag: str, posts: List[Dict]) -> Optional[Tuple[int, int]]:
+        """Save a batch of posts fetched by an unfinished scrape of a specified
+        hashtag. Stores that posts are appended to merge each batch as it is
+        fetched, returning the number of new and previously scraped posts.
+        The JSON store is rewritten along with its caches whenever posts are
+        merged, so its batches are added to the hashtag's pending posts
+        instead, to be merged when the scrape finishes."""
+
+        if isinstance(self.get_store(hashtag), JsonPostStore):
+            PendingPosts(hashtag_dir=self.data_dir / hashtag).append(posts)
+            return None
+        return self.merge_hashtag_posts(hashtag=hashtag, posts=posts)
+
+    def scrape_savers(
+        self,
+    ) -> Tuple[
+        Callable[[str, List[Dict]], None], Callable[[str, int], Tuple[int, int]]
+    ]:
+        """Return a function that saves a batch of posts fetched for a
+        hashtag, and a function that finishes a hashtag's scrape given the
+        number of posts fetched, for scraping many hashtags at once (see
+        `save_batch` and `finish_scrape`)."""
+
+        # Number of new and previously scraped posts of each merged batch of
+        # each hashtag being scraped
+        counts: Dict[str, List[Tuple[int, int]]] = {}
+
+        def on_batch(hashtag: str, posts: List[Dict]):
+            merged = self.save_batch(hashtag=hashtag, posts=posts)
+            if merged is not None:
+                counts.setdefault(hashtag, []).append(merged)
+
+        def on_result(hashtag: str, fetched: int) -> Tuple[int, int]:
+            return self.finish_scrape(
+                hashtag=hashtag, fetched=fetched, counts=counts.pop(hashtag, [])
+            )
+
+        return on_batch, on_result
+
+    def finish_scrape(
+        self, hashtag: str, fetched: int, counts: List[Tuple[int, int]]
+    ) -> Tuple[int, int]:
+        """Merge the pending posts of a specified hashtag, including any left
+        by a scrape that crashed, and record that its scrape has finished.
+        `counts` are the number of new and previously scraped posts of each
+        batch merged by `save_batch`. Returns the number of new posts, and
+        the number of posts stored before the scrape."""
+
+        pending = PendingPosts(hashtag_dir=self.data_dir / hashtag)
+        if pending.exists() or not counts:
+            counts.append(
+                self.merge_hashtag_posts(hashtag=hashtag, posts=pending.load())
+            )
+            pending.clear()
+        new_post_count = sum(new for new, _ in counts)
+        old_post_count = counts[0][1]
+        self.record_scrape(
+            hashtag=hashtag,
+            fetched=fetched,
+            new_post_count=new_post_count,
+            old_post_count=old_post_count,
+        )
+        return new_post_count, old_post_count
+
+    def merge_hashtag_posts(self, hashtag: str, posts: List[Dict]) -> Tuple[int, int]:
+        """Merge fetched posts for a specified hashtag into its store, and
+        keep its caches and the database up to date. Returns the number of
+        new posts, and the number of posts stored before merging."""
+
+        with self.metrics.stage("merge"):
+            # Merge new and old data and write to the store
+            store = self.get_store(hashtag)
+            previous_signature = store.signature()
+            new_post_count, old_post_count = store.merge(posts=posts)
+
+            # Keep the snapshot and cached co-occurrence counts up to date
+            # with the merged posts
+            PostSnapshot(store=store).update(
+                posts=posts, previous_signature=previous_signature
+            )
+            CooccurrenceCounter(store=store).update(
+                posts=posts, previous_signature=previous_signature
+            )
+            if self.database is not None:
+                self.database.add_posts(posts=posts, hashtag=hashtag)
+        self.metrics.count("merge", posts=len(posts), items=1)
+        return new_post_count, old_post_count
+
+    def record_scrape(
+        self, hashtag: str, fetched: int, new_post_count: int, old_post_count: int
+    ):
+        """Record that all posts fetched for a hashtag have been saved."""
+
+        if fetched == 0:
+            logger.warning(f"No posts were found for the hashtag: {hashtag}")
+        if self.incremental is not None:
+            self.incremental.record(hashtag)
         logger.info(
             f"Scraped {new_post_count} new posts containing the hashtag "
             f"'{hashtag}', with {old_post_count} posts previously scraped"
         )
 
-    def get_hashtag_videos(self, hashtag: str):
-        """Download videos and other media corresponding to posts that used a
-        specified hashtag,"""
+    def get_pending_media(self, hashtag: str) -> List[Dict]:
+        """List the posts that used a specified hashtag and have been scraped
+        but not had their media downloaded."""
 
-        # Define file containing post data and directory to save videos to
-        hashtag_file = self.data_dir / hashtag / "posts.json"
+        # Define directory to save videos to
         video_dir = self.data_dir / hashtag / "media"
         video_dir.mkdir(exist_ok=True)
+        key = self.media_key(video_dir)
+
+        # Get list of post IDs that have previously had their media downloaded,
+        # or recently failed to download, from the download manifest. Media
+        # downloaded before the manifest was used is recorded in it first.
+        with self.metrics.stage("pending_media"):
+            with self.open_manifest() as manifest:
+                manifest.adopt_directory(directory=key, media_dir=video_dir)
+                skipped_ids = manifest.skipped_ids(directory=key)
+                if self.shared_media:
+                    skipped_ids |= manifest.backed_off_ids(directory=MEDIA_STORE_DIR)
+            pending = [
+                video
+                for video in self.get_store(hashtag).iter_posts()
+                if video["id"] not in skipped_ids
+            ]
+        self.metrics.count("pending_media", posts=len(pending), items=1)
+        return pending
+
+    def open_manifest(self) -> DownloadManifest:
+        """Open the download manifest, which is shared with workers on other
+        hosts when running as one of several workers."""
+        return DownloadManifest(path=self.manifest_file, shared=self.leases is not None)
+
+    def media_key(self, media_dir: Path) -> str:
+        """Identify a media folder in the download manifest by its path
+        relative to the data directory."""
+        return Path(media_dir).relative_to(self.data_dir).as_posix()
 
-        # Get list of post IDs that have previously had their media downloaded
-        already_downloaded_ids = set(
-            file.split(".")[0].split("_")[0] for file in os.listdir(video_dir)
+    def get_media_jobs(self, hashtag: str) -> List[DownloadJob]:
+        """List the media downloads that are pending for posts that used a
+        specified hashtag."""
+
+        # Videos are downloaded using yt-dlp, while the audio and image files
+        # of image galleries are downloaded directly
+        video_dir = self.data_dir / hashtag / "media"
+        jobs = []
+        no_media = []
+        for video in self.get_pending_media(hashtag=hashtag):
+            post_jobs = video_jobs(video_data=video, video_dir=video_dir)
+            if len(post_jobs) == 0:
+                no_media.append(video["id"])
+            jobs.extend(post_jobs)
+        self.record_no_media({post_id: [video_dir] for post_id in no_media})
+        return jobs
+
+    def record_no_media(self, media_dirs: Dict[str, List[Path]]):
+        """Record posts that have no media to download as skipped in the
+        download manifest, for each of their media folders, so that they
+        aren't listed as pending on every run."""
+
+        if len(media_dirs) == 0:
+            return
+        with self.open_manifest() as manifest:
+            for post_id, dirs in media_dirs.items():
+                for media_dir in dirs:
+                    manifest.record_skipped(
+                        directory=self.media_key(media_dir),
+                        post_id=post_id,
+                        reason=NO_MEDIA,
+                    )
+            manifest.commit()
+        logger.debug(f"Skipped {len(media_dirs)} posts without media to download")
+
+    def get_hashtag_videos(
+        self, hashtag: str, workers: int = 4, rate_limit: Optional[float] = None
+    ) -> DownloadProgress:
+        """Download videos and other media corresponding to posts that used a
+        specified hashtag,"""
+
+        return self.get_hashtags_videos(
+            hashtags=[hashtag], workers=workers, rate_limit=rate_limit
         )
-        # Get list of posts that have been scraped but not had their media downloaded
-        video_list = json_load(file_path=hashtag_file)
-        new_video_list = [
-            video for video in video_list if video["id"] not in already_downloaded_ids
-        ]
 
-        # Populate list of URLs to download using yt-dlp, and list of image
-        # galleries to download using the `download_gallery` function
-        urls_to_download = []
-        galleries_to_download = []
-        for video in new_video_list:
-            if video.get("imagePost") is None:
-                if video.get("author") is None:
-                    continue
-                url = f"https://www.tiktok.com/@{video['author']['uniqueId']}/video/{video['id']}"
-                urls_to_download.append(url)
+    def get_hashtags_videos(
+        self,
+        hashtags: List[str],
+        workers: int = 4,
+        rate_limit: Optional[float] = None,
+    ) -> DownloadProgress:
+        """Download videos and other media corresponding to posts that used
+        any of the specified hashtags, using `workers` parallel downloads and
+        at most `rate_limit` requests per second to each host."""
+
+        if self.shared_media:
+            return self.get_shared_videos(
+                hashtags=hashtags, workers=workers, rate_limit=rate_limit
+            )
+
+        jobs = []
+        for hashtag in hashtags:
+            hashtag_jobs = self.get_media_jobs(hashtag=hashtag)
+            if len(hashtag_jobs) > 0:
+                logger.info(
+                    f"Downloading {len(hashtag_jobs)} media files for hashtag {hashtag}"
+                )
+            jobs.extend(hashtag_jobs)
+        return self.download_jobs(jobs=jobs, workers=workers, rate_limit=rate_limit)
+
+    def get_shared_videos(
+        self,
+        hashtags: List[str],
+        workers: int = 4,
+        rate_limit: Optional[float] = None,
+    ) -> DownloadProgress:
+        """Like `get_hashtags_videos`, but download the media of each post
+        only once, into the media store shared by all hashtags, and link the
+        stored files into each hashtag's `media` folder. Media that is
+        already stored, or was downloaded for another hashtag before the
+        store was used, is reused without any network requests."""
+
+        media_store = MediaStore(
+            root=self.data_dir / MEDIA_STORE_DIR, verify=self.verify_media
+        )
+        pending: Dict[str, Dict] = {}
+        media_dirs: Dict[str, List[Path]] = {}
+        for hashtag in hashtags:
+            media_dir = self.data_dir / hashtag / "media"
+            for video in self.get_pending_media(hashtag=hashtag):
+                pending[video["id"]] = video
+                media_dirs.setdefault(video["id"], []).append(media_dir)
+            media_store.adopt(media_dir=media_dir)
+
+        jobs = []
+        reused = 0
+        downloading = set()
+        no_media = {}
+        for post_id, video in pending.items():
+            post_jobs = video_jobs(video_data=video, video_dir=media_store.root)
+            if len(post_jobs) == 0:
+                no_media[post_id] = media_dirs.pop(post_id)
+            elif media_store.has(post_id, expected=len(post_jobs)):
+                reused += 1
             else:
-                galleries_to_download.append(video)
-
-        # Download audio and image files for all image gallery posts
-        if len(galleries_to_download) > 0:
-            logger.info(f"Downloading image galleries for hashtag {hashtag}")
-        for video in galleries_to_download:
-            logger.debug(f"Downloading image gallery for video: {video['id']}")
-            download_gallery(video_data=video, video_dir=video_dir)
-
-        # Download video files for all video posts
-        if len(urls_to_download) > 0:
-            logger.info(f"Downloading media for hashtag {hashtag}")
-
-        ydl_opts = {
-            "outtmpl": os.path.join(video_dir, "%(id)s.%(ext)s"),
-            "ignore_errors": True,
-            "quiet": logger.getEffectiveLevel() > logging.DEBUG,
-        }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            for url in urls_to_download:
-                try:
-                    ydl.download([url])
-                except (HTTPError, TypeError, ExtractorError, DownloadError) as e:
-                    # Catch urllib and yt-dlp errors when video not found
-                    logger.warning(
-                        f"Encountered error {e} when attempting to download url: {url}"
+                downloading.add(post_id)
+                jobs.extend(post_jobs)
+        if len(pending) > 0:
+            logger.info(
+                f"Downloading {len(jobs)} media files for hashtags {hashtags}, "
+                f"reusing stored media for {reused} posts"
+            )
+        self.record_no_media(no_media)
+        progress = self.download_jobs(jobs=jobs, workers=workers, rate_limit=rate_limit)
+
+        media_store.refresh()
+        store_key = self.media_key(media_store.root)
+        with self.open_manifest() as manifest:
+            for post_id, dirs in media_dirs.items():
+                if post_id in downloading:
+                    # Posts with any file that failed to download aren't
+                    # linked, as their stored files are incomplete
+                    entry = manifest.entry(directory=store_key, post_id=post_id)
+                    if entry is None:
+                        continue
+                    if entry["status"] != DOWNLOADED:
+                        for media_dir in dirs:
+                            manifest.record_failure(
+                                directory=self.media_key(media_dir),
+                                post_id=post_id,
+                                error=entry["last_error"],
+                            )
+                        continue
+                files = sorted(media_store.files.get(post_id, []))
+                if not files:
+                    continue
+                nbytes = sum(os.path.getsize(media_store.root / f) for f in files)
+                for media_dir in dirs:
+                    media_store.link(post_id=post_id, media_dir=media_dir)
+                    manifest.record_success(
+                        directory=self.media_key(media_dir),
+                        post_id=post_id,
+                        nbytes=nbytes,
+                        files=files,
                     )
+            manifest.commit()
+        media_store.save()
+        return progress
+
+    def download_jobs(
+        self,
+        jobs: List[DownloadJob],
+        workers: int = 4,
+        rate_limit: Optional[float] = None,
+    ) -> DownloadProgress:
+        """Download a list of media files with a pool of `workers` threads,
+        and record the outcome for each post in the download manifest. A
+        post's media counts as downloaded once all of its files are."""
+
+        # Number of files still to download for each post, and what was saved
+        remaining: Counter = Counter()
+        outcomes: Dict[Tuple[str, str], Dict] = {}
+        for job in jobs:
+            if job.post_id is not None:
+                remaining[self.media_key(job.media_dir), job.post_id] += 1
+
+        with self.open_manifest() as manifest:
+
+            def on_result(
+                job: DownloadJob,
+                nbytes: int,
+                files: List[Path],
+                error: Optional[Exception],
+            ):
+                if job.post_id is None:
+                    return
+                post = (self.media_key(job.media_dir), job.post_id)
+                outcome = outcomes.setdefault(
+                    post, {"bytes": 0, "files": [], "error": None}
+                )
+                outcome["bytes"] += nbytes
+                outcome["files"].extend(Path(file).name for file in files)
+                if error is not None:
+                    outcome["error"] = f"{type(error).__name__}: {error}"
+                remaining[post] -= 1
+                if remaining[post] > 0:
+                    return
+                outcome = outcomes.pop(post)
+                if outcome["error"] is None:
+                    manifest.record_success(
+                        directory=post[0],
+                        post_id=post[1],
+                        nbytes=outcome["bytes"],
+                        files=sorted(outcome["files"]),
+                    )
+                else:
+                    manifest.record_failure(
+                        directory=post[0], post_id=post[1], error=outcome["error"]
+                    )
+                # Commit every post, so that other workers using the manifest
+                # aren't blocked until all downloads are done
+                manifest.commit()
+
+            engine = DownloadEngine(
+                workers=workers,
+                rate_limit=rate_limit,
+                quiet=logger.getEffectiveLevel() > logging.DEBUG,
+            )
+            try:
+                with self.metrics.stage("download"):
+                    progress = engine.run(jobs=jobs, on_result=on_result)
+            finally:
+                manifest.commit()
+        self.metrics.count(
+            "download",
+            items=progress.completed,
+            nbytes=progress.bytes,
+            failed=progress.failed,
+        )
+        if len(jobs) > 0:
+            logger.info(progress.summary())
+        return progress
+
+    def snapshot(self, hashtag: str) -> Mapping[str, np.ndarray]:
+        """Return the columns of the snapshot of a specified hashtag's posts,
+        which are loaded lazily."""
+        return PostSnapshot(store=self.get_store(hashtag)).columns()
+
+    def cooccurrences(self, hashtag: str) -> Counter:
+        """Count how frequently hashtags co-occur with a specified source
+        hashtag, using cached counts when they are up to date."""
+        return CooccurrenceCounter(store=self.get_store(hashtag)).counts()
 
     def frequency_table(self, hashtag: str, number: int):
         """Print `number`-most commonly co-occurring hashtags for a specified
         source hashtag, in tabular form."""
 
-        # Load video data file and extract co-occurring hashtag frequency information
-        hashtag_file = self.data_dir / hashtag / "posts.json"
-        frequencies = aggregate_cooccurring_hashtags(hashtag_file=hashtag_file)
+        # Extract co-occurring hashtag frequency information
+        frequencies = self.cooccurrences(hashtag=hashtag)
 
         # Print table that displays most commonly co-occurring hashtags
         total_posts = max(frequencies.values())
@@ -285,39 +1277,134 @@ class TikTokDownloader:
             print(f"{row:<8} {hashtag:<30} {frequency:<15} {ratio:.4f}")
         print(f"Total posts: {total_posts}\n\n")
 
-    def plot(self, hashtag: str, number: int):
+    def plot_file(self, hashtag: str, name: str, plot_format: str = "png") -> Path:
+        """Return a timestamped path to save a plot of a hashtag to."""
+        current_time = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+        return (
+            self.data_dir / hashtag / "plots" / f"{name}__{current_time}.{plot_format}"
+        )
+
+    def plot(self, hashtag: str, number: int, dpi: int = 300, plot_format: str = "png"):
         """Create plot of `number`-most commonly co-occurring hashtags for a
         specified source hashtag."""
 
-        # Load video data file and extract co-occurring hashtag frequency information
-        hashtag_file = self.data_dir / hashtag / "posts.json"
-        frequencies = aggregate_cooccurring_hashtags(hashtag_file=hashtag_file)
+        plot_file = render_cooccurrence_plot(
+            hashtag=hashtag,
+            frequencies=self.cooccurrences(hashtag=hashtag),
+            number=number,
+            plot_file=self.plot_file(hashtag, name=hashtag, plot_format=plot_format),
+            dpi=dpi,
+        )
+        logger.info(f"Plot saved to file: {plot_file}")
 
-        # Define labels and other fields used in plot
-        total_posts = max(frequencies.values())
-        frequencies.pop(hashtag)
-        sorted_frequencices = frequencies.most_common(number)
-        labels = [label for label, _ in sorted_frequencices]
-        ratios = [freq / total_posts * 100 for _, freq in sorted_frequencices]
-        y_pos = list(reversed(range(len(sorted_frequencices))))
-
-        # Visualize data in bar chart
-        fig, ax = plt.subplots(figsize=(5, 6.66))
-        ax.barh(y_pos, ratios)
-        ax.set_yticks(y_pos)
-        ax.set_yticklabels(labels)
-        ax.grid(axis="y")
-        ax.set_xlabel("Percent of posts with co-occurring hashtag")
-        ax.set_ylim(min(y_pos) - 1, max(y_pos) + 1)
-        ax.set_title(f"Co-occurring hashtags for #{hashtag} posts")
-        ax.xaxis.set_major_formatter(mtick.PercentFormatter(decimals=0))
+    def submit_plot(
+        self,
+        pool: PlotPool,
+        hashtag: str,
+        number: int,
+        dpi: int = 300,
+        plot_format: str = "png",
+    ):
+        """Submit a plot of `number`-most commonly co-occurring hashtags for a
+        specified source hashtag to be rendered by a pool of processes."""
+        pool.submit_cooccurrence_plot(
+            hashtag=hashtag,
+            frequencies=self.cooccurrences(hashtag=hashtag),
+            number=number,
+            plot_file=self.plot_file(hashtag, name=hashtag, plot_format=plot_format),
+            dpi=dpi,
+        )
+
+    def plot_all(
+        self,
+        hashtags: List[str],
+        number: int,
+        workers: int = 4,
+        dpi: int = 300,
+        plot_format: str = "png",
+    ) -> List[Path]:
+        """Plot the most commonly co-occurring hashtags for many source
+        hashtags, rendering the plots in parallel in `workers` processes."""
+        with PlotPool(workers=workers) as pool:
+            for hashtag in hashtags:
+                self.submit_plot(
+                    pool,
+                    hashtag=hashtag,
+                    number=number,
+                    dpi=dpi,
+                    plot_format=plot_format,
+                )
+            return pool.wait()
+
+    def trends(
+        self, hashtag: str, bucket: str = "day", window: int = 7
+    ) -> HashtagTrends:
+        """Return the trends of hashtags co-occurring with a specified source
+        hashtag over time."""
+        return HashtagTrends(
+            columns=self.snapshot(hashtag=hashtag), bucket=bucket, window=window
+        )
+
+    def trend_table(
+        self, hashtag: str, number: int, bucket: str = "day", window: int = 7
+    ):
+        """Print the `number` co-occurring hashtags that were used more often
+        than expected in the latest `window` buckets, in tabular form."""
+
+        trends = self.trends(hashtag=hashtag, bucket=bucket, window=window)
+        emerging = trends.emerging(number=number, exclude=(hashtag,))
+
+        print(
+            f"\nEmerging hashtags in #{hashtag} posts over the last {window} {bucket}s"
+        )
+        print(
+            f"{'Rank':<8} {'Hashtag':<30} {'Recent':<10} {'Expected':<10} {'Score':<10}"
+        )
+        for row, trend in enumerate(emerging):
+            print(
+                f"{row:<8} {trend['hashtag']:<30} {trend['recent']:<10} "
+                f"{trend['expected']:<10.1f} {trend['score']:.2f}"
+            )
+        print()
+
+    def trend_plot(
+        self,
+        hashtag: str,
+        number: int,
+        bucket: str = "day",
+        window: int = 7,
+        dpi: int = 300,
+        plot_format: str = "png",
+    ):
+        """Create plot of the rolling post counts of the `number` co-occurring
+        hashtags with the highest emerging scores."""
+
+        trends = self.trends(hashtag=hashtag, bucket=bucket, window=window)
+        # More lines than this make the plot unreadable
+        emerging = trends.emerging(number=min(number, 10), exclude=(hashtag,))
+        labels = [trend["hashtag"] for trend in emerging]
+        rolling_counts = trends.rolling_counts(labels)
+        times = [
+            datetime.fromtimestamp(t, timezone.utc)
+            for t in trends.bucket_starts().tolist()
+        ]
+
+        # Visualize data in line chart
+        plt = get_pyplot()
+        fig, ax = plt.subplots(figsize=(8, 5))
+        for label, counts in zip(labels, rolling_counts):
+            ax.plot(times, counts, label=f"#{label}")
+        ax.set_ylabel(f"Posts in the last {window} {bucket}s")
+        ax.set_title(f"Emerging hashtags in #{hashtag} posts")
+        ax.legend(loc="upper left")
+        fig.autofmt_xdate()
 
         # Write image of plot to file
-        current_time = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
-        plot_file = self.data_dir / hashtag / "plots" / f"{hashtag}__{current_time}.png"
-        plot_file.parent.mkdir(exist_ok=True, parents=True)
-        plt.savefig(plot_file, bbox_inches="tight", facecolor="white", dpi=300)
-        logger.info(f"Plot saved to file: {plot_file}")
+        plot_file = self.plot_file(
+            hashtag, name=f"{hashtag}__trends", plot_format=plot_format
+        )
+        save_figure(fig, plot_file=plot_file, dpi=dpi)
+        logger.info(f"Trend plot saved to file: {plot_file}")
 
     def run(
         self,
@@ -327,16 +1414,112 @@ class TikTokDownloader:
         table: bool,
         number: int,
         headed: bool,
+        sessions: Optional[int] = None,
+        retries: int = 3,
+        download_workers: int = 4,
+        rate_limit: Optional[float] = None,
+        compact: bool = False,
+        trends: bool = False,
+        trend_bucket: str = "day",
+        trend_window: int = 7,
+        plot_workers: Optional[int] = None,
+        plot_dpi: int = 300,
+        plot_format: str = "png",
     ):
-        """Execute the specified operations on all specified hashtags."""
-
-        # Scrape all specified hashtags and perform analyses, depending on if
-        # `--table`, `--plot`, and `--download` flags are used in the command
-        for hashtag in self.hashtags:
-            self.get_hashtag_posts(hashtag=hashtag, limit=limit, headed=headed)
-            if plot:
-                self.plot(hashtag=hashtag, number=number)
-            if table:
-                self.frequency_table(hashtag=hashtag, number=number)
+        """Execute the specified operations on all specified hashtags.
+
+        If `sessions` is specified, all hashtags are scraped concurrently up
+        front using a shared pool of that many browser sessions, rather than
+        one at a time with a fresh browser for each hashtag. Media for all
+        hashtags is downloaded at the end through a single queue. If
+        `plot_workers` is specified, plots are rendered in that many
+        background processes while the remaining hashtags are scraped. The
+        time spent in each stage is recorded in `self.metrics`.
+
+        When running as one of several workers, each hashtag is leased
+        before it is scraped (all of them up front when using `sessions`),
+        and hashtags leased by other workers are skipped. Leases are held
+        until all media has been downloaded."""
+
+        started = time.time()
+        plot_pool = None
+        if plot and plot_workers is not None:
+            plot_pool = PlotPool(workers=plot_workers)
+        if self.leases is not None:
+            self.leases.start()
+        try:
+            failed = []
+            hashtags = self.claim_hashtags(self.hashtags, since=started)
+            if sessions is not None:
+                hashtags = list(hashtags)
+                failed = self.get_hashtags_posts_concurrently(
+                    hashtags=hashtags,
+                    limit=limit,
+                    headed=headed,
+                    sessions=sessions,
+                    retries=retries,
+                )
+
+            # Scrape all specified hashtags and perform analyses, depending on if
+            # `--table`, `--plot`, and `--download` flags are used in the command
+            scraped = []
+            for hashtag in hashtags:
+                if sessions is None:
+                    self.get_hashtag_posts(hashtag=hashtag, limit=limit, headed=headed)
+                elif hashtag in failed:
+                    continue
+                scraped.append(hashtag)
+                if compact:
+                    with self.metrics.stage("compact"):
+                        self.get_store(hashtag).compact()
+                if plot and plot_pool is not None:
+                    with self.metrics.stage("plot"):
+                        self.submit_plot(
+                            plot_pool,
+                            hashtag=hashtag,
+                            number=number,
+                            dpi=plot_dpi,
+                            plot_format=plot_format,
+                        )
+                elif plot:
+                    with self.metrics.stage("plot"):
+                        self.plot(
+                            hashtag=hashtag,
+                            number=number,
+                            dpi=plot_dpi,
+                            plot_format=plot_format,
+                        )
+                if table:
+                    with self.metrics.stage("table"):
+                        self.frequency_table(hashtag=hashtag, number=number)
+                if trends:
+                    with self.metrics.stage("trends"):
+                        self.trend_table(
+                            hashtag=hashtag,
+                            number=number,
+                            bucket=trend_bucket,
+                            window=trend_window,
+                        )
+                        if plot:
+                            self.trend_plot(
+                                hashtag=hashtag,
+                                number=number,
+                                bucket=trend_bucket,
+                                window=trend_window,
+                                dpi=plot_dpi,
+                                plot_format=plot_format,
+                            )
+
             if download:
-                self.get_hashtag_videos(hashtag=hashtag)
+                self.get_hashtags_videos(
+                    hashtags=scraped,
+                    workers=download_workers,
+                    rate_limit=rate_limit,
+                )
+        finally:
+            if self.leases is not None:
+                self.leases.stop()
+            if plot_pool is not None:
+                with self.metrics.stage("plot_wait"):
+                    plot_pool.wait()
+            logger.info(f"Time spent in each stage: {self.metrics.summary()}")
@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import logging
+from pathlib import Path
+from typing import Dict, Callable, Iterable, List, Optional
+
+from .storage import file_lock, write_json
+
+logger = logging.getLogger(__name__)
+
+# File in the data directory that the progress of unfinished scrapes is
+# saved to
+CHECKPOINTS_FILE = "checkpoints.json"
+
+# File in a hashtag's folder that the posts fetched by an unfinished scrape
+# are added to, if they aren't merged into the hashtag's store as they arrive
+PENDING_POSTS_FILE = "pending.jsonl"
+
+# Number of seconds after which an unfinished scrape is started over rather
+# than resumed, as the hashtag's feed will have changed too much since
+CHECKPOINT_MAX_AGE = 60 * 60
+
+
+class ScrapeCheckpoints:
+    """Progress of the hashtags being scraped, as the offset in each
+    hashtag's feed up to which posts have been saved, so that a scrape that
+    fails or crashes part way through resumes where it stopped rather than
+    from the start of the feed.
+
+    A checkpoint is only resumed by a scrape of the same number of posts,
+    within `max_age` seconds of being saved."""
+
+    def __init__(
+        self,
+        state_file: Optional[Path] = None,
+        max_age: float = CHECKPOINT_MAX_AGE,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.state_file = state_file
+        self.max_age = max_age
+        self.clock = clock
+        self.checkpoints: Dict[str, Dict] = self._load()
+
+    def _load(self) -> Dict[str, Dict]:
+        if self.state_file is None:
+            return {}
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return json.load(fp=f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        if self.state_file is None:
+            return
+        write_json(self.state_file, self.checkpoints)
+
+    def _set(self, hashtag: str, checkpoint: Optional[Dict]):
+        if checkpoint is None:
+            self.checkpoints.pop(hashtag, None)
+        else:
+            self.checkpoints[hashtag] = checkpoint
+
+    def _update(self, hashtag: str, checkpoint: Optional[Dict]):
+        if self.state_file is None:
+            self._set(hashtag, checkpoint)
+            return
+        # Other workers may have changed the checkpoints of other hashtags,
+        # so only this hashtag's checkpoint is changed in the saved file
+        with file_lock(self.state_file):
+            self.checkpoints = self._load()
+            self._set(hashtag, checkpoint)
+            self.save()
+
+    def cursor(self, hashtag: str, limit: int) -> int:
+        """Return the offset in a hashtag's feed to resume scraping
+        `limit` posts from, or 0 to start from the beginning."""
+
+        checkpoint = self.checkpoints.get(hashtag)
+        if checkpoint is None or checkpoint["limit"] != limit:
+            return 0
+        if self.clock() - checkpoint["saved"] >= self.max_age:
+            logger.debug(f"Checkpoint of hashtag '{hashtag}' is too old to resume")
+            return 0
+        logger.info(
+            f"Resuming scrape of hashtag '{hashtag}' after {checkpoint['cursor']} posts"
+        )
+        return checkpoint["cursor"]
+
+    def advance(self, hashtag: str, cursor: int, limit: int):
+        """Record that the posts of a hashtag's feed up to `cursor` have been
+        saved."""
+        self._update(hashtag, {"cursor": cursor, "limit": limit, "saved": self.clock()})
+
+    def clear(self, hashtag: str):
+        """Record that a hashtag's scrape has finished."""
+        if hashtag in self.checkpoints:
+            self._update(hashtag, None)
+
+
+class PendingPosts:
+    """Posts fetched by an unfinished scrape of a hashtag, appended to a JSON
+    Lines file in the hashtag's folder as they arrive. Stores that are
+    rewritten in full whenever posts are merged only merge these once, when
+    the scrape finishes, and the posts are kept if it crashes before then."""
+
+    def __init__(self, hashtag_dir: Path):
+        self.file_path = Path(hashtag_dir) / PENDING_POSTS_FILE
+
+    def exists(self) -> bool:
+        return self.file_path.is_file()
+
+    def append(self, posts: Iterable[Dict]):
+        self.file_path.parent.mkdir(exist_ok=True, parents=True)
+        with open(self.file_path, "ab+") as f:
+            # Terminate a record left incomplete by an interrupted append
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+            f.writelines(json.dumps(post).encode("utf-8") + b"\n" for post in posts)
+
+    def load(self) -> List[Dict]:
+        """Return the pending posts, keeping the latest version of posts that
+        were fetched more than once."""
+
+        posts: Dict[str, Dict] = {}
+        if not self.exists():
+            return []
+        with open(self.file_path, "rb") as f:
+            for line in f:
+                try:
+                    post = json.loads(line)
+                except ValueError:
+                    # Skip records left incomplete by an interrupted append
+                    continue
+                posts[post["id"]] = post
+        return list(posts.values())
+
+    def clear(self):
+        self.file_path.unlink(missing_ok=True)
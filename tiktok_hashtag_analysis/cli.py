@@ -4,6 +4,19 @@ import argparse
 from pathlib import Path
 from typing import Optional
 from .base import TikTokDownloader, load_hashtags_from_file
+from .storage import STORE_BACKENDS
+from .database import DATABASE_FILE, PostDatabase
+from .associations import ASSOCIATIONS_FILE, METRICS
+from .trends import BUCKET_SIZES
+from .plotting import PLOT_FORMATS
+from .scheduler import MIN_INTERVAL, MAX_INTERVAL
+from .metrics import PROFILE_DIR
+from .leases import LEASES_DIR, LEASE_TTL
+from .incremental import BATCH_SIZE
+from .crawl import CRAWL_FILE, MAX_DEPTH, MAX_HASHTAGS, EXPAND
+from .server import DEFAULT_HOST, DEFAULT_PORT, serve
+from .duplicates import DUPLICATES_FILE, THRESHOLD, CaptionIndex
+from .authors import AUTHORS_FILE, SHARED_AUTHORS_FILE, AUTHOR_METRICS, AuthorIndex
 
 DEFAULT_OUTPUT_DIR = Path.home() / "tiktok_hashtag_data"
 
@@ -82,6 +95,248 @@ def create_parser():
         help="Don't use headless version of TikTok scraper",
         action="store_true",
     )
+    parser.add_argument(
+        "--sessions",
+        type=int,
+        help="Scrape hashtags concurrently, sharing a pool of this many browser sessions",
+        default=None,
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        help="Number of attempts to scrape each hashtag when using `--sessions`",
+        default=3,
+    )
+    parser.add_argument(
+        "--download-workers",
+        type=int,
+        help="Number of media files to download in parallel when using `--download`",
+        default=4,
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        help="Maximum number of download requests per second to each host",
+        default=None,
+    )
+    parser.add_argument(
+        "--store",
+        type=str,
+        choices=STORE_BACKENDS,
+        help="Format to store scraped posts in. `jsonl` appends new posts to an append-only store instead of rewriting `posts.json`, and migrates existing `posts.json` files",
+        default="json",
+    )
+    parser.add_argument(
+        "--compact",
+        help="Remove outdated versions of posts from append-only stores",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--database",
+        help=f"Also index scraped posts in an SQLite database (`{DATABASE_FILE}`) in the output directory",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--import-database",
+        help="Import all previously scraped posts in the output directory into the SQLite database",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--associations",
+        help=f"Export the `--number` most strongly associated hashtags of every hashtag in the output directory to `{ASSOCIATIONS_FILE}`",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--association-metric",
+        type=str,
+        choices=METRICS,
+        help="Metric used to rank hashtag associations",
+        default="pmi",
+    )
+    parser.add_argument(
+        "--min-cooccurrences",
+        type=int,
+        help="Minimum number of posts two hashtags must co-occur in to be associated, or for `--crawl` to follow a co-occurring hashtag",
+        default=5,
+    )
+    parser.add_argument(
+        "--trends",
+        help="Print a table of the co-occurring hashtags that are used increasingly often, and plot their use over time with `--plot`",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--trend-bucket",
+        type=str,
+        choices=list(BUCKET_SIZES),
+        help="Time interval to count posts in for `--trends`",
+        default="day",
+    )
+    parser.add_argument(
+        "--trend-window",
+        type=int,
+        help="Number of the latest time intervals to compare with earlier posts for `--trends`",
+        default=7,
+    )
+    parser.add_argument(
+        "--plot-workers",
+        type=int,
+        help="Render plots in this many background processes while scraping continues",
+        default=None,
+    )
+    parser.add_argument(
+        "--plot-dpi",
+        type=int,
+        help="Resolution of plots saved as PNG files",
+        default=300,
+    )
+    parser.add_argument(
+        "--plot-format",
+        type=str,
+        choices=PLOT_FORMATS,
+        help="File format to save plots in",
+        default="png",
+    )
+    parser.add_argument(
+        "--watch",
+        help="Keep running and re-scrape hashtags on a schedule that adapts to how many new posts each hashtag yields",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--min-interval",
+        type=float,
+        help="Minimum number of minutes between scrapes of a hashtag with `--watch`",
+        default=MIN_INTERVAL / 60,
+    )
+    parser.add_argument(
+        "--max-interval",
+        type=float,
+        help="Maximum number of minutes between scrapes of a hashtag with `--watch`",
+        default=MAX_INTERVAL / 60,
+    )
+    parser.add_argument(
+        "--shared-media",
+        help="Download the media of each post only once, to a `media_store` folder shared by all hashtags, and link it into the `media` folder of each hashtag",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--verify-media",
+        help="Check media reused from the shared media store against a hash of its content, and download it again if it has changed",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        help="File to write the time, throughput and retries of each stage of the run to, in the Prometheus text format if the file name ends in `.prom`, and as JSON otherwise",
+        default=None,
+    )
+    parser.add_argument(
+        "--profile",
+        help=f"Profile each stage of the run, and write the profiles to a `{PROFILE_DIR}` folder in the output directory",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--stop-after-known",
+        type=int,
+        help="Stop scraping a hashtag once this many previously scraped posts are found in a row, instead of fetching `--limit` posts",
+        default=None,
+    )
+    parser.add_argument(
+        "--full-refresh",
+        type=float,
+        help="With `--stop-after-known`, still scrape `--limit` posts of each hashtag if it hasn't been scraped in full for this many hours, to update the stats of older posts",
+        default=None,
+    )
+    parser.add_argument(
+        "--worker",
+        help=f"Share the hashtags with other workers using the same output directory, by leasing each hashtag before scraping it (lease files are kept in a `{LEASES_DIR}` folder in the output directory)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--lease-ttl",
+        type=float,
+        help="With `--worker`, number of minutes after which the leases of a worker that stopped responding can be taken over by other workers",
+        default=LEASE_TTL / 60,
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help="Number of posts saved at a time while a hashtag is scraped. A scrape that fails part way through resumes after the last saved batch",
+        default=BATCH_SIZE,
+    )
+    parser.add_argument(
+        "--crawl",
+        help=f"Starting from the specified hashtags, keep scraping the hashtags that co-occur most often with the scraped hashtags. The crawl is saved to `{CRAWL_FILE}` in the output directory, and resumed when run again",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--crawl-depth",
+        type=int,
+        help="With `--crawl`, the maximum number of hops from the specified hashtags",
+        default=MAX_DEPTH,
+    )
+    parser.add_argument(
+        "--crawl-hashtags",
+        type=int,
+        help="With `--crawl`, the maximum number of hashtags to scrape",
+        default=MAX_HASHTAGS,
+    )
+    parser.add_argument(
+        "--crawl-posts",
+        type=int,
+        help="With `--crawl`, stop once this many posts have been scraped",
+        default=None,
+    )
+    parser.add_argument(
+        "--crawl-expand",
+        type=int,
+        help="With `--crawl`, the number of most often co-occurring hashtags of each scraped hashtag to follow",
+        default=EXPAND,
+    )
+    parser.add_argument(
+        "--serve",
+        help="Serve the co-occurring hashtags, post counts and trends of the scraped hashtags as JSON over HTTP, instead of scraping",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        help="With `--serve`, the address to listen on",
+        default=DEFAULT_HOST,
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        help="With `--serve`, the port to listen on",
+        default=DEFAULT_PORT,
+    )
+    parser.add_argument(
+        "--duplicates",
+        help=f"Export clusters of posts with near-duplicate captions, across all hashtags in the output directory, to `{DUPLICATES_FILE}`",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--duplicate-threshold",
+        type=float,
+        help="With `--duplicates`, the estimated similarity (between 0 and 1) above which captions are near-duplicates",
+        default=THRESHOLD,
+    )
+    parser.add_argument(
+        "--duplicate-authors",
+        type=int,
+        help="With `--duplicates`, only export clusters of posts by at least this many distinct authors",
+        default=1,
+    )
+    parser.add_argument(
+        "--authors",
+        help=f"Export the `--number` most active authors of every hashtag in the output directory to `{AUTHORS_FILE}`, and the authors who posted in several hashtags to `{SHARED_AUTHORS_FILE}`",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--author-metric",
+        choices=AUTHOR_METRICS,
+        help="With `--authors`, rank authors by their number of posts or the sum of a stat over their posts",
+        default="posts",
+    )
     return parser
 
 
@@ -126,6 +381,71 @@ def main():
         datefmt="%Y-%m-%d %H:%M:%S",
     )
 
+    if args.worker and args.watch:
+        parser.error("The `--worker` flag can't be used with `--watch`.")
+    if args.crawl and (args.watch or args.worker):
+        parser.error("The `--crawl` flag can't be used with `--watch` or `--worker`.")
+    if args.trend_window < 1:
+        parser.error("The `--trend-window` flag must be a positive integer.")
+    # Media and analyses are only handled after a single scrape
+    analysis_flags = [
+        f"`--{name}`"
+        for name in ["download", "plot", "table", "trends"]
+        if getattr(args, name)
+    ]
+    for mode in ["watch", "crawl"]:
+        if getattr(args, mode) and analysis_flags:
+            parser.error(f"{', '.join(analysis_flags)} can't be used with `--{mode}`.")
+
+    output_dir = process_output_dir(specified_output_dir=args.output_dir, parser=parser)
+    database_file = output_dir / DATABASE_FILE
+
+    if args.import_database:
+        with PostDatabase(path=database_file, shared=args.worker) as database:
+            imported = database.import_data_dir(data_dir=output_dir)
+        logger.info(
+            f"Imported {sum(imported.values())} posts for {len(imported)} hashtags "
+            f"into database: {database_file}"
+        )
+
+    if args.associations:
+        from .associations import AssociationMatrix
+
+        matrix = AssociationMatrix.from_data_dir(data_dir=output_dir)
+        matrix.export_csv(
+            file_path=output_dir / ASSOCIATIONS_FILE,
+            k=args.number,
+            metric=args.association_metric,
+            min_count=args.min_cooccurrences,
+        )
+
+    if args.duplicates:
+        captions = CaptionIndex(data_dir=output_dir)
+        captions.update()
+        captions.export_csv(
+            file_path=output_dir / DUPLICATES_FILE,
+            threshold=args.duplicate_threshold,
+            min_authors=args.duplicate_authors,
+        )
+
+    if args.authors:
+        authors = AuthorIndex(data_dir=output_dir)
+        authors.update()
+        authors.export_csv(
+            file_path=output_dir / AUTHORS_FILE,
+            number=args.number,
+            by=args.author_metric,
+        )
+        authors.export_shared_csv(file_path=output_dir / SHARED_AUTHORS_FILE)
+
+    if args.serve:
+        serve(data_dir=output_dir, host=args.host, port=args.port)
+        return
+
+    if args.import_database or args.associations or args.duplicates or args.authors:
+        if len(args.hashtags) == 0 and not args.file:
+            return
+
     if len(args.hashtags) == 0:
         if not args.file:
             parser.error(
@@ -138,20 +458,70 @@ def main():
     else:
         hashtags = args.hashtags
 
-    output_dir = process_output_dir(specified_output_dir=args.output_dir, parser=parser)
-
     downloader = TikTokDownloader(
-        hashtags=hashtags, data_dir=output_dir, config_file=args.config
+        hashtags=hashtags,
+        data_dir=output_dir,
+        config_file=args.config,
+        store=args.store,
+        database=database_file if args.database else None,
+        shared_media=args.shared_media,
+        verify_media=args.verify_media,
+        profile_dir=output_dir / PROFILE_DIR if args.profile else None,
+        stop_after_known=args.stop_after_known,
+        full_refresh=None if args.full_refresh is None else args.full_refresh * 3600,
+        worker=args.worker,
+        lease_ttl=args.lease_ttl * 60,
+        batch_size=args.batch_size,
     )
 
-    downloader.run(
-        limit=args.limit,
-        download=args.download,
-        plot=args.plot,
-        table=args.table,
-        number=args.number,
-        headed=args.headed,
-    )
+    try:
+        if args.crawl:
+            downloader.crawl(
+                limit=args.limit,
+                headed=args.headed,
+                sessions=args.sessions or 1,
+                retries=args.retries,
+                max_depth=args.crawl_depth,
+                max_hashtags=args.crawl_hashtags,
+                max_posts=args.crawl_posts,
+                expand=args.crawl_expand,
+                min_cooccurrences=args.min_cooccurrences,
+            )
+        elif args.watch:
+            try:
+                downloader.watch(
+                    limit=args.limit,
+                    headed=args.headed,
+                    sessions=args.sessions or 1,
+                    min_interval=args.min_interval * 60,
+                    max_interval=args.max_interval * 60,
+                )
+            except KeyboardInterrupt:
+                logger.info("Stopped watching hashtags")
+        else:
+            downloader.run(
+                limit=args.limit,
+                download=args.download,
+                plot=args.plot,
+                table=args.table,
+                number=args.number,
+                headed=args.headed,
+                sessions=args.sessions,
+                retries=args.retries,
+                download_workers=args.download_workers,
+                rate_limit=args.rate_limit,
+                compact=args.compact,
+                trends=args.trends,
+                trend_bucket=args.trend_bucket,
+                trend_window=args.trend_window,
+                plot_workers=args.plot_workers,
+                plot_dpi=args.plot_dpi,
+                plot_format=args.plot_format,
+            )
+    finally:
+        if args.metrics:
+            downloader.metrics.export(file_path=Path(args.metrics))
+        downloader.metrics.save_profiles()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,232 @@
+import json
+import logging
+from pathlib import Path
+from collections import Counter
+from typing import List, Dict, Iterable, Optional, Set
+
+from .storage import PostStore, JsonLinesPostStore, write_json
+from .snapshot import PostSnapshot, hashtag_counts, post_hashtag_lists
+
+logger = logging.getLogger(__name__)
+
+# Files that co-occurrence counts are cached in, next to each hashtag's posts
+COUNTS_FILE = "cooccurrence.json"
+POST_HASHTAGS_FILE = "cooccurrence_posts.json"
+# Log of the hashtags of the posts added to the cached counts since
+# `POST_HASHTAGS_FILE` was written
+POST_HASHTAGS_LOG = "cooccurrence_posts.jsonl"
+CACHE_VERSION = 2
+
+
+def video_hashtags(video: Dict) -> Set[str]:
+    """Return the distinct hashtags used in a raw TikTok post API response."""
+    return set(
+        hashtag["hashtagName"]
+        for hashtag in video.get("textExtra", [])
+        if hashtag.get("hashtagName")
+    )
+
+
+class CooccurrenceCounter:
+    """How frequently hashtags are used in the posts stored for a hashtag,
+    persisted next to the posts so repeated analyses don't have to re-read
+    them.
+
+    The cached counts record the signature of the store they were computed
+    from. When the store has changed, the counts are brought up to date from
+    just the posts written since, when those are known (right after a
+    scrape, or from the tail of an append-only store's index), and are
+    recomputed from all posts otherwise.
+
+    The hashtags of each counted post are kept too, to subtract them when a
+    post is scraped again. The hashtags of updated posts are appended to a
+    log, and the full map is only rewritten once the log has grown larger
+    than it."""
+
+    def __init__(self, store: PostStore):
+        self.store = store
+        self.counts_file = store.hashtag_dir / COUNTS_FILE
+        self.post_hashtags_file = store.hashtag_dir / POST_HASHTAGS_FILE
+        self.post_hashtags_log = store.hashtag_dir / POST_HASHTAGS_LOG
+
+    def _read(self, file_path: Path) -> Optional[Dict]:
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                data = json.load(fp=f)
+        except (OSError, ValueError):
+            return None
+        return data if data.get("version") == CACHE_VERSION else None
+
+    def counts(self) -> Counter:
+        """Return up-to-date co-occurrence counts."""
+
+        # The signature is read before any posts, so that posts merged
+        # meanwhile make the cached counts outdated rather than being missed
+        signature = self.store.signature()
+        cached = self._read(self.counts_file)
+        if cached is not None and cached["signature"] == signature:
+            return Counter(cached["counts"])
+        store = self.store
+        if (
+            cached is not None
+            and isinstance(store, JsonLinesPostStore)
+            and self._only_appended_since(store, cached, signature)
+        ):
+            logger.debug(f"Updating co-occurrence counts in {self.counts_file}")
+            appended = store.iter_appended(position=cached["watermark"])
+            counts = self._apply(cached=cached, posts=appended, signature=signature)
+            if counts is not None:
+                return counts
+        return self.rebuild()
+
+    @staticmethod
+    def _only_appended_since(
+        store: JsonLinesPostStore, cached: Dict, signature: List[int]
+    ) -> bool:
+        """Whether posts have only been appended to the store since the
+        cached counts were computed."""
+        watermark = cached.get("watermark")
+        return (
+            watermark is not None
+            and watermark <= signature[0]
+            and store.index_line_before(watermark) == cached["watermark_line"]
+        )
+
+    def rebuild(self) -> Counter:
+        """Recompute the counts from all stored posts, as read from their
+        columnar snapshot."""
+
+        logger.debug(f"Aggregating co-occurring hashtags in {self.store.hashtag_dir}")
+        signature = self.store.signature()
+        columns = PostSnapshot(store=self.store).columns()
+        post_hashtags = post_hashtag_lists(columns)
+        counts = hashtag_counts(columns)
+        self._save(counts=counts, post_hashtags=post_hashtags, signature=signature)
+        return counts
+
+    def update(
+        self, posts: Iterable[Dict], previous_signature: List[int]
+    ) -> Optional[Counter]:
+        """Update the cached counts with posts that were just merged into the
+        store, if the counts were up to date before the merge."""
+
+        signature = self.store.signature()
+        cached = self._read(self.counts_file)
+        if cached is None or cached["signature"] != previous_signature:
+            return None
+        return self._apply(cached=cached, posts=posts, signature=signature)
+
+    def _apply(
+        self, cached: Dict, posts: Iterable[Dict], signature: List[int]
+    ) -> Optional[Counter]:
+        """Add new and updated posts to the cached counts, replacing the
+        hashtags of earlier versions of the same posts."""
+
+        post_hashtags = self._read_post_hashtags(cached)
+        if post_hashtags is None:
+            return None
+
+        counts = Counter(cached["counts"])
+        updated = []
+        for video in posts:
+            tags = sorted(video_hashtags(video))
+            counts.subtract(post_hashtags.get(video["id"], []))
+            counts.update(tags)
+            post_hashtags[video["id"]] = tags
+            updated.append({"id": video["id"], "hashtags": tags})
+        # Drop hashtags that are no longer used
+        counts = +counts
+        self._save(
+            counts=counts,
+            post_hashtags=post_hashtags,
+            signature=signature,
+            cached=cached,
+            updated=updated,
+        )
+        return counts
+
+    def _read_post_hashtags(self, cached: Dict) -> Optional[Dict[str, List[str]]]:
+        """Read the hashtags of each counted post, from the full map and the
+        part of the log that the cached counts include."""
+
+        post_hashtags_data = self._read(self.post_hashtags_file)
+        if (
+            post_hashtags_data is None
+            or post_hashtags_data["signature"] != cached["posts_signature"]
+        ):
+            return None
+        post_hashtags = post_hashtags_data["posts"]
+
+        log_size = cached["log_size"]
+        try:
+            with open(self.post_hashtags_log, "rb") as f:
+                log = f.read(log_size)
+        except OSError:
+            log = b""
+        if len(log) != log_size:
+            return None
+        for line in log.splitlines():
+            record = json.loads(line)
+            post_hashtags[record["id"]] = record["hashtags"]
+        return post_hashtags
+
+    def _save(
+        self,
+        counts: Counter,
+        post_hashtags: Dict[str, List[str]],
+        signature: List[int],
+        cached: Optional[Dict] = None,
+        updated: Optional[List[Dict]] = None,
+    ):
+        """Save the counts. If the counts were brought up to date from
+        `cached` counts, the hashtags of the `updated` posts are appended to
+        the log, unless it would grow larger than the full map, in which case
+        the full map is rewritten instead."""
+
+        if not self.store.hashtag_dir.is_dir():
+            return
+        watermark = None
+        watermark_line = ""
+        if isinstance(self.store, JsonLinesPostStore):
+            watermark = signature[0]
+            watermark_line = self.store.index_line_before(watermark)
+
+        log = b"".join(
+            json.dumps(record).encode("utf-8") + b"\n" for record in updated or []
+        )
+        if (
+            cached is not None
+            and cached["log_size"] + len(log) <= self.post_hashtags_file.stat().st_size
+        ):
+            posts_signature = cached["posts_signature"]
+            with open(self.post_hashtags_log, "ab") as f:
+                # Drop records appended by an update that never saved its counts
+                f.truncate(cached["log_size"])
+                f.write(log)
+            log_size = cached["log_size"] + len(log)
+        else:
+            posts_signature = signature
+            log_size = 0
+            write_json(
+                self.post_hashtags_file,
+                {
+                    "version": CACHE_VERSION,
+                    "signature": signature,
+                    "posts": post_hashtags,
+                },
+            )
+            self.post_hashtags_log.unlink(missing_ok=True)
+
+        # The counts are written last, as they determine whether the cache is valid
+        write_json(
+            self.counts_file,
+            {
+                "version": CACHE_VERSION,
+                "signature": signature,
+                "watermark": watermark,
+                "watermark_line": watermark_line,
+                "posts_signature": posts_signature,
+                "log_size": log_size,
+                "counts": counts,
+            },
+        )
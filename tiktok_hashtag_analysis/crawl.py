@@ -0,0 +1,240 @@
+import json
+import heapq
+import logging
+from pathlib import Path
+from collections import Counter
+from dataclasses import dataclass, asdict
+from typing import List, Dict, Optional, Set, Tuple
+
+from .storage import write_json
+
+logger = logging.getLogger(__name__)
+
+# File that the state of a crawl is saved to in the data directory, so that
+# an interrupted crawl can be resumed
+CRAWL_FILE = "crawl.json"
+
+# File in the data directory that the crawled hashtags are listed in, in a
+# format that can be passed to `--file`
+CRAWL_HASHTAGS_FILE = "crawl_hashtags.txt"
+
+# Default budget of a crawl
+MAX_DEPTH = 2
+MAX_HASHTAGS = 50
+EXPAND = 10
+
+
+@dataclass
+class CrawlNode:
+    """A hashtag found by a crawl. `depth` is the number of hops from the
+    nearest seed hashtag, and `priority` the number of posts of crawled
+    hashtags it co-occurred in."""
+
+    depth: int
+    priority: int = 0
+    parent: Optional[str] = None
+    status: str = "queued"
+    posts: int = 0
+    expanded: bool = False
+
+
+class CrawlFrontier:
+    """Frontier of a snowball crawl, which starts from seed hashtags and
+    follows the hashtags that co-occur most often with each crawled hashtag.
+
+    Hashtags are crawled breadth-first, and within each depth in order of
+    how often they co-occurred with the hashtags crawled so far. The crawl
+    stops after `max_hashtags` hashtags or `max_posts` posts, and hashtags
+    are only followed `max_depth` hops from the seeds. From each crawled
+    hashtag, the `expand` most often co-occurring hashtags that co-occurred
+    in at least `min_cooccurrences` posts are added to the frontier."""
+
+    def __init__(
+        self,
+        seeds: List[str],
+        state_file: Optional[Path] = None,
+        max_depth: int = MAX_DEPTH,
+        max_hashtags: int = MAX_HASHTAGS,
+        max_posts: Optional[int] = None,
+        expand: int = EXPAND,
+        min_cooccurrences: int = 1,
+    ):
+        self.state_file = state_file
+        self.max_depth = max_depth
+        self.max_hashtags = max_hashtags
+        self.max_posts = max_posts
+        self.expand = expand
+        self.min_cooccurrences = min_cooccurrences
+
+        saved = self._load()
+        self.posts: int = saved.get("posts", 0)
+        self.nodes: Dict[str, CrawlNode] = {
+            hashtag: CrawlNode(**node)
+            for hashtag, node in saved.get("nodes", {}).items()
+        }
+        self.active: Set[str] = set()
+        self._queue: List[Tuple[int, int, int, str]] = []
+        self._pushed = 0
+        for hashtag, node in self.nodes.items():
+            # Hashtags that were being crawled when the crawl was interrupted
+            # are crawled again
+            if node.status == "active":
+                node.status = "queued"
+            if node.status == "queued":
+                self._push(hashtag)
+        for hashtag in seeds:
+            self.add(hashtag, depth=0)
+        if saved:
+            logger.info(
+                f"Resuming crawl with {self.crawled_count()} hashtags crawled and "
+                f"{len(self)} queued"
+            )
+
+    def _load(self) -> Dict:
+        if self.state_file is None:
+            return {}
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return json.load(fp=f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        """Write the state of the crawl to its state file, if it has one."""
+        if self.state_file is None:
+            return
+        state = {
+            "posts": self.posts,
+            "nodes": {hashtag: asdict(node) for hashtag, node in self.nodes.items()},
+        }
+        write_json(self.state_file, state)
+
+    def _push(self, hashtag: str):
+        # Superseded entries are skipped when popped
+        node = self.nodes[hashtag]
+        self._pushed += 1
+        heapq.heappush(self._queue, (node.depth, -node.priority, self._pushed, hashtag))
+
+    def __len__(self) -> int:
+        return sum(node.status == "queued" for node in self.nodes.values())
+
+    def crawled_count(self) -> int:
+        return sum(node.status != "queued" for node in self.nodes.values())
+
+    def add(
+        self, hashtag: str, depth: int, priority: int = 0, parent: Optional[str] = None
+    ):
+        """Add a hashtag to the frontier, or raise its priority if it is
+        already queued. Hashtags that were already crawled are ignored."""
+
+        node = self.nodes.get(hashtag)
+        if node is None:
+            self.nodes[hashtag] = CrawlNode(
+                depth=depth, priority=priority, parent=parent
+            )
+        elif node.status == "queued":
+            node.priority += priority
+            if depth < node.depth:
+                node.depth = depth
+                node.parent = parent
+        else:
+            return
+        self._push(hashtag)
+
+    def exhausted(self) -> bool:
+        """Whether the budget of the crawl has been used up."""
+        if self.crawled_count() >= self.max_hashtags:
+            return True
+        return self.max_posts is not None and self.posts >= self.max_posts
+
+    def ready(self) -> bool:
+        """Whether there is a hashtag to crawl next."""
+        return len(self) > 0 and not self.exhausted()
+
+    def pop(self) -> Optional[Tuple[str, int]]:
+        """Take the next hashtag to crawl off the frontier, and return it
+        with its depth, or None if the crawl is done. It is marked as done
+        by `record` or `record_failure`."""
+
+        if self.exhausted():
+            return None
+        while self._queue:
+            depth, priority, _, hashtag = heapq.heappop(self._queue)
+            node = self.nodes[hashtag]
+            if node.status != "queued" or (depth, -priority) != (
+                node.depth,
+                node.priority,
+            ):
+                continue
+            node.status = "active"
+            self.active.add(hashtag)
+            return hashtag, depth
+        return None
+
+    def record(self, hashtag: str, fetched: int, cooccurrences: Counter):
+        """Mark a hashtag as crawled, and add the hashtags that co-occur
+        with it most often to the frontier."""
+
+        node = self.nodes[hashtag]
+        node.status = "done"
+        node.posts = fetched
+        self.active.discard(hashtag)
+        self.posts += fetched
+        self.expand_hashtag(hashtag, cooccurrences=cooccurrences)
+
+    def expand_hashtag(self, hashtag: str, cooccurrences: Counter):
+        """Add the hashtags that co-occur most often with a crawled hashtag
+        to the frontier, unless it is at the maximum depth."""
+
+        node = self.nodes[hashtag]
+        if node.depth >= self.max_depth:
+            return
+        node.expanded = True
+
+        # Hashtags are counted case-sensitively, but scraped in lowercase
+        counts: Counter = Counter()
+        for other, count in cooccurrences.items():
+            counts[other.lower()] += count
+        del counts[hashtag]
+        added = 0
+        for other, count in counts.most_common():
+            if added >= self.expand or count < self.min_cooccurrences:
+                break
+            other_node = self.nodes.get(other)
+            if other_node is not None and other_node.status != "queued":
+                continue
+            self.add(other, depth=node.depth + 1, priority=count, parent=hashtag)
+            added += 1
+        logger.debug(f"Added {added} hashtags co-occurring with '{hashtag}' to crawl")
+
+    def unexpanded(self) -> List[str]:
+        """List the crawled hashtags that haven't been expanded, because
+        they were at the maximum depth of an earlier crawl."""
+        return [
+            hashtag
+            for hashtag, node in self.nodes.items()
+            if node.status == "done"
+            and not node.expanded
+            and node.depth < self.max_depth
+        ]
+
+    def record_failure(self, hashtag: str):
+        """Mark a hashtag as failed, so that it isn't crawled again."""
+        self.nodes[hashtag].status = "failed"
+        self.active.discard(hashtag)
+
+    def crawled(self) -> List[str]:
+        """List the hashtags that were crawled, closest to the seeds and
+        most often co-occurring first."""
+        return [
+            hashtag
+            for hashtag, node in sorted(
+                self.nodes.items(), key=lambda item: (item[1].depth, -item[1].priority)
+            )
+            if node.status == "done"
+        ]
+
+    def export_hashtags(self, file_path: Path):
+        """Write the crawled hashtags to a text file, one per line."""
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write("".join(f"{hashtag}\n" for hashtag in self.crawled()))
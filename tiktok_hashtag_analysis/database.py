@@ -0,0 +1,215 @@
+import json
+import sqlite3
+import logging
+from pathlib import Path
+from itertools import islice
+from collections import Counter
+from typing import Any, List, Dict, Iterable, Optional, Tuple
+
+from .storage import open_store, scraped_hashtags
+
+logger = logging.getLogger(__name__)
+
+# Name of the database file created in the data directory by default
+DATABASE_FILE = "posts.sqlite"
+# Number of posts written per transaction when importing a data directory
+IMPORT_BATCH_SIZE = 1000
+# Number of seconds to wait for other processes writing to the database
+SQLITE_TIMEOUT = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id TEXT PRIMARY KEY,
+    author TEXT,
+    create_time INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS posts_author ON posts (author);
+CREATE INDEX IF NOT EXISTS posts_create_time ON posts (create_time);
+
+-- Hashtags used in each post, from its `textExtra` field
+CREATE TABLE IF NOT EXISTS post_hashtags (
+    post_id TEXT NOT NULL,
+    hashtag TEXT NOT NULL,
+    PRIMARY KEY (hashtag, post_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS post_hashtags_post_id ON post_hashtags (post_id);
+
+-- Watched hashtags that each post was scraped for
+CREATE TABLE IF NOT EXISTS scraped_posts (
+    hashtag TEXT NOT NULL,
+    post_id TEXT NOT NULL,
+    PRIMARY KEY (hashtag, post_id)
+) WITHOUT ROWID;
+"""
+
+
+def post_hashtags(post: Dict) -> List[str]:
+    """Return the distinct hashtags used in a post, in lowercase."""
+    return sorted(
+        set(
+            hashtag["hashtagName"].lower()
+            for hashtag in post.get("textExtra") or []
+            if hashtag.get("hashtagName")
+        )
+    )
+
+
+def journal_mode(shared: bool) -> str:
+    """Return the SQLite journal mode to use for a database, which is the
+    write-ahead log unless the database is `shared` by workers that may be
+    on other hosts. The write-ahead log relies on shared memory, so it
+    doesn't work on network filesystems such as NFS, where the rollback
+    journal is used instead."""
+    return "DELETE" if shared else "WAL"
+
+
+class PostDatabase:
+    """SQLite index of posts across all scraped hashtags. Each post is
+    stored once, no matter how many watched hashtags it was scraped for, and
+    the hashtags it uses are indexed so that posts can be queried by
+    hashtag, author and creation time without reading any JSON files.
+
+    If `shared` is True, the database may be shared by workers on several
+    hosts (see `journal_mode`)."""
+
+    def __init__(self, path: Path, shared: bool = False):
+        self.path = Path(path)
+        # Posts may be added from worker threads while scraping concurrently,
+        # one hashtag at a time
+        self.connection = sqlite3.connect(
+            self.path, timeout=SQLITE_TIMEOUT, check_same_thread=False
+        )
+        self.connection.execute(f"PRAGMA journal_mode={journal_mode(shared)}")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def add_posts(self, posts: Iterable[Dict], hashtag: Optional[str] = None) -> int:
+        """Insert or update posts, optionally recording the watched hashtag
+        they were scraped for. Returns the number of posts written."""
+
+        rows = []
+        tag_rows: List[Tuple[str, str]] = []
+        for post in posts:
+            rows.append(
+                (
+                    post["id"],
+                    (post.get("author") or {}).get("uniqueId"),
+                    int(post.get("createTime") or 0),
+                    json.dumps(post),
+                )
+            )
+            tag_rows.extend((post["id"], tag) for tag in post_hashtags(post))
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO posts (id, author, create_time, data) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET author = excluded.author, "
+                "create_time = excluded.create_time, data = excluded.data",
+                rows,
+            )
+            # Captions can be edited, so replace the hashtags of updated posts
+            self.connection.executemany(
+                "DELETE FROM post_hashtags WHERE post_id = ?",
+                ((row[0],) for row in rows),
+            )
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO post_hashtags (post_id, hashtag) VALUES (?, ?)",
+                tag_rows,
+            )
+            if hashtag is not None:
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO scraped_posts (hashtag, post_id) VALUES (?, ?)",
+                    ((hashtag, row[0]) for row in rows),
+                )
+        return len(rows)
+
+    def import_data_dir(self, data_dir: Path) -> Dict[str, int]:
+        """Import the posts of every hashtag scraped into a data directory.
+        Returns the number of posts imported for each hashtag."""
+
+        imported = {}
+        for hashtag in scraped_hashtags(data_dir=data_dir):
+            posts = open_store(hashtag_dir=Path(data_dir) / hashtag).iter_posts()
+            imported[hashtag] = 0
+            # Import in batches to bound memory use for large hashtags
+            while batch := list(islice(posts, IMPORT_BATCH_SIZE)):
+                imported[hashtag] += self.add_posts(posts=batch, hashtag=hashtag)
+            logger.info(f"Imported {imported[hashtag]} posts for hashtag '{hashtag}'")
+        return imported
+
+    def count_posts(self, hashtag: Optional[str] = None) -> int:
+        """Count all posts, or the posts scraped for a watched hashtag."""
+        if hashtag is None:
+            return self.connection.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM scraped_posts WHERE hashtag = ?", (hashtag,)
+        ).fetchone()[0]
+
+    def _select_with_hashtags(self, column: str, hashtags: List[str]) -> List[Any]:
+        """Select a column of the posts that use all of the specified
+        hashtags, newest first."""
+
+        hashtags = sorted(set(hashtag.lower() for hashtag in hashtags))
+        placeholders = ", ".join("?" for _ in hashtags)
+        rows = self.connection.execute(
+            f"SELECT {column} FROM post_hashtags JOIN posts ON posts.id = post_id "
+            f"WHERE hashtag IN ({placeholders}) GROUP BY posts.id "
+            f"HAVING COUNT(*) = ? ORDER BY posts.create_time DESC",
+            (*hashtags, len(hashtags)),
+        )
+        return [row[0] for row in rows]
+
+    def post_ids_with_hashtags(self, hashtags: List[str]) -> List[str]:
+        """Return the IDs of posts that use all of the specified hashtags,
+        newest first."""
+        return self._select_with_hashtags("posts.id", hashtags=hashtags)
+
+    def posts_with_hashtags(self, hashtags: List[str]) -> List[Dict]:
+        """Return posts that use all of the specified hashtags, newest first."""
+        return [
+            json.loads(data)
+            for data in self._select_with_hashtags("posts.data", hashtags=hashtags)
+        ]
+
+    def posts_by_author(
+        self,
+        author: str,
+        start_time: Optional[int] = None,
+        end_time: Optional[int] = None,
+    ) -> List[Dict]:
+        """Return posts by an author, optionally created within a range of
+        Unix timestamps, newest first."""
+        rows = self.connection.execute(
+            "SELECT data FROM posts WHERE author = ? "
+            "AND create_time >= ? AND create_time < ? ORDER BY create_time DESC",
+            (author, start_time or 0, end_time or 2**63 - 1),
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    def get_post(self, post_id: str) -> Optional[Dict]:
+        row = self.connection.execute(
+            "SELECT data FROM posts WHERE id = ?", (post_id,)
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def cooccurring_hashtags(self, hashtag: str) -> Counter:
+        """Count how frequently hashtags are used in the posts scraped for a
+        watched hashtag, like `aggregate_cooccurring_hashtags` but with
+        hashtags in lowercase."""
+        rows = self.connection.execute(
+            "SELECT post_hashtags.hashtag, COUNT(*) FROM scraped_posts "
+            "JOIN post_hashtags ON post_hashtags.post_id = scraped_posts.post_id "
+            "WHERE scraped_posts.hashtag = ? GROUP BY post_hashtags.hashtag",
+            (hashtag,),
+        )
+        return Counter(dict(rows))
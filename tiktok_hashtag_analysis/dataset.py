@@ -0,0 +1,267 @@
+import logging
+import threading
+from pathlib import Path
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, List, Dict, Callable, Iterator, Mapping, Optional, Tuple
+
+import numpy as np
+
+from .storage import PostStore, open_store, scraped_hashtags
+from .snapshot import PostSnapshot, STATS_COLUMNS, hashtag_counts
+from .trends import HashtagTrends
+
+logger = logging.getLogger(__name__)
+
+# Number of hashtags whose snapshots and query results are kept in memory
+CACHE_SIZE = 32
+
+
+class LazyColumns(Mapping):
+    """Columns of a post snapshot, each read from disk the first time it is
+    accessed and kept in memory afterwards."""
+
+    def __init__(self, columns: Mapping[str, np.ndarray]):
+        self._columns = columns
+        self._loaded: Dict[str, np.ndarray] = {}
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name not in self._loaded:
+            self._loaded[name] = self._columns[name]
+        return self._loaded[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._columns)
+
+    def __len__(self) -> int:
+        return len(self._columns)
+
+
+@dataclass
+class CachedHashtag:
+    store: PostStore
+    signature: List[int]
+    columns: Mapping[str, np.ndarray]
+    results: Dict[Tuple, Any] = field(default_factory=dict)
+
+
+class Dataset:
+    """Read-only access to the posts scraped into a data directory and to
+    analyses of each hashtag, for notebooks and dashboards that query the
+    same hashtags repeatedly. Nothing is scraped, and the scraping
+    dependencies aren't imported.
+
+    A hashtag's post snapshot is loaded the first time the hashtag is
+    queried, and query results are memoized for the `cache_size` most
+    recently queried hashtags. A hashtag's cached results are dropped as
+    soon as its posts change on disk. Outdated snapshots are rebuilt in
+    memory, so nothing is written to the data directory, unless
+    `save_snapshots` is True, in which case they are saved like `--table`
+    does."""
+
+    def __init__(
+        self,
+        data_dir: Path,
+        cache_size: int = CACHE_SIZE,
+        save_snapshots: bool = False,
+    ):
+        self.data_dir = Path(data_dir)
+        self.cache_size = max(1, cache_size)
+        self.save_snapshots = save_snapshots
+        self._cache: "OrderedDict[str, CachedHashtag]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading: Dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def hashtags(self) -> List[str]:
+        """Return the hashtags that have posts stored in the data directory."""
+        return scraped_hashtags(self.data_dir)
+
+    def __contains__(self, hashtag: str) -> bool:
+        return open_store(self.data_dir / hashtag).exists()
+
+    def _lookup(self, hashtag: str) -> Optional[CachedHashtag]:
+        """Return the cached snapshot and results of a hashtag, unless they
+        aren't cached or its posts have changed since."""
+
+        with self._lock:
+            entry = self._cache.get(hashtag)
+            if entry is None:
+                return None
+            if entry.store.signature() == entry.signature:
+                self._cache.move_to_end(hashtag)
+                self.hits += 1
+                return entry
+            logger.debug(f"Posts of hashtag '{hashtag}' changed, dropping cache")
+            del self._cache[hashtag]
+            self.invalidations += 1
+            return None
+
+    def _entry(self, hashtag: str) -> CachedHashtag:
+        """Return the cached snapshot and results of a hashtag, loading its
+        snapshot if it isn't cached or its posts have changed."""
+
+        entry = self._lookup(hashtag)
+        if entry is not None:
+            return entry
+
+        # Only one thread loads each hashtag, and the others wait for it,
+        # while other hashtags can still be queried
+        with self._lock:
+            loading = self._loading.setdefault(hashtag, threading.Lock())
+        with loading:
+            entry = self._lookup(hashtag)
+            if entry is not None:
+                return entry
+            store = open_store(self.data_dir / hashtag)
+            if not store.exists():
+                raise KeyError(f"No posts were scraped for the hashtag: {hashtag}")
+            # The signature is read first, so that changes made while loading
+            # are noticed on the next query
+            signature = store.signature()
+            columns = PostSnapshot(store=store).columns(save=self.save_snapshots)
+            entry = CachedHashtag(
+                store=store, signature=signature, columns=LazyColumns(columns)
+            )
+            with self._lock:
+                self.misses += 1
+                self._cache[hashtag] = entry
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return entry
+
+    def _memoized(
+        self, hashtag: str, key: Tuple, compute: Callable[[Mapping], Any]
+    ) -> Any:
+        entry = self._entry(hashtag)
+        if key not in entry.results:
+            entry.results[key] = compute(entry.columns)
+        return entry.results[key]
+
+    def cache_info(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "size": len(self._cache),
+                "max_size": self.cache_size,
+            }
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    def columns(self, hashtag: str) -> Mapping[str, np.ndarray]:
+        """Return the columns of a hashtag's post snapshot (see
+        `snapshot.extract_columns`)."""
+        return self._entry(hashtag).columns
+
+    def posts(self, hashtag: str, fields: Optional[List[str]] = None) -> Iterator[Dict]:
+        """Iterate over the raw posts stored for a hashtag, optionally only
+        reading the specified top-level fields. Posts aren't cached."""
+        return open_store(self.data_dir / hashtag).iter_posts(fields=fields)
+
+    def post_count(self, hashtag: str) -> int:
+        return self._memoized(
+            hashtag, ("post_count",), lambda columns: len(columns["id"])
+        )
+
+    def cooccurrences(self, hashtag: str) -> Counter:
+        """Count how frequently hashtags co-occur with a source hashtag."""
+        return Counter(self._memoized(hashtag, ("cooccurrences",), hashtag_counts))
+
+    def top_cooccurring(self, hashtag: str, number: int = 20) -> List[Tuple[str, int]]:
+        """Return the `number` most commonly co-occurring hashtags of a
+        source hashtag (including the source hashtag itself, as in
+        `--table`), with the number of posts they were used in."""
+        return self._memoized(
+            hashtag,
+            ("top_cooccurring", number),
+            lambda columns: hashtag_counts(columns).most_common(number),
+        )
+
+    def emerging(
+        self,
+        hashtag: str,
+        number: int = 20,
+        bucket: str = "day",
+        window: int = 7,
+        min_count: int = 1,
+    ) -> List[Dict]:
+        """Return the co-occurring hashtags of a source hashtag that were
+        used more often than expected in the latest `window` buckets (see
+        `HashtagTrends.emerging`)."""
+        return self._memoized(
+            hashtag,
+            ("emerging", number, bucket, window, min_count),
+            lambda columns: HashtagTrends(
+                columns=columns, bucket=bucket, window=window
+            ).emerging(number=number, min_count=min_count, exclude=(hashtag,)),
+        )
+
+    def top_posts(
+        self, hashtag: str, number: int = 10, by: str = "play_count"
+    ) -> List[Dict]:
+        """Return the `number` posts of a hashtag with the highest value of
+        one of the stats columns, such as `play_count`."""
+
+        if by not in STATS_COLUMNS:
+            raise ValueError(
+                f"Unknown stats column '{by}', choose from {list(STATS_COLUMNS)}"
+            )
+
+        def compute(columns: Mapping[str, np.ndarray]) -> List[Dict]:
+            order = np.argsort(-columns[by], kind="stable")[:number]
+            return [
+                {
+                    "id": columns["id"][i].item(),
+                    "author": columns["author"][i].item(),
+                    "create_time": int(columns["create_time"][i]),
+                    by: int(columns[by][i]),
+                }
+                for i in order.tolist()
+            ]
+
+        return self._memoized(hashtag, ("top_posts", number, by), compute)
+
+    def post_counts(self, hashtags: Optional[List[str]] = None) -> Dict[str, int]:
+        """Count the posts of many hashtags at once (all scraped hashtags by
+        default)."""
+        hashtags = self.hashtags() if hashtags is None else hashtags
+        return {hashtag: self.post_count(hashtag) for hashtag in hashtags}
+
+    def top_cooccurring_many(
+        self, hashtags: Optional[List[str]] = None, number: int = 20
+    ) -> Dict[str, List[Tuple[str, int]]]:
+        """Return the most commonly co-occurring hashtags of many source
+        hashtags at once (all scraped hashtags by default)."""
+        hashtags = self.hashtags() if hashtags is None else hashtags
+        return {
+            hashtag: self.top_cooccurring(hashtag, number=number)
+            for hashtag in hashtags
+        }
+
+    def combined_cooccurrences(self, hashtags: Optional[List[str]] = None) -> Counter:
+        """Count how frequently hashtags are used across the posts of many
+        source hashtags (all scraped hashtags by default). Posts scraped for
+        more than one of the hashtags are only counted once."""
+
+        hashtags = self.hashtags() if hashtags is None else hashtags
+        counts: Counter = Counter()
+        seen_ids = np.array([], dtype=str)
+        for hashtag in hashtags:
+            columns = self.columns(hashtag)
+            keep = ~np.isin(columns["id"], seen_ids)
+            lengths = np.diff(columns["hashtag_offsets"])
+            codes = columns["hashtag_codes"][np.repeat(keep, lengths)]
+            vocabulary = columns["vocabulary"]
+            code_counts = np.bincount(codes, minlength=len(vocabulary))
+            used = np.flatnonzero(code_counts)
+            counts.update(
+                dict(zip(vocabulary[used].tolist(), code_counts[used].tolist()))
+            )
+            seen_ids = np.concatenate([seen_ids, columns["id"][keep]])
+        return counts
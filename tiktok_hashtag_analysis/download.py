@@ -0,0 +1,338 @@
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+from dataclasses import dataclass
+from urllib.error import HTTPError
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Callable, Optional, Tuple, TYPE_CHECKING
+
+import requests
+from requests.adapters import HTTPAdapter
+from tenacity import retry, TryAgain, wait_exponential
+
+from .metrics import record_retry
+from .storage import atomic_write
+
+if TYPE_CHECKING:
+    import yt_dlp
+
+logger = logging.getLogger(__name__)
+
+# Size of the chunks that downloaded files are streamed to disk in
+CHUNK_SIZE = 256 * 1024
+
+_session: Optional[requests.Session] = None
+_session_pool_size = 0
+_session_lock = threading.Lock()
+
+
+def get_session(pool_size: int = 10) -> requests.Session:
+    """Return the HTTP session shared by all media downloads, so that
+    connections are kept alive and reused between requests. The session is
+    recreated with a larger connection pool if `pool_size` connections per
+    host are needed."""
+
+    global _session, _session_pool_size
+    with _session_lock:
+        if _session is None or _session_pool_size < pool_size:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session, _session_pool_size = session, pool_size
+        return _session
+
+
+@retry(
+    wait=wait_exponential(multiplier=1, max=10), before_sleep=record_retry("download")
+)
+def _get(url: str) -> requests.Response:
+    """Safe version of requests.get that can handle timeouts and retries. The
+    response body is streamed, so the response must be closed by the caller."""
+
+    r = get_session().get(url=url, timeout=30, stream=True)
+    if r.status_code not in {200, 403}:
+        r.close()
+        raise TryAgain
+    else:
+        return r
+
+
+class MediaUnavailable(Exception):
+    """Raised when TikTok refuses access to a media file."""
+
+
+def save_file(url: str, filepath: Path) -> Tuple[int, Path]:
+    """Download a file from a specified URL and write its contents to a file,
+    with an extension taken from the response's content type. The file is
+    streamed to a temporary file in chunks and then renamed, so partially
+    downloaded files are never left behind. Returns the number of bytes
+    written and the path of the file."""
+
+    with _get(url=url) as r:
+        if r.status_code == 403:
+            raise MediaUnavailable(f"Access to {url} is forbidden (HTTP 403)")
+        ext = r.headers["Content-Type"].split("/")[-1]
+        path_with_ext = filepath.with_suffix(f".{ext}")
+        nbytes = 0
+        with atomic_write(path_with_ext, "wb", suffix=".part") as f:
+            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+                nbytes += len(chunk)
+    logger.debug(f"Saved file to: {path_with_ext}")
+    return nbytes, path_with_ext
+
+
+def download_file_and_save(url: str, filepath: Path) -> int:
+    """Download a file from a specified URL and write its contents to a file.
+    Returns the number of bytes written, which is 0 if access to the file is
+    forbidden."""
+
+    try:
+        nbytes, _ = save_file(url=url, filepath=filepath)
+    except MediaUnavailable:
+        return 0
+    return nbytes
+
+
+@dataclass
+class DownloadJob:
+    """A single item of media to download. Jobs of kind `file` are fetched
+    directly and saved to `path` (with an extension taken from the response),
+    while jobs of kind `video` are downloaded with yt-dlp into the directory
+    `path`."""
+
+    url: str
+    path: Path
+    kind: str = "file"
+    post_id: Optional[str] = None
+
+    @property
+    def media_dir(self) -> Path:
+        """The folder that the job's files are saved in."""
+        return self.path if self.kind == "video" else self.path.parent
+
+    @property
+    def host(self) -> str:
+        return urlparse(self.url).netloc
+
+
+def video_jobs(video_data: Dict, video_dir: Path) -> List[DownloadJob]:
+    """List the downloads needed to save the media of a single post."""
+
+    if video_data.get("imagePost") is not None:
+        return gallery_jobs(video_data=video_data, video_dir=video_dir)
+    # The URL of a video can't be built without its author's username
+    author = (video_data.get("author") or {}).get("uniqueId")
+    if not author:
+        return []
+    url = f"https://www.tiktok.com/@{author}/video/{video_data['id']}"
+    return [
+        DownloadJob(url=url, path=video_dir, kind="video", post_id=video_data["id"])
+    ]
+
+
+def gallery_jobs(video_data: Dict, video_dir: Path) -> List[DownloadJob]:
+    """yt-dlp doesn't support downloading images from an image gallery,
+    so this lists all images and audio files of an image gallery as separate
+    file downloads."""
+
+    jobs = []
+    video_id = video_data["id"]
+    # A small percentage of image galleries don't have an associated audio file
+    if play_url := video_data["music"]["playUrl"]:
+        jobs.append(
+            DownloadJob(url=play_url, path=video_dir / f"{video_id}", post_id=video_id)
+        )
+
+    for i, image in enumerate(video_data["imagePost"]["images"]):
+        image_url = image["imageURL"]["urlList"][0]
+        jobs.append(
+            DownloadJob(
+                url=image_url, path=video_dir / f"{video_id}_{i:02d}", post_id=video_id
+            )
+        )
+    return jobs
+
+
+def download_gallery(video_data: Dict, video_dir: Path):
+    """yt-dlp doesn't support downloading images from an image gallery,
+    so this downloads all images and audio files from image galleries."""
+
+    for job in gallery_jobs(video_data=video_data, video_dir=video_dir):
+        download_file_and_save(url=job.url, filepath=job.path)
+
+
+class HostRateLimiter:
+    """Space out requests made to the same host so that no more than `rate`
+    requests per second are started for each host."""
+
+    def __init__(self, rate: Optional[float] = None):
+        self.interval = 1 / rate if rate else 0
+        self._next_slot: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host: str):
+        """Block until a request to `host` may be started."""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class DownloadProgress:
+    """Thread-safe tally of completed downloads, used to report throughput."""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.completed = 0
+        self.failed = 0
+        self.bytes = 0
+        self.start_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, nbytes: int = 0, failed: bool = False):
+        with self._lock:
+            self.completed += 1
+            self.failed += failed
+            self.bytes += nbytes
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start_time
+
+    def summary(self) -> str:
+        elapsed = max(self.elapsed, 1e-9)
+        return (
+            f"Downloaded {self.completed}/{self.total} items ({self.failed} failed), "
+            f"{self.bytes / 1e6:.1f} MB in {elapsed:.1f}s "
+            f"({self.completed / elapsed:.2f} items/s, "
+            f"{self.bytes / 1e6 / elapsed:.2f} MB/s)"
+        )
+
+
+class DownloadEngine:
+    """Download media with a pool of worker threads. Direct file downloads
+    (image gallery images and audio) and yt-dlp video downloads share one
+    queue, and requests to each host can be rate limited."""
+
+    def __init__(
+        self,
+        workers: int = 4,
+        rate_limit: Optional[float] = None,
+        quiet: bool = True,
+    ):
+        self.workers = max(1, workers)
+        # Make sure every worker can keep a connection to a host alive
+        get_session(pool_size=self.workers)
+        self.rate_limiter = HostRateLimiter(rate=rate_limit)
+        self.quiet = quiet
+        self._local = threading.local()
+        self._ydls: List["yt_dlp.YoutubeDL"] = []
+        self._ydls_lock = threading.Lock()
+
+    def _ydl(self, video_dir: Path) -> "yt_dlp.YoutubeDL":
+        """Return this worker thread's yt-dlp instance for a directory."""
+        # yt-dlp is slow to import, so it is only imported once videos are
+        # downloaded
+        import yt_dlp
+
+        if not hasattr(self._local, "ydls"):
+            self._local.ydls = {}
+        if video_dir not in self._local.ydls:
+            ydl_opts = {
+                "outtmpl": os.path.join(video_dir, "%(id)s.%(ext)s"),
+                "ignore_errors": True,
+                "quiet": self.quiet,
+                "noprogress": self.quiet,
+                "progress_hooks": [self._count_video_bytes],
+            }
+            ydl = yt_dlp.YoutubeDL(ydl_opts)
+            self._local.ydls[video_dir] = ydl
+            with self._ydls_lock:
+                self._ydls.append(ydl)
+        return self._local.ydls[video_dir]
+
+    def _count_video_bytes(self, status: Dict):
+        if status["status"] == "finished":
+            self._local.video_bytes += (
+                status.get("total_bytes") or status.get("downloaded_bytes") or 0
+            )
+            if status.get("filename"):
+                self._local.video_files.append(Path(status["filename"]))
+
+    def _download(self, job: DownloadJob) -> Tuple[int, List[Path]]:
+        """Download a single job and return the number of bytes saved, and
+        the files they were saved to."""
+        self.rate_limiter.wait(job.host)
+        if job.kind == "video":
+            self._local.video_bytes = 0
+            self._local.video_files = []
+            if self._ydl(job.path).download([job.url]) != 0:
+                from yt_dlp.utils import DownloadError
+
+                raise DownloadError(f"yt-dlp could not download {job.url}")
+            return self._local.video_bytes, self._local.video_files
+        nbytes, file_path = save_file(url=job.url, filepath=job.path)
+        return nbytes, [file_path]
+
+    def run(
+        self,
+        jobs: List[DownloadJob],
+        on_result: Optional[
+            Callable[[DownloadJob, int, List[Path], Optional[Exception]], None]
+        ] = None,
+    ) -> DownloadProgress:
+        """Download all jobs and return a summary of the downloads. If
+        `on_result` is specified, it is called with each job as it completes,
+        with the number of bytes and files saved, and the error it failed
+        with, if any."""
+
+        progress = DownloadProgress(total=len(jobs))
+        if not jobs:
+            return progress
+        log_every = max(1, len(jobs) // 10)
+        from yt_dlp.utils import ExtractorError, DownloadError
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {executor.submit(self._download, job): job for job in jobs}
+                for future in as_completed(futures):
+                    job = futures[future]
+                    try:
+                        nbytes, files = future.result()
+                    except (
+                        HTTPError,
+                        TypeError,
+                        ExtractorError,
+                        DownloadError,
+                        MediaUnavailable,
+                        requests.RequestException,
+                        OSError,
+                    ) as e:
+                        # Catch urllib, requests and yt-dlp errors when media not found
+                        logger.warning(
+                            f"Encountered error {e} when attempting to download url: {job.url}"
+                        )
+                        progress.record(failed=True)
+                        if on_result is not None:
+                            on_result(job, 0, [], e)
+                    else:
+                        progress.record(nbytes=nbytes)
+                        if on_result is not None:
+                            on_result(job, nbytes, files, None)
+                    if progress.completed % log_every == 0:
+                        logger.info(progress.summary())
+        finally:
+            for ydl in self._ydls:
+                ydl.close()
+            self._ydls.clear()
+
+        return progress
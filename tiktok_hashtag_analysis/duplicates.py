@@ -0,0 +1,456 @@
+import re
+import csv
+import zlib
+import logging
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+from .storage import atomic_write, open_store, scraped_hashtags
+
+logger = logging.getLogger(__name__)
+
+# File in the data directory that caption signatures are saved to, so that
+# later runs only hash the captions of new and edited posts
+SIGNATURES_FILE = "caption_signatures.npz"
+SIGNATURES_VERSION = 1
+
+# Name of the file that clusters of near-duplicate captions are exported to
+DUPLICATES_FILE = "duplicate_captions.csv"
+
+# MinHash parameters. Signatures are only comparable when computed with the
+# same parameters, so changing them rehashes all captions
+NUM_PERM = 128
+SHINGLE_SIZE = 5
+SEED = 1
+
+# Default estimated Jaccard similarity of two captions' shingles above
+# which they are considered near-duplicates
+THRESHOLD = 0.8
+
+# Normalized captions shorter than this aren't compared, since short
+# captions like "follow me" are shared by unrelated posts
+MIN_CAPTION_LENGTH = 20
+
+# Share of the pairs of captions with the threshold similarity that LSH
+# banding should find, when the number of bands is chosen automatically
+TARGET_RECALL = 0.9
+
+# Number of captions shingled and hashed at once, which bounds memory use
+HASH_BATCH_SIZE = 128
+
+_EMPTY = np.iinfo(np.uint32).max
+_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+_IGNORED = re.compile(r"https?://\S+|[#@]\S+")
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize_caption(caption: str) -> str:
+    """Lowercase a caption, and drop hashtags, mentions, links, punctuation
+    and repeated whitespace, so that captions only differing in those are
+    identical."""
+    caption = _IGNORED.sub(" ", caption.lower())
+    return _NON_WORD.sub(" ", caption).strip()
+
+
+def _permutations(num_perm: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    high = np.iinfo(np.uint64).max
+    a = rng.integers(1, high, size=num_perm, dtype=np.uint64, endpoint=True) | 1
+    b = rng.integers(0, high, size=num_perm, dtype=np.uint64, endpoint=True)
+    return a, b
+
+
+def minhash_signatures(
+    captions: List[str],
+    num_perm: int = NUM_PERM,
+    shingle_size: int = SHINGLE_SIZE,
+    seed: int = SEED,
+) -> np.ndarray:
+    """Compute the MinHash signatures of (normalized) captions, as an array
+    with one row of `num_perm` values per caption.
+
+    Captions are split into overlapping shingles of `shingle_size`
+    characters, and the shingles of a batch of captions are hashed at once:
+    each is given a 64-bit rolling hash, which is then hashed again with
+    `num_perm` multiply-shift hash functions, whose minimum over a caption's
+    shingles are its signature. The share of equal values in two
+    signatures estimates the Jaccard similarity of the captions' shingles.
+    Captions with fewer than `shingle_size` characters have no shingles, and
+    a signature of `2**32 - 1` values."""
+
+    a, b = _permutations(num_perm, seed)
+    signatures = np.full((len(captions), num_perm), _EMPTY, dtype=np.uint32)
+    for start in range(0, len(captions), HASH_BATCH_SIZE):
+        batch = captions[start : start + HASH_BATCH_SIZE]
+        lengths = np.array([len(caption) for caption in batch], dtype=np.int64)
+        windows = np.maximum(lengths - shingle_size + 1, 0)
+        if not windows.any():
+            continue
+
+        # Code points of the captions of the batch, one after the other
+        codes = np.frombuffer(
+            "".join(batch).encode("utf-32-le"), dtype=np.uint32
+        ).astype(np.uint64)
+        positions = len(codes) - shingle_size + 1
+        hashes = np.zeros(positions, dtype=np.uint64)
+        for i in range(shingle_size):
+            hashes = hashes * _MULTIPLIER + codes[i : i + positions]
+
+        # Only keep the shingles that don't span two captions
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        window_starts = np.concatenate([[0], np.cumsum(windows)[:-1]])
+        shingles = hashes[
+            np.arange(windows.sum()) + np.repeat(starts - window_starts, windows)
+        ]
+
+        # One row per hash function, so that minimums are taken over
+        # contiguous memory
+        values = ((a[:, None] * shingles + b[:, None]) >> np.uint64(32)).astype(
+            np.uint32
+        )
+        hashed = np.flatnonzero(windows)
+        signatures[start + hashed] = np.minimum.reduceat(
+            values, window_starts[hashed], axis=1
+        ).T
+    return signatures
+
+
+def band_rows(threshold: float, num_perm: int = NUM_PERM) -> int:
+    """Choose the number of signature values in each LSH band: the largest
+    divisor of `num_perm` for which pairs of captions with the threshold
+    similarity still share a band with probability `TARGET_RECALL`. Larger
+    bands produce fewer candidate pairs below the threshold."""
+
+    rows = 1
+    for r in range(1, num_perm + 1):
+        if num_perm % r == 0:
+            bands = num_perm // r
+            if 1 - (1 - threshold**r) ** bands >= TARGET_RECALL:
+                rows = r
+    return rows
+
+
+def _connected_components(size: int, source: np.ndarray, target: np.ndarray):
+    """Label the nodes of an undirected graph with the lowest node of their
+    connected component."""
+
+    labels = np.arange(size)
+    while True:
+        previous = labels.copy()
+        np.minimum.at(labels, source, labels[target])
+        np.minimum.at(labels, target, labels[source])
+        labels = labels[labels]
+        if np.array_equal(labels, previous):
+            return labels
+
+
+class CaptionIndex:
+    """MinHash signatures of the captions of all posts scraped into a data
+    directory, to find groups of posts with near-identical captions across
+    hashtags and authors, such as those of coordinated campaigns, without
+    comparing every pair of captions.
+
+    Posts are de-duplicated across the folders of the hashtags they were
+    scraped for. Signatures are saved in the data directory with the
+    signature of the store of each hashtag they were computed from, so that
+    `update` only reads the posts of hashtags that changed, and only hashes
+    the captions of new and edited posts."""
+
+    def __init__(
+        self,
+        data_dir: Path,
+        num_perm: int = NUM_PERM,
+        shingle_size: int = SHINGLE_SIZE,
+        seed: int = SEED,
+    ):
+        self.data_dir = Path(data_dir)
+        self.signatures_file = self.data_dir / SIGNATURES_FILE
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+
+        self.ids: List[str] = []
+        self.authors: List[str] = []
+        self.captions: List[str] = []
+        self.signatures = np.empty((0, num_perm), dtype=np.uint32)
+        # Posts of each hashtag, as indices, and the signature of the store
+        # they were read from
+        self.members: Dict[str, np.ndarray] = {}
+        self.store_signatures: Dict[str, List[int]] = {}
+        self._load()
+
+    def _parameters(self) -> List[int]:
+        return [SIGNATURES_VERSION, self.num_perm, self.shingle_size, self.seed]
+
+    def _load(self):
+        try:
+            saved = np.load(self.signatures_file, allow_pickle=False)
+            if saved["parameters"].tolist() != self._parameters():
+                logger.info("Caption signature parameters changed, rehashing")
+                return
+            data = saved["caption_bytes"].tobytes()
+            offsets = saved["caption_offsets"].tolist()
+            captions = [
+                data[start:end].decode("utf-8")
+                for start, end in zip(offsets[:-1], offsets[1:])
+            ]
+            member_offsets = saved["member_offsets"].tolist()
+            members = {
+                hashtag: saved["member_posts"][start:end]
+                for hashtag, start, end in zip(
+                    saved["hashtags"].tolist(),
+                    member_offsets[:-1],
+                    member_offsets[1:],
+                )
+            }
+            ids = saved["id"].tolist()
+            authors = saved["author"].tolist()
+            signatures = saved["signatures"]
+            store_signatures = dict(
+                zip(saved["hashtags"].tolist(), saved["store_signatures"].tolist())
+            )
+        except (OSError, ValueError, KeyError):
+            return
+        self.ids, self.authors, self.captions = ids, authors, captions
+        self.signatures = signatures
+        self.members, self.store_signatures = members, store_signatures
+
+    def save(self):
+        hashtags = list(self.members)
+        encoded = [caption.encode("utf-8") for caption in self.captions]
+        arrays = {
+            "parameters": np.array(self._parameters(), dtype=np.int64),
+            "id": np.array(self.ids, dtype=str),
+            "author": np.array(self.authors, dtype=str),
+            "caption_bytes": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            "caption_offsets": np.concatenate(
+                [[0], np.cumsum([len(caption) for caption in encoded], dtype=np.int64)]
+            ),
+            "signatures": self.signatures,
+            "hashtags": np.array(hashtags, dtype=str),
+            "store_signatures": np.array(
+                [self.store_signatures[hashtag] for hashtag in hashtags],
+                dtype=np.int64,
+            ).reshape(-1, 2),
+            "member_posts": np.concatenate(
+                [np.empty(0, dtype=np.int64)]
+                + [self.members[hashtag] for hashtag in hashtags]
+            ),
+            "member_offsets": np.concatenate(
+                [[0], np.cumsum([len(self.members[h]) for h in hashtags])]
+            ).astype(np.int64),
+        }
+        with atomic_write(self.signatures_file, "wb") as f:
+            np.savez(f, allow_pickle=False, **arrays)
+
+    def update(self, save: bool = True) -> int:
+        """Read the posts of hashtags scraped since the signatures were last
+        updated, and hash the captions of new and edited posts. Returns the
+        number of captions hashed."""
+
+        hashtags = scraped_hashtags(data_dir=self.data_dir)
+        for hashtag in set(self.members) - set(hashtags):
+            del self.members[hashtag]
+            del self.store_signatures[hashtag]
+
+        index = {post_id: i for i, post_id in enumerate(self.ids)}
+        digests = None
+        changed: List[int] = []
+        for hashtag in hashtags:
+            store = open_store(hashtag_dir=self.data_dir / hashtag)
+            signature = store.signature()
+            if self.store_signatures.get(hashtag) == signature:
+                continue
+            if digests is None:
+                digests = [zlib.crc32(caption.encode()) for caption in self.captions]
+
+            members = []
+            for post in store.iter_posts(fields=["id", "desc", "author"]):
+                caption = post.get("desc") or ""
+                digest = zlib.crc32(caption.encode())
+                i = index.get(post["id"])
+                if i is None:
+                    i = index[post["id"]] = len(self.ids)
+                    self.ids.append(post["id"])
+                    self.authors.append("")
+                    self.captions.append(caption)
+                    digests.append(digest)
+                    changed.append(i)
+                elif digests[i] != digest:
+                    self.captions[i] = caption
+                    digests[i] = digest
+                    changed.append(i)
+                self.authors[i] = (post.get("author") or {}).get("uniqueId") or ""
+                members.append(i)
+            self.members[hashtag] = np.array(members, dtype=np.int64)
+            self.store_signatures[hashtag] = signature
+
+        if changed:
+            changed = sorted(set(changed))
+            self.signatures = np.concatenate(
+                [
+                    self.signatures,
+                    np.full(
+                        (len(self.ids) - len(self.signatures), self.num_perm),
+                        _EMPTY,
+                        dtype=np.uint32,
+                    ),
+                ]
+            )
+            # Identical captions are only hashed once
+            unique: Dict[str, int] = {}
+            inverse = []
+            for i in changed:
+                caption = normalize_caption(self.captions[i])
+                if len(caption) < MIN_CAPTION_LENGTH:
+                    caption = ""
+                inverse.append(unique.setdefault(caption, len(unique)))
+            hashed = minhash_signatures(
+                list(unique),
+                num_perm=self.num_perm,
+                shingle_size=self.shingle_size,
+                seed=self.seed,
+            )
+            self.signatures[changed] = hashed[inverse]
+            logger.info(
+                f"Hashed {len(unique)} distinct captions of {len(changed)} new or "
+                f"edited posts"
+            )
+        if save and digests is not None:
+            self.save()
+        return len(changed)
+
+    def _post_hashtags(self, posts: np.ndarray) -> Dict[int, List[str]]:
+        hashtags: Dict[int, List[str]] = {int(i): [] for i in posts}
+        for hashtag, members in self.members.items():
+            for i in members[np.isin(members, posts)].tolist():
+                hashtags[i].append(hashtag)
+        return hashtags
+
+    def duplicates(
+        self,
+        threshold: float = THRESHOLD,
+        min_size: int = 2,
+        min_authors: int = 1,
+        bands: Optional[int] = None,
+    ) -> List[Dict]:
+        """Find clusters of posts whose captions have an estimated Jaccard
+        similarity of at least `threshold` to another post of the cluster,
+        with at least `min_size` posts by `min_authors` distinct authors.
+        Clusters are sorted by decreasing number of authors and posts.
+
+        Signatures are split into `bands` (chosen with `band_rows` by
+        default), and posts whose signatures are equal in any band are
+        candidate duplicates. Each candidate is compared to the first post
+        sharing the band, so the work is linear in the number of posts
+        rather than quadratic."""
+
+        if bands is None:
+            bands = self.num_perm // band_rows(threshold, self.num_perm)
+        if self.num_perm % bands:
+            raise ValueError(
+                f"{self.num_perm} permutations can't be split into {bands} bands"
+            )
+        rows = self.num_perm // bands
+
+        in_corpus = np.zeros(len(self.ids), dtype=bool)
+        for members in self.members.values():
+            in_corpus[members] = True
+        posts = np.flatnonzero(in_corpus & (self.signatures[:, 0] != _EMPTY))
+        signatures = self.signatures[posts]
+        if not posts.size:
+            return []
+
+        source, target = [], []
+        for band in range(bands):
+            band_signatures = np.ascontiguousarray(
+                signatures[:, band * rows : (band + 1) * rows]
+            )
+            # Compare each post's rows of the band as a single value
+            keys = band_signatures.view(
+                np.dtype((np.void, band_signatures.dtype.itemsize * rows))
+            ).ravel()
+            _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+            representative = first[inverse.ravel()]
+            candidates = np.flatnonzero(representative != np.arange(len(posts)))
+            source.append(candidates)
+            target.append(representative[candidates])
+        pairs = np.unique(
+            np.stack([np.concatenate(source), np.concatenate(target)], axis=1), axis=0
+        )
+
+        # Keep the candidates whose estimated similarity is high enough,
+        # comparing a bounded number of signatures at once
+        similar = np.zeros(len(pairs), dtype=bool)
+        for start in range(0, len(pairs), 1 << 16):
+            chunk = pairs[start : start + (1 << 16)]
+            similarity = (signatures[chunk[:, 0]] == signatures[chunk[:, 1]]).mean(1)
+            similar[start : start + len(chunk)] = similarity >= threshold
+        pairs = pairs[similar]
+        labels = _connected_components(len(posts), pairs[:, 0], pairs[:, 1])
+
+        _, inverse, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+        clustered = posts[sizes[inverse.ravel()] >= min_size]
+        hashtags = self._post_hashtags(clustered)
+        groups: Dict[int, List[int]] = {}
+        for post, label in zip(posts.tolist(), labels.tolist()):
+            if post in hashtags:
+                groups.setdefault(label, []).append(post)
+
+        clusters = []
+        for group in groups.values():
+            authors = sorted(set(self.authors[i] for i in group))
+            if len(authors) < min_authors:
+                continue
+            clusters.append(
+                {
+                    "caption": self.captions[group[0]],
+                    "authors": authors,
+                    "hashtags": sorted(set(h for i in group for h in hashtags[i])),
+                    "posts": [
+                        {
+                            "id": self.ids[i],
+                            "author": self.authors[i],
+                            "caption": self.captions[i],
+                            "hashtags": sorted(hashtags[i]),
+                        }
+                        for i in group
+                    ],
+                }
+            )
+        clusters.sort(
+            key=lambda cluster: (-len(cluster["authors"]), -len(cluster["posts"]))
+        )
+        return clusters
+
+    def export_csv(self, file_path: Path, **kwargs) -> int:
+        """Write the posts of each cluster of near-duplicate captions to a
+        CSV file, taking the same arguments as `duplicates`. Returns the
+        number of clusters."""
+
+        clusters = self.duplicates(**kwargs)
+        with open(file_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(
+                ["cluster", "posts", "authors", "id", "author", "hashtags", "caption"]
+            )
+            for number, cluster in enumerate(clusters, start=1):
+                for post in cluster["posts"]:
+                    writer.writerow(
+                        [
+                            number,
+                            len(cluster["posts"]),
+                            len(cluster["authors"]),
+                            post["id"],
+                            post["author"],
+                            " ".join(post["hashtags"]),
+                            post["caption"],
+                        ]
+                    )
+        logger.info(
+            f"{len(clusters)} clusters of near-duplicate captions saved to file: "
+            f"{file_path}"
+        )
+        return len(clusters)
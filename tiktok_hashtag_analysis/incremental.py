@@ -0,0 +1,125 @@
+import json
+import time
+import logging
+from pathlib import Path
+from typing import List, Dict, Callable, Optional, Set, AsyncIterator
+
+from .storage import PostStore, file_lock, write_json
+
+logger = logging.getLogger(__name__)
+
+# File in the data directory that the time of each hashtag's last full scrape
+# is saved to
+FULL_SCRAPES_FILE = "full_scrapes.json"
+
+# Number of posts of a hashtag's feed that are saved at a time while scraping
+BATCH_SIZE = 300
+
+
+async def stream_posts(
+    videos: AsyncIterator,
+    hashtag: str,
+    known_ids: Optional[Set[str]] = None,
+    stop_after_known: int = 0,
+    batch_size: int = BATCH_SIZE,
+) -> AsyncIterator[List[Dict]]:
+    """Yield the raw data of the posts in a hashtag's feed in batches of up
+    to `batch_size` posts, as they are fetched. If `known_ids` is specified,
+    stop paginating once `stop_after_known` posts in a row were already
+    scraped, as the rest of the feed probably was too, unless
+    `stop_after_known` is 0. The known posts that were seen are still
+    yielded, so that their stats are updated."""
+
+    batch = []
+    fetched = 0
+    known_run = 0
+    try:
+        async for video in videos:
+            post = video.as_dict
+            batch.append(post)
+            fetched += 1
+            if known_ids is not None and stop_after_known > 0:
+                known_run = known_run + 1 if post.get("id") in known_ids else 0
+                if known_run >= stop_after_known:
+                    logger.info(
+                        f"Stopped scraping hashtag '{hashtag}' after {known_run} "
+                        f"previously scraped posts in a row ({fetched} posts fetched)"
+                    )
+                    break
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        # Stop fetching further pages of the feed
+        aclose = getattr(videos, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+class IncrementalScrapes:
+    """Decide which hashtags can be scraped incrementally, stopping once
+    `stop_after_known` previously scraped posts in a row are found, and
+    which are due a full scrape of up to `--limit` posts, to update the
+    stats of older posts. A hashtag is scraped in full if it hasn't been in
+    the last `full_refresh` seconds (or never, if `full_refresh` is None)."""
+
+    def __init__(
+        self,
+        stop_after_known: int,
+        state_file: Optional[Path] = None,
+        full_refresh: Optional[float] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.stop_after_known = max(1, stop_after_known)
+        self.state_file = state_file
+        self.full_refresh = full_refresh
+        self.clock = clock
+        self.full_scrapes: Dict[str, float] = self._load()
+        # Hashtags that are being scraped in full
+        self.pending: Set[str] = set()
+
+    def _load(self) -> Dict[str, float]:
+        if self.state_file is None:
+            return {}
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return json.load(fp=f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        if self.state_file is None:
+            return
+        write_json(self.state_file, self.full_scrapes)
+
+    def known_ids(self, hashtag: str, store: PostStore) -> Optional[Set[str]]:
+        """Return the IDs of the posts previously scraped for a hashtag, at
+        which an incremental scrape stops, or None if the hashtag is due a
+        full scrape."""
+
+        if self.full_refresh is not None:
+            last_full_scrape = self.full_scrapes.get(hashtag)
+            if last_full_scrape is None or (
+                self.clock() - last_full_scrape >= self.full_refresh
+            ):
+                logger.debug(f"Hashtag '{hashtag}' is due a full scrape")
+                self.pending.add(hashtag)
+                return None
+        return store.ids() if store.exists() else None
+
+    def record(self, hashtag: str):
+        """Record that a hashtag was scraped, so that the time of its last
+        full scrape is saved if it was scraped in full."""
+
+        if hashtag in self.pending:
+            self.pending.discard(hashtag)
+            if self.state_file is None:
+                self.full_scrapes[hashtag] = self.clock()
+                return
+            # Other workers may have recorded full scrapes in the meantime
+            with file_lock(self.state_file):
+                self.full_scrapes = self._load()
+                self.full_scrapes[hashtag] = self.clock()
+                self.save()
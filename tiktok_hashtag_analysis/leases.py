@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Callable, Iterable, Iterator, Optional, Set
+
+from .storage import write_json
+
+logger = logging.getLogger(__name__)
+
+# Folder in the data directory that lease files are created in
+LEASES_DIR = "leases"
+
+# Number of seconds a lease is valid for without being renewed
+LEASE_TTL = 10 * 60
+
+
+def worker_id() -> str:
+    """Identify this process uniquely, across all hosts sharing a data
+    directory."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaseManager:
+    """Leases on hashtags, held as lock files in the data directory, so that
+    several workers (processes on one host, or hosts sharing the data
+    directory over NFS) never scrape the same hashtag at the same time.
+    Leases only rely on exclusive creation, renaming and hard links, which
+    are atomic on NFS too.
+
+    A lease file is created exclusively, so only one worker can hold it.
+    Held leases are renewed in a background thread, and a lease that hasn't
+    been renewed for `ttl` seconds, because its worker crashed, can be taken
+    over by another worker."""
+
+    def __init__(
+        self,
+        data_dir: Path,
+        ttl: float = LEASE_TTL,
+        owner: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.lease_dir = Path(data_dir) / LEASES_DIR
+        self.lease_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.owner = owner or worker_id()
+        self.clock = clock
+        self.held: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self):
+        """Start renewing held leases in the background."""
+        self._stopped.clear()
+        self._heartbeat = threading.Thread(target=self._renew_periodically, daemon=True)
+        self._heartbeat.start()
+
+    def stop(self):
+        """Stop renewing leases, and release all held leases."""
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+        self.release_all()
+
+    def lease_file(self, name: str) -> Path:
+        return self.lease_dir / f"{name}.lease"
+
+    def read(self, name: str) -> Optional[Dict]:
+        """Return the current lease on a name, or None if there is none."""
+        try:
+            with open(self.lease_file(name), "r", encoding="utf-8") as f:
+                return json.load(fp=f)
+        except (OSError, ValueError):
+            return None
+
+    def _lease(self) -> Dict:
+        now = self.clock()
+        return {"owner": self.owner, "renewed": now, "expires": now + self.ttl}
+
+    def _create(self, name: str) -> bool:
+        """Create a lease file, unless one already exists."""
+        try:
+            fd = os.open(self.lease_file(name), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self._lease(), fp=f)
+        return True
+
+    def _expired(self, lease_file: Path) -> bool:
+        """Whether the lease in a file has expired. A lease file that can't
+        be read may still be being written, so it only expires once it
+        hasn't been modified for the lease's lifetime."""
+        try:
+            with open(lease_file, "r", encoding="utf-8") as f:
+                return json.load(fp=f)["expires"] <= self.clock()
+        except FileNotFoundError:
+            return True
+        except (OSError, ValueError, KeyError):
+            try:
+                return lease_file.stat().st_mtime + self.ttl <= self.clock()
+            except FileNotFoundError:
+                return True
+
+    def _break_expired(self, name: str) -> bool:
+        """Remove a lease that has expired, so that it can be taken over.
+        The lease file is first renamed to a name unique to this worker, so
+        that only one worker can break it."""
+
+        if not self._expired(self.lease_file(name)):
+            return False
+        taken = self.read(name)
+        broken = self.lease_dir / f".{name}.{uuid.uuid4().hex}.broken"
+        try:
+            os.rename(self.lease_file(name), broken)
+        except FileNotFoundError:
+            # Released, or broken by another worker in the meantime
+            return True
+        if not self._expired(broken):
+            # The lease was renewed just before it was renamed, so give it back
+            try:
+                os.link(broken, self.lease_file(name))
+            except OSError:
+                pass
+            os.remove(broken)
+            return False
+        os.remove(broken)
+        owner = "an unknown worker" if taken is None else taken["owner"]
+        logger.warning(f"Took over expired lease on '{name}' held by {owner}")
+        return True
+
+    def acquire(self, name: str) -> bool:
+        """Try to lease a name, returning whether this worker now holds it."""
+
+        with self._lock:
+            if name in self.held:
+                return True
+            if not self._create(name):
+                if not self._break_expired(name) or not self._create(name):
+                    return False
+            self.held.add(name)
+        logger.debug(f"Leased '{name}' as {self.owner}")
+        return True
+
+    def renew(self, name: str) -> bool:
+        """Extend a held lease. Returns False, and forgets the lease, if it
+        has been taken over by another worker in the meantime.
+
+        As when breaking a lease, the lease file is first renamed to a name
+        unique to this worker, so that it can't be taken over while it is
+        rewritten. The renewed lease is then linked back, which fails rather
+        than overwriting a lease created by another worker meanwhile."""
+
+        with self._lock:
+            if name not in self.held:
+                return False
+            renewing = self.lease_dir / f".{name}.{uuid.uuid4().hex}.renewing"
+            try:
+                os.rename(self.lease_file(name), renewing)
+            except FileNotFoundError:
+                return self._lost(name)
+            try:
+                with open(renewing, "r", encoding="utf-8") as f:
+                    owner = json.load(fp=f).get("owner")
+            except (OSError, ValueError):
+                owner = None
+            if owner != self.owner:
+                # Give the other worker's lease back
+                try:
+                    os.link(renewing, self.lease_file(name))
+                except OSError:
+                    pass
+                os.remove(renewing)
+                return self._lost(name)
+            write_json(renewing, self._lease())
+            try:
+                os.link(renewing, self.lease_file(name))
+            except FileExistsError:
+                return self._lost(name)
+            finally:
+                os.remove(renewing)
+            return True
+
+    def _lost(self, name: str) -> bool:
+        logger.warning(f"Lost lease on '{name}'")
+        self.held.discard(name)
+        return False
+
+    def release(self, name: str):
+        """Give up a held lease."""
+
+        with self._lock:
+            if name not in self.held:
+                return
+            self.held.discard(name)
+            lease = self.read(name)
+            if lease is not None and lease["owner"] == self.owner:
+                self.lease_file(name).unlink(missing_ok=True)
+
+    def release_all(self):
+        for name in list(self.held):
+            self.release(name)
+
+    def renew_all(self):
+        for name in list(self.held):
+            self.renew(name)
+
+    def _renew_periodically(self):
+        while not self._stopped.wait(self.ttl / 3):
+            self.renew_all()
+
+    def claim(self, names: Iterable[str]) -> Iterator[str]:
+        """Lease names one at a time, skipping those leased by other
+        workers, and yield each name once it is leased."""
+        for name in names:
+            if self.acquire(name):
+                yield name
+            else:
+                lease = self.read(name)
+                owner = "another worker" if lease is None else lease["owner"]
+                logger.info(f"Skipping '{name}', which is leased by {owner}")
@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+from pathlib import Path
+from typing import List, Dict, Callable, Optional, Set
+
+from .media import is_media_file, media_post_id
+from .database import SQLITE_TIMEOUT, journal_mode
+
+logger = logging.getLogger(__name__)
+
+# Name of the manifest file created in the data directory
+MANIFEST_FILE = "downloads.sqlite"
+
+# Failed downloads are retried after this many seconds, doubling with every
+# further failure up to the maximum
+RETRY_DELAY = 60 * 60
+MAX_RETRY_DELAY = 30 * 24 * 60 * 60
+
+SCHEMA = """
+-- Outcome of downloading the media of each post into each media folder
+CREATE TABLE IF NOT EXISTS media (
+    directory TEXT NOT NULL,
+    post_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    last_error TEXT,
+    bytes INTEGER NOT NULL,
+    files TEXT NOT NULL,
+    updated REAL NOT NULL,
+    retry_after REAL,
+    PRIMARY KEY (directory, post_id)
+) WITHOUT ROWID;
+
+-- Media folders whose existing files have been recorded in the manifest
+CREATE TABLE IF NOT EXISTS directories (
+    directory TEXT PRIMARY KEY
+) WITHOUT ROWID;
+"""
+
+DOWNLOADED = "downloaded"
+FAILED = "failed"
+# Posts without any media that can be downloaded, such as posts without an
+# author, which are never requested
+SKIPPED = "skipped"
+# Reason recorded for posts that are skipped as they have no media
+NO_MEDIA = "No media to download"
+
+
+class DownloadManifest:
+    """SQLite record of the media downloads of every post, so that pending
+    downloads can be found without listing media folders, and media that
+    failed to download isn't requested again on every run.
+
+    Each entry records whether a post's media was downloaded into a media
+    folder, how many attempts were made, the last error, and the number of
+    bytes and files saved. Failed downloads are retried after an
+    exponentially growing delay, while posts that have no media to download
+    are recorded as skipped, so that they aren't listed as pending again. Media folders are identified by their path
+    relative to the data directory. If `shared` is True, the manifest may be
+    shared by workers on several hosts (see `journal_mode`)."""
+
+    def __init__(
+        self,
+        path: Path,
+        clock: Callable[[], float] = time.time,
+        shared: bool = False,
+    ):
+        self.path = Path(path)
+        self.clock = clock
+        self.connection = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute(f"PRAGMA journal_mode={journal_mode(shared)}")
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def adopt_directory(self, directory: str, media_dir: Path) -> int:
+        """Record the media already in a folder as downloaded, the first time
+        the folder is used with the manifest. Returns the number of posts
+        recorded."""
+
+        known = self.connection.execute(
+            "SELECT 1 FROM directories WHERE directory = ?", (directory,)
+        ).fetchone()
+        if known is not None:
+            return 0
+
+        files: Dict[str, List[str]] = {}
+        if media_dir.is_dir():
+            for file in os.listdir(media_dir):
+                if is_media_file(file):
+                    files.setdefault(media_post_id(file), []).append(file)
+        now = self.clock()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO media (directory, post_id, status, attempts, "
+                "last_error, bytes, files, updated) VALUES (?, ?, ?, 0, NULL, ?, ?, ?)",
+                (
+                    (
+                        directory,
+                        post_id,
+                        DOWNLOADED,
+                        sum(os.path.getsize(media_dir / file) for file in post_files),
+                        json.dumps(sorted(post_files)),
+                        now,
+                    )
+                    for post_id, post_files in files.items()
+                ),
+            )
+            self.connection.execute(
+                "INSERT INTO directories (directory) VALUES (?)", (directory,)
+            )
+        if files:
+            logger.debug(
+                f"Recorded {len(files)} posts already downloaded to {media_dir}"
+            )
+        return len(files)
+
+    def downloaded_ids(self, directory: str) -> Set[str]:
+        """Return the IDs of posts whose media was downloaded to a folder."""
+        rows = self.connection.execute(
+            "SELECT post_id FROM media WHERE directory = ? AND status = ?",
+            (directory, DOWNLOADED),
+        )
+        return set(row[0] for row in rows)
+
+    def backed_off_ids(self, directory: str) -> Set[str]:
+        """Return the IDs of posts whose media failed to download to a folder,
+        and which shouldn't be retried yet."""
+        rows = self.connection.execute(
+            "SELECT post_id FROM media WHERE directory = ? AND status = ? "
+            "AND retry_after > ?",
+            (directory, FAILED, self.clock()),
+        )
+        return set(row[0] for row in rows)
+
+    def skipped_ids(self, directory: str) -> Set[str]:
+        """Return the IDs of posts that don't need to be downloaded to a
+        folder, as they already were, have no media to download, or are
+        backed off after failing."""
+        rows = self.connection.execute(
+            "SELECT post_id FROM media WHERE directory = ? AND status = ?",
+            (directory, SKIPPED),
+        )
+        return (
+            self.downloaded_ids(directory)
+            | self.backed_off_ids(directory)
+            | set(row[0] for row in rows)
+        )
+
+    def record_success(
+        self, directory: str, post_id: str, nbytes: int, files: List[str]
+    ):
+        self.connection.execute(
+            "INSERT INTO media (directory, post_id, status, attempts, last_error, "
+            "bytes, files, updated) VALUES (?, ?, ?, 1, NULL, ?, ?, ?) "
+            "ON CONFLICT (directory, post_id) DO UPDATE SET status = excluded.status, "
+            "attempts = attempts + 1, last_error = NULL, bytes = excluded.bytes, "
+            "files = excluded.files, updated = excluded.updated, retry_after = NULL",
+            (directory, post_id, DOWNLOADED, nbytes, json.dumps(files), self.clock()),
+        )
+
+    def record_failure(self, directory: str, post_id: str, error: str):
+        attempts = self.connection.execute(
+            "SELECT attempts FROM media WHERE directory = ? AND post_id = ?",
+            (directory, post_id),
+        ).fetchone()
+        attempts = 1 if attempts is None else attempts[0] + 1
+        now = self.clock()
+        delay = min(MAX_RETRY_DELAY, RETRY_DELAY * 2 ** (attempts - 1))
+        self.connection.execute(
+            "INSERT OR REPLACE INTO media (directory, post_id, status, attempts, "
+            "last_error, bytes, files, updated, retry_after) "
+            "VALUES (?, ?, ?, ?, ?, 0, '[]', ?, ?)",
+            (directory, post_id, FAILED, attempts, error, now, now + delay),
+        )
+
+    def record_skipped(self, directory: str, post_id: str, reason: str):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO media (directory, post_id, status, attempts, "
+            "last_error, bytes, files, updated) VALUES (?, ?, ?, 0, ?, 0, '[]', ?)",
+            (directory, post_id, SKIPPED, reason, self.clock()),
+        )
+
+    def commit(self):
+        self.connection.commit()
+
+    def entry(self, directory: str, post_id: str) -> Optional[Dict]:
+        """Return the manifest entry of a post's media in a folder."""
+        row = self.connection.execute(
+            "SELECT * FROM media WHERE directory = ? AND post_id = ?",
+            (directory, post_id),
+        ).fetchone()
+        if row is None:
+            return None
+        entry = dict(row)
+        entry["files"] = json.loads(entry["files"])
+        return entry
@@ -0,0 +1,155 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+from pathlib import Path
+from typing import List, Dict
+
+from .storage import write_json
+
+logger = logging.getLogger(__name__)
+
+# Folder in the data directory that media shared by all hashtags is stored in
+MEDIA_STORE_DIR = "media_store"
+# File in the media store that content hashes are recorded in
+HASHES_FILE = ".sha256.json"
+# Suffixes of the partial downloads that yt-dlp and other tools leave behind
+# when they are interrupted
+PARTIAL_SUFFIXES = (".part", ".ytdl", ".tmp")
+
+
+def media_post_id(file_name: str) -> str:
+    """Return the ID of the post that a downloaded media file belongs to.
+    Videos are named `<id>.<ext>`, and the files of image galleries
+    `<id>.<ext>` (audio) and `<id>_<index>.<ext>` (images)."""
+    return file_name.split(".")[0].split("_")[0]
+
+
+def is_media_file(file_name: str) -> bool:
+    """Whether a file in a media folder is downloaded media. Hidden files
+    are partial downloads or the hashes file, and files with a suffix in
+    `PARTIAL_SUFFIXES` (such as `123.mp4.part` or `123.mp4.part-Frag1`) are
+    partial downloads made by other tools."""
+    return not file_name.startswith(".") and not any(
+        suffix.startswith(PARTIAL_SUFFIXES) for suffix in Path(file_name).suffixes
+    )
+
+
+def link_file(source: Path, target: Path):
+    """Make `target` refer to the same file as `source`, using a hard link
+    where possible, then a symbolic link, and a copy as a last resort."""
+    try:
+        os.link(source, target)
+    except OSError:
+        try:
+            os.symlink(source.resolve(), target)
+        except OSError:
+            shutil.copy2(source, target)
+
+
+def file_hash(file_path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class MediaStore:
+    """Media downloaded for all hashtags, stored once per post in a single
+    folder, with the same file names as in hashtag `media` folders. Hashtag
+    folders get links to the stored files, so a post scraped for several
+    hashtags is only downloaded once.
+
+    If `verify` is set, a SHA-256 hash of each stored file is recorded, and
+    stored files are checked against it before they are reused, so that
+    corrupted files are downloaded again."""
+
+    def __init__(self, root: Path, verify: bool = False):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.verify = verify
+        self.hashes: Dict[str, str] = {}
+        if verify:
+            try:
+                with open(self.root / HASHES_FILE, "r", encoding="utf-8") as f:
+                    self.hashes = json.load(fp=f)
+            except (OSError, ValueError):
+                pass
+        self.refresh()
+
+    def refresh(self):
+        """Re-index the files in the store, by post ID."""
+        self.files: Dict[str, List[str]] = {}
+        for file in os.listdir(self.root):
+            if is_media_file(file):
+                self.files.setdefault(media_post_id(file), []).append(file)
+        # Forget the hashes of files that have been removed, as they may be
+        # downloaded again with different content
+        stored = set(file for files in self.files.values() for file in files)
+        self.hashes = {
+            file: digest for file, digest in self.hashes.items() if file in stored
+        }
+
+    def adopt(self, media_dir: Path) -> int:
+        """Add media previously downloaded to a hashtag's `media` folder to
+        the store, so that it can be reused for other hashtags. Returns the
+        number of files added."""
+
+        added = 0
+        for file in os.listdir(media_dir):
+            if not is_media_file(file):
+                continue
+            post_id = media_post_id(file)
+            if file in self.files.get(post_id, []):
+                continue
+            link_file(media_dir / file, self.root / file)
+            self.files.setdefault(post_id, []).append(file)
+            added += 1
+        return added
+
+    def has(self, post_id: str, expected: int = 1) -> bool:
+        """Whether all media of a post is stored, as at least `expected`
+        files, so that posts with only some of their files stored aren't
+        reused. When verifying, stored files that don't match their
+        recorded hash are removed first."""
+
+        files = self.files.get(post_id)
+        if not files or len(files) < expected:
+            return False
+        if not self.verify:
+            return True
+        for file in files:
+            digest = file_hash(self.root / file)
+            if self.hashes.setdefault(file, digest) != digest:
+                logger.warning(f"Stored media file {file} is corrupted, removing it")
+                for stored_file in files:
+                    (self.root / stored_file).unlink(missing_ok=True)
+                    self.hashes.pop(stored_file, None)
+                del self.files[post_id]
+                return False
+        return True
+
+    def link(self, post_id: str, media_dir: Path) -> int:
+        """Link the stored media of a post into a hashtag's `media` folder.
+        Returns the number of files linked."""
+
+        linked = 0
+        for file in self.files.get(post_id, []):
+            target = media_dir / file
+            if not os.path.lexists(target):
+                link_file(self.root / file, target)
+                linked += 1
+        return linked
+
+    def save(self):
+        """Record the hashes of all stored files, when verifying."""
+
+        if not self.verify:
+            return
+        for files in self.files.values():
+            for file in files:
+                if file not in self.hashes:
+                    self.hashes[file] = file_hash(self.root / file)
+        write_json(self.root / HASHES_FILE, self.hashes)
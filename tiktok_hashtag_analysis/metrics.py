@@ -0,0 +1,276 @@
+import json
+import time
+import pstats
+import cProfile
+import logging
+import threading
+from pathlib import Path
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterator, List, Optional
+
+from .storage import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Folder in the data directory that profiles are written to with `--profile`
+PROFILE_DIR = "profiles"
+
+# Prefix of the names of exported Prometheus metrics
+PROMETHEUS_PREFIX = "tiktok_hashtag_analysis"
+
+# Number of retries of each retried operation, over the life of the process
+_retries: Counter = Counter()
+_retries_lock = threading.Lock()
+
+
+def record_retry(operation: str):
+    """Return a tenacity `before_sleep` callback that counts the retries of
+    an operation."""
+
+    def before_sleep(retry_state):
+        with _retries_lock:
+            _retries[operation] += 1
+        logger.debug(
+            f"Retrying {operation} after attempt {retry_state.attempt_number} failed"
+        )
+
+    return before_sleep
+
+
+def retry_counts() -> Dict[str, int]:
+    with _retries_lock:
+        return dict(_retries)
+
+
+@dataclass
+class StageMetrics:
+    """Totals for one stage of a run. `seconds` is the wall time spent in
+    the stage, which may overlap with other stages when hashtags are
+    scraped concurrently."""
+
+    calls: int = 0
+    seconds: float = 0.0
+    posts: int = 0
+    items: int = 0
+    bytes: int = 0
+    failed: int = 0
+
+    @property
+    def posts_per_second(self) -> float:
+        return self.posts / self.seconds if self.seconds > 0 else 0.0
+
+
+class RunMetrics:
+    """Wall time, throughput and retries of each stage of a run (fetching,
+    merging, analyses, downloads and so on), which can be exported as JSON
+    or as a Prometheus textfile.
+
+    If `profile_dir` is specified, each stage is also profiled with
+    cProfile, and `save_profiles` writes one profile per stage. Only one
+    profiler can be active in a thread, so a stage that starts within
+    another pauses the outer stage's profile until it ends: the outer
+    profile then excludes the time spent in the nested stage, which is in
+    the nested stage's own profile. Stages run in other threads get their
+    own profiles, which are combined with those of the same stage."""
+
+    def __init__(self, profile_dir: Optional[Path] = None):
+        self.started = time.time()
+        self.stages: Dict[str, StageMetrics] = {}
+        self.profile_dir = None if profile_dir is None else Path(profile_dir)
+        self.profiles: Dict[str, List[cProfile.Profile]] = {}
+        # Profiles of each stage in this thread, and the stack of the stages
+        # being profiled, of which only the innermost is enabled
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Retries are counted per process, so only count those of this run
+        self._retries_before = retry_counts()
+
+    def _stage(self, name: str) -> StageMetrics:
+        if name not in self.stages:
+            self.stages[name] = StageMetrics()
+        return self.stages[name]
+
+    def _thread_profile(self, name: str) -> cProfile.Profile:
+        """The profile of a stage in the current thread, as a profile can
+        only be enabled in one thread at a time."""
+
+        if not hasattr(self._local, "profiles"):
+            self._local.profiles = {}
+            self._local.active = []
+        if name not in self._local.profiles:
+            self._local.profiles[name] = cProfile.Profile()
+            with self._lock:
+                self.profiles.setdefault(name, []).append(self._local.profiles[name])
+        return self._local.profiles[name]
+
+    def _start_profile(self, name: str) -> Optional[cProfile.Profile]:
+        profile = self._thread_profile(name)
+        active: List[cProfile.Profile] = self._local.active
+        if active:
+            active[-1].disable()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active, such as one enabled in another
+            # thread on Python versions where profiling isn't per thread
+            logger.debug(f"Could not profile stage {name}, another profiler is active")
+            if active:
+                active[-1].enable()
+            return None
+        active.append(profile)
+        return profile
+
+    def _stop_profile(self, profile: cProfile.Profile):
+        # Stages of concurrent tasks may end in any order, so the stage that
+        # ends isn't necessarily the innermost one
+        active: List[cProfile.Profile] = self._local.active
+        active[-1].disable()
+        del active[len(active) - 1 - active[::-1].index(profile)]
+        if active:
+            active[-1].enable()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time a block of code as part of a stage, and profile it when
+        profiling."""
+
+        profile = None
+        if self.profile_dir is not None:
+            profile = self._start_profile(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if profile is not None:
+                self._stop_profile(profile)
+            with self._lock:
+                stage = self._stage(name)
+                stage.calls += 1
+                stage.seconds += elapsed
+
+    def count(
+        self,
+        name: str,
+        posts: int = 0,
+        items: int = 0,
+        nbytes: int = 0,
+        failed: int = 0,
+    ):
+        """Add to what a stage has processed."""
+        with self._lock:
+            stage = self._stage(name)
+            stage.posts += posts
+            stage.items += items
+            stage.bytes += nbytes
+            stage.failed += failed
+
+    def retries(self) -> Dict[str, int]:
+        """Number of retries of each operation during the run."""
+        return {
+            operation: count - self._retries_before.get(operation, 0)
+            for operation, count in retry_counts().items()
+            if count > self._retries_before.get(operation, 0)
+        }
+
+    def to_dict(self) -> Dict:
+        return {
+            "started": self.started,
+            "seconds": time.time() - self.started,
+            "stages": {
+                name: dict(asdict(stage), posts_per_second=stage.posts_per_second)
+                for name, stage in self.stages.items()
+            },
+            "retries": self.retries(),
+        }
+
+    def summary(self) -> str:
+        parts = []
+        for name, stage in self.stages.items():
+            part = f"{name} {stage.seconds:.2f}s"
+            if stage.posts:
+                part += f" ({stage.posts_per_second:.1f} posts/s)"
+            if stage.bytes:
+                part += f" ({stage.bytes / 1e6:.1f} MB)"
+            parts.append(part)
+        for operation, count in self.retries().items():
+            parts.append(f"{count} {operation} retries")
+        return ", ".join(parts)
+
+    def to_prometheus(self) -> str:
+        """Format the metrics in the Prometheus text exposition format."""
+
+        data = self.to_dict()
+        families = [
+            ("stage_seconds", "Wall time spent in each stage of the run", "seconds"),
+            ("stage_calls", "Number of times each stage was entered", "calls"),
+            ("stage_posts", "Number of posts processed by each stage", "posts"),
+            ("stage_items", "Number of other items processed by each stage", "items"),
+            ("stage_bytes", "Number of bytes downloaded by each stage", "bytes"),
+            ("stage_failed", "Number of items that failed in each stage", "failed"),
+            (
+                "stage_posts_per_second",
+                "Posts processed per second by each stage",
+                "posts_per_second",
+            ),
+        ]
+        lines = []
+        for family, description, field in families:
+            name = f"{PROMETHEUS_PREFIX}_{family}"
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} gauge")
+            for stage, values in data["stages"].items():
+                lines.append(f'{name}{{stage="{stage}"}} {values[field]}')
+
+        name = f"{PROMETHEUS_PREFIX}_retries"
+        lines.append(f"# HELP {name} Number of retries of each operation")
+        lines.append(f"# TYPE {name} gauge")
+        for operation, count in data["retries"].items():
+            lines.append(f'{name}{{operation="{operation}"}} {count}')
+
+        name = f"{PROMETHEUS_PREFIX}_run_seconds"
+        lines.append(f"# HELP {name} Wall time of the whole run")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {data['seconds']}")
+        name = f"{PROMETHEUS_PREFIX}_run_start_timestamp_seconds"
+        lines.append(f"# HELP {name} Time the run started")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {data['started']}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, file_path: Path):
+        """Write the metrics to a file, in the Prometheus text format if the
+        file has a `.prom` extension (as read by node_exporter's textfile
+        collector), and as JSON otherwise. The file is replaced atomically,
+        so that collectors never read a partial file."""
+
+        file_path = Path(file_path)
+        if file_path.suffix == ".prom":
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.to_dict(), indent=2)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_write(file_path) as f:
+            f.write(content)
+        logger.info(f"Metrics saved to file: {file_path}")
+
+    def save_profiles(self):
+        """Write the profile of each stage, combined over the threads it ran
+        in, to `<stage>.prof`, which can be loaded with `pstats` or viewers
+        like snakeviz, and a summary of the slowest functions to
+        `<stage>.txt`."""
+
+        if self.profile_dir is None:
+            return
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            profiles = {name: list(items) for name, items in self.profiles.items()}
+        for name, items in profiles.items():
+            with open(self.profile_dir / f"{name}.txt", "w", encoding="utf-8") as f:
+                stats = pstats.Stats(*items, stream=f)
+                stats.dump_stats(self.profile_dir / f"{name}.prof")
+                stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(30)
+        if profiles:
+            logger.info(f"Profiles saved to directory: {self.profile_dir}")
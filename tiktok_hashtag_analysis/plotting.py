@@ -0,0 +1,141 @@
+import logging
+import warnings
+import multiprocessing
+from pathlib import Path
+from functools import lru_cache
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List, Dict
+
+logger = logging.getLogger(__name__)
+
+# File formats that plots can be saved in
+PLOT_FORMATS = ["png", "svg"]
+
+
+@lru_cache(maxsize=None)
+def get_pyplot():
+    """Import and configure matplotlib and seaborn, which are slow to import,
+    the first time something is plotted."""
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    warnings.filterwarnings("ignore", message="Glyph (.*) missing from current font")
+    sns.set_theme(style="darkgrid")
+    return plt
+
+
+def save_figure(fig, plot_file: Path, dpi: int = 300):
+    """Write a figure to file, in the format given by the file's extension,
+    and close it so that its memory is freed."""
+    plt = get_pyplot()
+    plot_file.parent.mkdir(exist_ok=True, parents=True)
+    try:
+        fig.savefig(plot_file, bbox_inches="tight", facecolor="white", dpi=dpi)
+    finally:
+        plt.close(fig)
+
+
+def render_cooccurrence_plot(
+    hashtag: str,
+    frequencies: Dict[str, int],
+    number: int,
+    plot_file: Path,
+    dpi: int = 300,
+) -> Path:
+    """Plot the `number`-most commonly co-occurring hashtags for a specified
+    source hashtag, from co-occurrence counts, and save the plot to file."""
+
+    # Define labels and other fields used in plot
+    frequencies = Counter(frequencies)
+    total_posts = max(frequencies.values())
+    frequencies.pop(hashtag)
+    sorted_frequencices = frequencies.most_common(number)
+    labels = [label for label, _ in sorted_frequencices]
+    ratios = [freq / total_posts * 100 for _, freq in sorted_frequencices]
+    y_pos = list(reversed(range(len(sorted_frequencices))))
+
+    # Visualize data in bar chart
+    plt = get_pyplot()
+    import matplotlib.ticker as mtick
+
+    fig, ax = plt.subplots(figsize=(5, 6.66))
+    ax.barh(y_pos, ratios)
+    ax.set_yticks(y_pos)
+    ax.set_yticklabels(labels)
+    ax.grid(axis="y")
+    ax.set_xlabel("Percent of posts with co-occurring hashtag")
+    ax.set_ylim(min(y_pos) - 1, max(y_pos) + 1)
+    ax.set_title(f"Co-occurring hashtags for #{hashtag} posts")
+    ax.xaxis.set_major_formatter(mtick.PercentFormatter(decimals=0))
+
+    # Write image of plot to file
+    save_figure(fig, plot_file=plot_file, dpi=dpi)
+    return plot_file
+
+
+def _init_worker():
+    # Workers only ever render to files
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+
+class PlotPool:
+    """Render plots in a pool of worker processes, so that rasterizing them
+    doesn't block scraping and plots of many hashtags are rendered in
+    parallel. Plots are submitted as they are ready, and `wait` waits until
+    all of them have been saved."""
+
+    def __init__(self, workers: int = 4):
+        # Worker processes are spawned rather than forked, as the parent may
+        # be running browser sessions and download threads
+        self.executor = ProcessPoolExecutor(
+            max_workers=max(1, workers),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        self.futures: Dict[Future, str] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.wait()
+
+    def submit_cooccurrence_plot(
+        self,
+        hashtag: str,
+        frequencies: Dict[str, int],
+        number: int,
+        plot_file: Path,
+        dpi: int = 300,
+    ):
+        future = self.executor.submit(
+            render_cooccurrence_plot,
+            hashtag=hashtag,
+            frequencies=dict(frequencies),
+            number=number,
+            plot_file=plot_file,
+            dpi=dpi,
+        )
+        self.futures[future] = hashtag
+
+    def wait(self) -> List[Path]:
+        """Wait for all submitted plots to be saved, and return their files.
+        Plots that failed to render are logged and skipped."""
+
+        plot_files = []
+        try:
+            for future, hashtag in self.futures.items():
+                try:
+                    plot_file = future.result()
+                except Exception as e:
+                    logger.warning(f"Could not plot hashtag '{hashtag}': {e}")
+                    continue
+                logger.info(f"Plot saved to file: {plot_file}")
+                plot_files.append(plot_file)
+        finally:
+            self.futures.clear()
+            self.executor.shutdown()
+        return plot_files
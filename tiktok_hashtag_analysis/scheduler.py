@@ -0,0 +1,143 @@
+import json
+import time
+import heapq
+import logging
+from pathlib import Path
+from dataclasses import dataclass, asdict
+from typing import List, Dict, Callable, Optional, Tuple
+
+from .storage import write_json
+
+logger = logging.getLogger(__name__)
+
+# File that the schedule is saved to in the data directory, so that it
+# survives restarts
+SCHEDULE_FILE = "schedule.json"
+
+# Intervals between scrapes of a hashtag, in seconds
+DEFAULT_INTERVAL = 60 * 60
+MIN_INTERVAL = 15 * 60
+MAX_INTERVAL = 24 * 60 * 60
+
+# Scrape a hashtag more often when at least this share of the posts fetched
+# for it were new, as posts were probably missed in between
+HIGH_YIELD = 0.5
+
+
+@dataclass
+class HashtagState:
+    """When a hashtag is next due to be scraped, and what was learned about
+    it from previous scrapes."""
+
+    interval: float
+    next_due: float
+    failures: int = 0
+    scrapes: int = 0
+    last_fetched: Optional[int] = None
+    last_new: Optional[int] = None
+
+
+class ScrapeScheduler:
+    """Priority schedule of when to scrape each hashtag next, adapted to how
+    many new posts each scrape of a hashtag yields.
+
+    A hashtag's interval is halved when most of the posts fetched for it
+    were new, and doubled when none were, or when nothing was found at all,
+    within `min_interval` and `max_interval`. Scrapes that fail are retried
+    with exponential back-off without changing the interval."""
+
+    def __init__(
+        self,
+        hashtags: List[str],
+        state_file: Optional[Path] = None,
+        min_interval: float = MIN_INTERVAL,
+        max_interval: float = MAX_INTERVAL,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.state_file = state_file
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.clock = clock
+
+        saved = self._load()
+        now = self.clock()
+        self.states: Dict[str, HashtagState] = {}
+        for hashtag in hashtags:
+            if hashtag in saved:
+                self.states[hashtag] = HashtagState(**saved[hashtag])
+            else:
+                # Hashtags that haven't been scheduled before are due now
+                self.states[hashtag] = HashtagState(
+                    interval=self._clamp(DEFAULT_INTERVAL), next_due=now
+                )
+
+        # Ties are broken by the order of `hashtags`
+        self._order = {hashtag: i for i, hashtag in enumerate(hashtags)}
+        self._queue: List[Tuple[float, int, str]] = []
+        for hashtag in hashtags:
+            self._push(hashtag)
+
+    def _load(self) -> Dict[str, Dict]:
+        if self.state_file is None:
+            return {}
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return json.load(fp=f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        """Write the schedule to its state file, if it has one."""
+        if self.state_file is None:
+            return
+        write_json(self.state_file, {h: asdict(s) for h, s in self.states.items()})
+
+    def _clamp(self, interval: float) -> float:
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def _push(self, hashtag: str):
+        state = self.states[hashtag]
+        heapq.heappush(self._queue, (state.next_due, self._order[hashtag], hashtag))
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def pop(self) -> Tuple[str, float]:
+        """Take the hashtag that is due soonest off the schedule, and return
+        it with the time it is due. It is put back by `record` or
+        `record_failure`."""
+        next_due, _, hashtag = heapq.heappop(self._queue)
+        return hashtag, next_due
+
+    def record(self, hashtag: str, fetched: int, new: int):
+        """Reschedule a hashtag after it was scraped, from the number of
+        posts fetched and how many of them were new."""
+
+        state = self.states[hashtag]
+        state.failures = 0
+        state.scrapes += 1
+        state.last_fetched = fetched
+        state.last_new = new
+        if fetched > 0 and new / fetched >= HIGH_YIELD:
+            state.interval = self._clamp(state.interval / 2)
+        elif new == 0:
+            state.interval = self._clamp(state.interval * 2)
+        state.next_due = self.clock() + state.interval
+        logger.debug(
+            f"Scraped {new} new of {fetched} posts for hashtag '{hashtag}', "
+            f"next scrape in {state.interval:.0f}s"
+        )
+        self._push(hashtag)
+
+    def record_failure(self, hashtag: str):
+        """Reschedule a hashtag after its scrape failed."""
+
+        state = self.states[hashtag]
+        state.failures += 1
+        delay = min(self.max_interval, self.min_interval * 2 ** (state.failures - 1))
+        state.next_due = self.clock() + delay
+        logger.debug(
+            f"Scraping hashtag '{hashtag}' failed {state.failures} times in a "
+            f"row, retrying in {delay:.0f}s"
+        )
+        self._push(hashtag)
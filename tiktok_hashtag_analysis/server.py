@@ -0,0 +1,211 @@
+import json
+import logging
+import threading
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qs, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from .dataset import Dataset, CACHE_SIZE
+from .snapshot import STATS_COLUMNS
+from .trends import BUCKET_SIZES
+
+logger = logging.getLogger(__name__)
+
+# Address the query service listens on by default. Only local clients can
+# connect unless another host is specified
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+
+# Upper bound of the `number` query parameter
+MAX_NUMBER = 1000
+
+
+class QueryError(Exception):
+    """A request that can't be answered, with the HTTP status to return."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _int_param(params: Dict[str, List[str]], name: str, default: int) -> int:
+    values = params.get(name)
+    if not values:
+        return default
+    try:
+        value = int(values[-1])
+    except ValueError:
+        raise QueryError(400, f"Parameter '{name}' must be an integer")
+    if not 1 <= value <= MAX_NUMBER:
+        raise QueryError(400, f"Parameter '{name}' must be between 1 and {MAX_NUMBER}")
+    return value
+
+
+def _choice_param(
+    params: Dict[str, List[str]], name: str, default: str, choices: List[str]
+) -> str:
+    values = params.get(name)
+    if not values:
+        return default
+    if values[-1] not in choices:
+        raise QueryError(400, f"Parameter '{name}' must be one of {choices}")
+    return values[-1]
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Answer queries about scraped hashtags with JSON:
+
+    - `/hashtags`: the scraped hashtags
+    - `/hashtags/<hashtag>`: the number of posts scraped for a hashtag
+    - `/hashtags/<hashtag>/cooccurrences?number=20`: the most commonly
+      co-occurring hashtags, as in `--table`
+    - `/hashtags/<hashtag>/trends?number=20&bucket=day&window=7`: emerging
+      co-occurring hashtags, as in `--trends`
+    - `/hashtags/<hashtag>/top-posts?number=10&by=play_count`: the posts
+      with the most plays, likes and so on
+    - `/cache`: statistics of the in-memory cache"""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, which would otherwise be
+    # delayed on keep-alive connections
+    disable_nagle_algorithm = True
+    server: "QueryServer"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        parts = [unquote(part) for part in url.path.strip("/").split("/")]
+        try:
+            status, data = 200, self.route(parts, params)
+        except QueryError as e:
+            status, data = e.status, {"error": str(e)}
+        except Exception as e:
+            logger.exception(f"Failed to answer query {self.path}")
+            status, data = 500, {"error": f"Internal error: {e}"}
+        self.send_json(status, data)
+
+    def route(self, parts: List[str], params: Dict[str, List[str]]) -> Dict:
+        dataset = self.server.dataset
+        if parts == ["cache"]:
+            return dataset.cache_info()
+        if parts == ["hashtags"]:
+            return {"hashtags": dataset.hashtags()}
+        if len(parts) not in (2, 3) or parts[0] != "hashtags":
+            raise QueryError(404, "Unknown path")
+
+        hashtag = parts[1]
+        if not hashtag or hashtag.startswith(".") or "/" in hashtag:
+            raise QueryError(404, f"Invalid hashtag: {hashtag}")
+        try:
+            posts = dataset.post_count(hashtag)
+        except KeyError:
+            raise QueryError(404, f"No posts were scraped for the hashtag: {hashtag}")
+        data = {"hashtag": hashtag, "posts": posts}
+        if len(parts) == 2:
+            return data
+
+        query = parts[2]
+        if query == "cooccurrences":
+            number = _int_param(params, "number", default=20)
+            top = dataset.top_cooccurring(hashtag, number=number)
+            # Frequencies are relative to the most common hashtag, as in `--table`
+            most_common = top[0][1] if top else 1
+            data["cooccurrences"] = [
+                {"hashtag": other, "count": count, "frequency": count / most_common}
+                for other, count in top
+            ]
+        elif query == "trends":
+            bucket = _choice_param(params, "bucket", "day", list(BUCKET_SIZES))
+            data["trends"] = dataset.emerging(
+                hashtag,
+                number=_int_param(params, "number", default=20),
+                bucket=bucket,
+                window=_int_param(params, "window", default=7),
+            )
+        elif query == "top-posts":
+            by = _choice_param(params, "by", "play_count", list(STATS_COLUMNS))
+            data["top_posts"] = dataset.top_posts(
+                hashtag, number=_int_param(params, "number", default=10), by=by
+            )
+        else:
+            raise QueryError(404, f"Unknown query: {query}")
+        return data
+
+    def send_json(self, status: int, data: Dict):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+class QueryServer(ThreadingHTTPServer):
+    """HTTP service answering queries about the hashtags scraped into a data
+    directory, from a warm in-memory `Dataset`. Each request is handled in
+    its own thread, and a hashtag's cached results are rebuilt when its
+    posts change."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        data_dir: Path,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        cache_size: int = CACHE_SIZE,
+    ):
+        self.dataset = Dataset(
+            data_dir=data_dir, cache_size=cache_size, save_snapshots=True
+        )
+        super().__init__((host, port), QueryHandler)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        if isinstance(host, bytes):
+            host = host.decode()
+        return f"http://{host}:{port}"
+
+    def warm(self, hashtags: Optional[List[str]] = None) -> Tuple[int, int]:
+        """Load the snapshots of hashtags (as many scraped hashtags as fit in
+        the cache by default) before serving. Returns the number of hashtags
+        and posts loaded."""
+
+        if hashtags is None:
+            hashtags = self.dataset.hashtags()[: self.dataset.cache_size]
+        posts = sum(self.dataset.post_counts(hashtags).values())
+        return len(hashtags), posts
+
+    def start(self) -> threading.Thread:
+        """Serve requests in a background thread, until `shutdown`."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def serve(
+    data_dir: Path,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    cache_size: int = CACHE_SIZE,
+):
+    """Serve queries about the hashtags scraped into a data directory until
+    interrupted."""
+
+    with QueryServer(
+        data_dir=data_dir, host=host, port=port, cache_size=cache_size
+    ) as server:
+        hashtags, posts = server.warm()
+        logger.info(
+            f"Loaded {hashtags} hashtags with {posts} posts, serving queries at "
+            f"{server.url}"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("Stopped serving queries")
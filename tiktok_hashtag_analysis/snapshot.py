@@ -0,0 +1,260 @@
+import logging
+from pathlib import Path
+from collections import Counter
+from typing import List, Dict, Iterable, Mapping, Optional
+
+import numpy as np
+
+from .storage import PostStore, atomic_write
+
+logger = logging.getLogger(__name__)
+
+# File that the snapshot is saved to, next to each hashtag's posts. The posts
+# merged since it was saved are saved to shards named `snapshot.<n>.npz`
+SNAPSHOT_FILE = "snapshot.npz"
+SNAPSHOT_VERSION = 2
+
+# Columns holding one integer per post, and the raw post fields they are read from
+STATS_COLUMNS = {
+    "play_count": "playCount",
+    "digg_count": "diggCount",
+    "comment_count": "commentCount",
+    "share_count": "shareCount",
+    "collect_count": "collectCount",
+}
+
+
+def extract_columns(posts: Iterable[Dict], vocabulary: Optional[List[str]] = None):
+    """Extract the fields used in analyses from raw TikTok post API
+    responses, as a dict of arrays with one entry per post.
+
+    The distinct hashtags used in post `i` are
+    `vocabulary[hashtag_codes[hashtag_offsets[i]:hashtag_offsets[i + 1]]]`.
+    Hashtags are added to `vocabulary` (which is extended in place when it
+    is given) in the order they are first used."""
+
+    vocabulary = [] if vocabulary is None else vocabulary
+    codes = {hashtag: code for code, hashtag in enumerate(vocabulary)}
+    columns: Dict[str, List] = {
+        "id": [],
+        "author": [],
+        "create_time": [],
+        "is_gallery": [],
+        **{column: [] for column in STATS_COLUMNS},
+    }
+    hashtag_codes: List[int] = []
+    hashtag_offsets = [0]
+
+    for post in posts:
+        columns["id"].append(post["id"])
+        columns["author"].append((post.get("author") or {}).get("uniqueId") or "")
+        columns["create_time"].append(int(post.get("createTime") or 0))
+        columns["is_gallery"].append("imagePost" in post)
+        stats = post.get("stats") or {}
+        for column, field in STATS_COLUMNS.items():
+            columns[column].append(int(stats.get(field) or 0))
+
+        hashtags = set(
+            hashtag["hashtagName"]
+            for hashtag in post.get("textExtra") or []
+            if hashtag.get("hashtagName")
+        )
+        for hashtag in sorted(hashtags):
+            if hashtag not in codes:
+                codes[hashtag] = len(vocabulary)
+                vocabulary.append(hashtag)
+            hashtag_codes.append(codes[hashtag])
+        hashtag_offsets.append(len(hashtag_codes))
+
+    arrays = {
+        "id": np.array(columns["id"], dtype=str),
+        "author": np.array(columns["author"], dtype=str),
+        "create_time": np.array(columns["create_time"], dtype=np.int64),
+        "is_gallery": np.array(columns["is_gallery"], dtype=bool),
+        **{
+            column: np.array(columns[column], dtype=np.int64)
+            for column in STATS_COLUMNS
+        },
+        "hashtag_codes": np.array(hashtag_codes, dtype=np.int32),
+        "hashtag_offsets": np.array(hashtag_offsets, dtype=np.int64),
+        "vocabulary": np.array(vocabulary, dtype=str),
+    }
+    return arrays
+
+
+def concatenate_columns(parts: List[Mapping[str, np.ndarray]]) -> Dict:
+    """Concatenate the columns of several snapshots, each with their own
+    vocabulary. Posts that are in more than one snapshot are only kept from
+    the last of them."""
+
+    vocabulary: List[str] = []
+    codes: Dict[str, int] = {}
+    hashtag_codes = []
+    for part in parts:
+        for hashtag in part["vocabulary"].tolist():
+            if hashtag not in codes:
+                codes[hashtag] = len(vocabulary)
+                vocabulary.append(hashtag)
+        part_codes = np.array(
+            [codes[hashtag] for hashtag in part["vocabulary"].tolist()], dtype=np.int32
+        )
+        hashtag_codes.append(part_codes[part["hashtag_codes"]])
+
+    # Keep the last version of each post
+    ids = np.concatenate([part["id"] for part in parts])
+    _, last = np.unique(ids[::-1], return_index=True)
+    keep = np.zeros(len(ids), dtype=bool)
+    keep[len(ids) - 1 - last] = True
+    lengths = np.concatenate([np.diff(part["hashtag_offsets"]) for part in parts])
+
+    columns = {
+        name: np.concatenate([part[name] for part in parts])[keep]
+        for name in ["id", "author", "create_time", "is_gallery", *STATS_COLUMNS]
+    }
+    columns["hashtag_codes"] = np.concatenate(
+        [np.zeros(0, dtype=np.int32), *hashtag_codes]
+    )[np.repeat(keep, lengths)]
+    columns["hashtag_offsets"] = np.concatenate([[0], np.cumsum(lengths[keep])])
+    columns["vocabulary"] = np.array(vocabulary, dtype=str)
+    return columns
+
+
+def hashtag_counts(columns: Mapping[str, np.ndarray]) -> Counter:
+    """Count the posts in a snapshot that use each hashtag."""
+    vocabulary = columns["vocabulary"]
+    counts = np.bincount(columns["hashtag_codes"], minlength=len(vocabulary))
+    used = np.flatnonzero(counts)
+    return Counter(dict(zip(vocabulary[used].tolist(), counts[used].tolist())))
+
+
+def post_hashtag_lists(columns: Mapping[str, np.ndarray]) -> Dict[str, List[str]]:
+    """Return the sorted hashtags used in each post of a snapshot, by post ID."""
+    hashtags = columns["vocabulary"][columns["hashtag_codes"]].tolist()
+    offsets = columns["hashtag_offsets"].tolist()
+    return {
+        post_id: hashtags[start:end]
+        for post_id, start, end in zip(
+            columns["id"].tolist(), offsets[:-1], offsets[1:]
+        )
+    }
+
+
+class PostSnapshot:
+    """Compact columnar copy of the fields of a hashtag's posts that are used
+    in analyses, so that analyses don't have to parse the raw API responses.
+
+    The snapshot is saved as an uncompressed `.npz` file, whose columns are
+    only read from disk when they are accessed. Like co-occurrence counts,
+    it records the signature of the store it was built from, is updated
+    with the posts added by each scrape, and is rebuilt from all posts when
+    the store has changed in any other way.
+
+    The posts added by each scrape are saved to a new shard, which records
+    the signature of the store before and after the scrape, rather than
+    rewriting the snapshot. Shards are concatenated with the snapshot when
+    it is read, and merged into it once they grow larger than it."""
+
+    def __init__(self, store: PostStore):
+        self.store = store
+        self.snapshot_file = store.hashtag_dir / SNAPSHOT_FILE
+
+    def shard_file(self, number: int) -> Path:
+        return self.store.hashtag_dir / f"{self.snapshot_file.stem}.{number}.npz"
+
+    @staticmethod
+    def _load(file_path: Path):
+        try:
+            columns = np.load(file_path, allow_pickle=False)
+            if columns["version"].item() != SNAPSHOT_VERSION:
+                return None
+        except (OSError, ValueError, KeyError):
+            return None
+        return columns
+
+    def _read(self) -> Optional[List]:
+        """Read the snapshot and the shards that were saved after it, in
+        order, stopping at the first shard that doesn't follow on from the
+        previous one."""
+
+        snapshot = self._load(self.snapshot_file)
+        if snapshot is None:
+            return None
+        parts = [snapshot]
+        while True:
+            shard = self._load(self.shard_file(len(parts)))
+            if shard is None or (
+                shard["previous_signature"].tolist() != parts[-1]["signature"].tolist()
+            ):
+                return parts
+            parts.append(shard)
+
+    def _remove_shards(self):
+        for shard_file in self.store.hashtag_dir.glob(
+            f"{self.snapshot_file.stem}.*.npz"
+        ):
+            shard_file.unlink(missing_ok=True)
+
+    def columns(self, save: bool = True) -> Mapping[str, np.ndarray]:
+        """Return the up-to-date columns of the snapshot, lazily loaded if
+        there are no shards. If `save` is False, an outdated snapshot is
+        rebuilt in memory without being saved."""
+
+        parts = self._read()
+        if parts is not None and (
+            parts[-1]["signature"].tolist() == self.store.signature()
+        ):
+            return parts[0] if len(parts) == 1 else concatenate_columns(parts)
+        return self.rebuild(save=save)
+
+    def rebuild(self, save: bool = True) -> Mapping[str, np.ndarray]:
+        """Rebuild the snapshot from all stored posts."""
+
+        logger.debug(f"Building post snapshot in {self.store.hashtag_dir}")
+        # The signature is read first, so that posts merged while reading
+        # make the snapshot outdated rather than being missed
+        signature = self.store.signature()
+        fields = ["id", "author", "createTime", "stats", "textExtra", "imagePost"]
+        columns = extract_columns(self.store.iter_posts(fields=fields))
+        return self._save(columns, signature) if save else columns
+
+    def update(self, posts: List[Dict], previous_signature: List[int]) -> bool:
+        """Update the snapshot with posts that were just merged into the
+        store, if it was up to date before the merge. Returns whether it was
+        updated."""
+
+        signature = self.store.signature()
+        parts = self._read()
+        if parts is None or parts[-1]["signature"].tolist() != previous_signature:
+            return False
+        shard = extract_columns(posts)
+
+        # Merge the shards into the snapshot once they are larger than it, so
+        # the snapshot is rewritten less often as it grows
+        shards_size = sum(
+            self.shard_file(number).stat().st_size for number in range(1, len(parts))
+        )
+        if shards_size >= self.snapshot_file.stat().st_size:
+            logger.debug(f"Merging post snapshot shards in {self.store.hashtag_dir}")
+            self._save(concatenate_columns([*parts, shard]), signature)
+            return True
+
+        shard["version"] = np.array(SNAPSHOT_VERSION)
+        shard["previous_signature"] = np.array(previous_signature, dtype=np.int64)
+        shard["signature"] = np.array(signature, dtype=np.int64)
+        with atomic_write(self.shard_file(len(parts)), "wb") as f:
+            np.savez(f, allow_pickle=False, **shard)
+        return True
+
+    def _save(
+        self, columns: Dict[str, np.ndarray], signature: List[int]
+    ) -> Mapping[str, np.ndarray]:
+        if not self.store.hashtag_dir.is_dir():
+            return columns
+        columns["version"] = np.array(SNAPSHOT_VERSION)
+        columns["signature"] = np.array(signature, dtype=np.int64)
+        with atomic_write(self.snapshot_file, "wb") as f:
+            np.savez(f, allow_pickle=False, **columns)
+        # Shards saved after an earlier version of the snapshot no longer
+        # follow on from it
+        self._remove_shards()
+        return columns
@@ -0,0 +1,494 @@
+import os
+import json
+import time
+import shutil
+import logging
+import tempfile
+from abc import ABC, abstractmethod
+from pathlib import Path
+from contextlib import contextmanager
+from typing import IO, Any, List, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Name of the file that posts are stored in by the JSON backend
+POSTS_FILE = "posts.json"
+# Name of the directory that posts are stored in by the JSON Lines backend
+POSTS_DIR = "posts"
+# Size after which the JSON Lines backend starts writing to a new segment
+SEGMENT_SIZE = 64 * 1024 * 1024
+
+# Number of characters read at a time when streaming a JSON file
+READ_CHUNK_SIZE = 1024 * 1024
+
+STORE_BACKENDS = ["json", "jsonl"]
+# Number of seconds after which a lock file is assumed to have been left
+# behind by a process that crashed while holding it
+LOCK_TIMEOUT = 30
+
+
+def json_load(file_path: Path) -> List:
+    """Read a JSON file and return the read data. A `posts.json` file that
+    has been migrated to the JSON Lines backend is read from that store."""
+    file_path = Path(file_path)
+    if (
+        file_path.name == POSTS_FILE
+        and not file_path.is_file()
+        and JsonLinesPostStore(file_path.parent).exists()
+    ):
+        return JsonLinesPostStore(file_path.parent).load()
+    with open(file_path, "r", encoding="utf-8") as f:
+        data = json.load(fp=f)
+    return data
+
+
+def json_dump(file_path: Path, data: List):
+    """Write data to a JSON file. The data is written to a temporary file
+    that then replaces `file_path`, so readers and other processes never see
+    a partially written file."""
+    _write_json_array(file_path=Path(file_path), items=data)
+
+
+def _iter_json_array(f) -> Iterator:
+    """Decode the items of a JSON list from a text file one at a time, only
+    keeping the chunk of the file that contains the current item in memory."""
+
+    chunk_size = READ_CHUNK_SIZE
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+    started = False
+    while True:
+        # Skip whitespace and separators between items, reading more of the
+        # file when the buffer has been used up
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            buffer, pos = f.read(chunk_size), 0
+            eof = not buffer
+        if pos >= len(buffer):
+            raise ValueError(f"Unexpected end of JSON list in {f.name}")
+
+        if not started:
+            if buffer[pos] != "[":
+                raise ValueError(f"{f.name} does not contain a JSON list")
+            started = True
+            pos += 1
+            continue
+        if buffer[pos] == "]":
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+            # An item that ends the buffer might continue in the next chunk
+            complete = end < len(buffer) or eof
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            complete = False
+        if not complete:
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield item
+        pos = end
+
+
+def _select_fields(item: Dict, fields: Optional[List[str]]) -> Dict:
+    if fields is None:
+        return item
+    return {field: item[field] for field in fields if field in item}
+
+
+def json_iter(file_path: Path, fields: Optional[List[str]] = None) -> Iterator:
+    """Iterate over the items of a JSON file containing a list, reading one
+    item at a time so that memory use doesn't grow with the size of the file.
+    If `fields` is specified, only those keys of each item are kept. A
+    `posts.json` file that has been migrated to the JSON Lines backend is
+    read from that store."""
+
+    file_path = Path(file_path)
+    if (
+        file_path.name == POSTS_FILE
+        and not file_path.is_file()
+        and JsonLinesPostStore(file_path.parent).exists()
+    ):
+        yield from JsonLinesPostStore(file_path.parent).iter_posts(fields=fields)
+        return
+    with open(file_path, "r", encoding="utf-8") as f:
+        for item in _iter_json_array(f):
+            yield _select_fields(item, fields)
+
+
+@contextmanager
+def atomic_write(file_path: Path, mode: str = "w", suffix: str = "") -> Iterator[IO]:
+    """Open a hidden temporary file next to `file_path` for writing, which
+    replaces `file_path` when the block exits, so that readers and other
+    processes never see a partially written file. If writing fails, the
+    temporary file is removed and `file_path` is left as it was."""
+
+    file_path = Path(file_path)
+    fd, temp_path = tempfile.mkstemp(
+        dir=file_path.parent, prefix=f".{file_path.name}.", suffix=suffix
+    )
+    try:
+        encoding = None if "b" in mode else "utf-8"
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            yield f
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def write_json(file_path: Path, data: Any, indent: Optional[int] = None):
+    """Write data to a JSON file atomically (see `atomic_write`)."""
+    with atomic_write(file_path) as f:
+        json.dump(data, fp=f, indent=indent)
+
+
+@contextmanager
+def file_lock(file_path: Path, timeout: float = LOCK_TIMEOUT) -> Iterator[None]:
+    """Hold an exclusive lock on `file_path` while the block runs, so that
+    processes sharing the file can read, change and write it back without
+    losing each other's changes. The lock is a `.lock` file next to
+    `file_path`, which is removed if it is older than `timeout` seconds."""
+
+    lock_path = Path(file_path).with_name(f".{Path(file_path).name}.lock")
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - lock_path.stat().st_mtime >= timeout:
+                    logger.warning(f"Removing stale lock file: {lock_path}")
+                    lock_path.unlink()
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(0.01)
+    os.close(fd)
+    try:
+        yield
+    finally:
+        lock_path.unlink(missing_ok=True)
+
+
+def _write_json_array(file_path: Path, items: Iterable):
+    """Write items to a JSON file one at a time, in the same format as
+    `json_dump`. The items are written to a temporary file that then replaces
+    `file_path`, so the items may be read from the file being replaced."""
+
+    with atomic_write(file_path) as f:
+        f.write("[")
+        for i, item in enumerate(items):
+            f.write(", " if i else "")
+            f.write(json.dumps(item))
+        f.write("]")
+
+
+class PostStore(ABC):
+    """Posts scraped for a single hashtag, stored in the directory
+    `hashtag_dir`. Each post is identified by its `id`, and storing a post
+    with an existing `id` replaces the earlier version."""
+
+    def __init__(self, hashtag_dir: Path):
+        self.hashtag_dir = Path(hashtag_dir)
+
+    @abstractmethod
+    def exists(self) -> bool:
+        """Whether any posts have been stored."""
+
+    @abstractmethod
+    def iter_posts(self, fields: Optional[List[str]] = None) -> Iterator[Dict]:
+        """Iterate over the latest version of every stored post, in the order
+        they were last written, reading one post at a time. If `fields` is
+        specified, only those keys of each post are kept."""
+
+    def load(self) -> List[Dict]:
+        """Return the latest version of every stored post."""
+        return list(self.iter_posts())
+
+    def ids(self) -> Set[str]:
+        """Return the IDs of all stored posts."""
+        return set(post["id"] for post in self.iter_posts(fields=["id"]))
+
+    @abstractmethod
+    def merge(self, posts: List[Dict]) -> Tuple[int, int]:
+        """Add freshly fetched posts to the store, replacing earlier versions
+        of the same posts. Returns the number of posts that had not been
+        stored before, and the number of posts stored before merging."""
+
+    @abstractmethod
+    def last_modified(self) -> float:
+        """Return the time the store was last written to, or 0 if it doesn't
+        exist."""
+
+    @abstractmethod
+    def signature(self) -> List[int]:
+        """Return the size and modification time of the store's data, which
+        change whenever posts are written."""
+
+    def compact(self):
+        """Reclaim space taken up by replaced versions of posts."""
+
+
+class JsonPostStore(PostStore):
+    """Store all posts as a single list in `posts.json`, which is rewritten
+    whenever posts are added."""
+
+    @property
+    def file_path(self) -> Path:
+        return self.hashtag_dir / POSTS_FILE
+
+    def exists(self) -> bool:
+        return self.file_path.is_file()
+
+    def iter_posts(self, fields: Optional[List[str]] = None) -> Iterator[Dict]:
+        if not self.exists():
+            return iter([])
+        return json_iter(file_path=self.file_path, fields=fields)
+
+    def merge(self, posts: List[Dict]) -> Tuple[int, int]:
+        already_fetched_ids = set()
+        fetched_ids = set(video["id"] for video in posts)
+
+        def merged_posts():
+            # Keep previously scraped posts that weren't just fetched again,
+            # streaming them from the existing file
+            for video in self.iter_posts():
+                already_fetched_ids.add(video["id"])
+                if video["id"] not in fetched_ids:
+                    yield video
+            yield from posts
+
+        # Merge new and old data and write to file
+        self.hashtag_dir.mkdir(exist_ok=True, parents=True)
+        _write_json_array(file_path=self.file_path, items=merged_posts())
+
+        # Determine which newly scraped posts haven't been scraped before
+        new_post_count = len(fetched_ids - already_fetched_ids)
+        old_post_count = len(already_fetched_ids)
+        return new_post_count, old_post_count
+
+    def last_modified(self) -> float:
+        return self.file_path.lstat().st_mtime if self.exists() else 0
+
+    def signature(self) -> List[int]:
+        if not self.exists():
+            return [0, 0]
+        stat = self.file_path.stat()
+        return [stat.st_size, stat.st_mtime_ns]
+
+
+class JsonLinesPostStore(PostStore):
+    """Store posts in append-only JSON Lines segments in the `posts`
+    directory. New and updated posts are appended to the last segment, and
+    `index.tsv` records the segment and byte offset of the latest version of
+    each post, so existing data never needs to be read or rewritten when
+    posts are added. Replaced versions are only removed by `compact`."""
+
+    @property
+    def store_dir(self) -> Path:
+        return self.hashtag_dir / POSTS_DIR
+
+    @property
+    def index_file(self) -> Path:
+        return self.store_dir / "index.tsv"
+
+    def exists(self) -> bool:
+        return self.index_file.is_file()
+
+    def segments(self) -> List[Path]:
+        return sorted(self.store_dir.glob("*.jsonl"))
+
+    def index(self) -> Dict[str, Tuple[int, int]]:
+        """Map the ID of each post to the segment number and byte offset of
+        its latest version."""
+        index: Dict[str, Tuple[int, int]] = {}
+        if not self.exists():
+            return index
+        with open(self.index_file, "r", encoding="utf-8") as f:
+            for line in f:
+                post_id, segment, offset = line.rstrip("\n").split("\t")
+                index[post_id] = (int(segment), int(offset))
+        return index
+
+    def ids(self) -> Set[str]:
+        return set(self.index())
+
+    def iter_posts(self, fields: Optional[List[str]] = None) -> Iterator[Dict]:
+        index = self.index()
+        # Order posts by the position of their latest version
+        for segment_path in self.segments():
+            segment = int(segment_path.stem)
+            offset = 0
+            with open(segment_path, "rb") as f:
+                for line in f:
+                    location = (segment, offset)
+                    offset += len(line)
+                    try:
+                        post = json.loads(line)
+                    except ValueError:
+                        # Skip records left incomplete by an interrupted append
+                        continue
+                    # Skip replaced versions of posts
+                    if index.get(post["id"]) == location:
+                        yield _select_fields(post, fields)
+
+    def get(self, post_id: str) -> Optional[Dict]:
+        """Read a single post, without reading the rest of the store."""
+        location = self.index().get(post_id)
+        if location is None:
+            return None
+        segment, offset = location
+        with open(self.store_dir / f"{segment:05d}.jsonl", "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def append(self, posts: Iterable[Dict]):
+        """Append posts to the store. Segments are written before the index,
+        so an interrupted append never indexes incomplete records."""
+
+        self.store_dir.mkdir(exist_ok=True, parents=True)
+        segments = self.segments()
+        segment = int(segments[-1].stem) if segments else 0
+
+        index_lines = []
+        segment_file: IO[bytes] = open(self.store_dir / f"{segment:05d}.jsonl", "ab+")
+        try:
+            # Terminate a record left incomplete by an interrupted append
+            if segment_file.tell() > 0:
+                segment_file.seek(-1, os.SEEK_END)
+                if segment_file.read(1) != b"\n":
+                    segment_file.write(b"\n")
+            for post in posts:
+                if segment_file.tell() >= SEGMENT_SIZE:
+                    segment_file.close()
+                    segment += 1
+                    segment_file = open(self.store_dir / f"{segment:05d}.jsonl", "ab")
+                index_lines.append(f"{post['id']}\t{segment}\t{segment_file.tell()}\n")
+                segment_file.write(json.dumps(post).encode("utf-8") + b"\n")
+        finally:
+            segment_file.close()
+
+        with open(self.index_file, "a", encoding="utf-8") as index_file:
+            index_file.writelines(index_lines)
+
+    def merge(self, posts: List[Dict]) -> Tuple[int, int]:
+        already_fetched_ids = self.ids()
+        fetched_ids = set(video["id"] for video in posts)
+        self.append(posts)
+        return len(fetched_ids - already_fetched_ids), len(already_fetched_ids)
+
+    def last_modified(self) -> float:
+        return self.index_file.lstat().st_mtime if self.exists() else 0
+
+    def signature(self) -> List[int]:
+        if not self.exists():
+            return [0, 0]
+        stat = self.index_file.stat()
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def index_line_before(self, position: int) -> str:
+        """Return the index entry that ends at byte `position` of the index,
+        used to check that the index has only been appended to since."""
+        if position == 0:
+            return ""
+        start = max(0, position - 512)
+        with open(self.index_file, "rb") as f:
+            f.seek(start)
+            chunk = f.read(position - start)
+        return chunk.decode("utf-8").splitlines()[-1] if chunk else ""
+
+    def iter_appended(self, position: int) -> Iterator[Dict]:
+        """Iterate over the posts indexed after byte `position` of the index,
+        i.e. the posts written since the index had that size."""
+        with open(self.index_file, "rb") as f:
+            f.seek(position)
+            entries = [line.decode("utf-8").split("\t") for line in f]
+        for _, segment, offset in entries:
+            with open(self.store_dir / f"{int(segment):05d}.jsonl", "rb") as f:
+                f.seek(int(offset))
+                yield json.loads(f.readline())
+
+    @property
+    def old_dir(self) -> Path:
+        """Directory that the store is moved to while being compacted."""
+        return self.hashtag_dir / f".{POSTS_DIR}.old"
+
+    def recover(self):
+        """Clean up after a compaction that was interrupted. If it stopped
+        after moving the store out of the way, but before moving the
+        compacted store into its place, the old store is moved back."""
+
+        if not self.old_dir.is_dir():
+            return
+        if self.store_dir.exists():
+            shutil.rmtree(self.old_dir)
+        else:
+            logger.warning(f"Restoring {self.store_dir} after interrupted compaction")
+            os.replace(self.old_dir, self.store_dir)
+
+    def compact(self):
+        """Rewrite the store so that it only contains the latest version of
+        each post."""
+
+        self.recover()
+        if not self.exists():
+            return
+        compacted = JsonLinesPostStore(self.hashtag_dir / f".{POSTS_DIR}.compact")
+        shutil.rmtree(compacted.store_dir, ignore_errors=True)
+        compacted.append(self.iter_posts())
+
+        os.replace(self.store_dir, self.old_dir)
+        os.replace(compacted.store_dir, self.store_dir)
+        shutil.rmtree(self.old_dir)
+        logger.info(f"Compacted posts stored in {self.store_dir}")
+
+    def migrate(self) -> bool:
+        """Import the posts in an existing `posts.json` file, which is then
+        renamed to `posts.json.migrated`. Returns whether there was a file to
+        migrate."""
+
+        json_file = self.hashtag_dir / POSTS_FILE
+        if self.exists() or not json_file.is_file():
+            return False
+        self.append(json_iter(file_path=json_file))
+        os.replace(json_file, json_file.with_name(f"{POSTS_FILE}.migrated"))
+        logger.info(f"Migrated {json_file} to append-only store {self.store_dir}")
+        return True
+
+
+def open_store(hashtag_dir: Path, backend: str = "json") -> PostStore:
+    """Open the store of posts for a hashtag. A store that already uses the
+    JSON Lines backend is always opened as such, and opening an existing
+    `posts.json` file with the JSON Lines backend migrates it."""
+
+    if backend not in STORE_BACKENDS:
+        raise ValueError(f"Unknown store backend '{backend}'")
+    jsonl_store = JsonLinesPostStore(hashtag_dir)
+    jsonl_store.recover()
+    if jsonl_store.exists():
+        return jsonl_store
+    if backend == "jsonl":
+        jsonl_store.migrate()
+        return jsonl_store
+    return JsonPostStore(hashtag_dir)
+
+
+def scraped_hashtags(data_dir: Path) -> List[str]:
+    """Return the hashtags that have posts stored in a data directory."""
+    return sorted(
+        hashtag_dir.name
+        for hashtag_dir in Path(data_dir).iterdir()
+        if hashtag_dir.is_dir() and open_store(hashtag_dir=hashtag_dir).exists()
+    )
+
+
+def load_posts(hashtag_dir: Path) -> List[Dict]:
+    """Return all posts stored for a hashtag, whichever backend stores them."""
+    return open_store(hashtag_dir).load()
@@ -0,0 +1,132 @@
+import logging
+from typing import List, Dict, Mapping, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Length of the time buckets that posts can be counted in, in seconds
+BUCKET_SIZES = {"hour": 3600, "day": 86400}
+
+
+class HashtagTrends:
+    """How the use of co-occurring hashtags changes over time, from the
+    columns of a post snapshot.
+
+    Posts are counted in hourly or daily buckets of their creation time. A
+    hashtag's emerging score compares the number of posts that used it in
+    the latest `window` buckets with the number expected from its share of
+    the posts created before them, as a Poisson z-score, so that hashtags
+    which suddenly become more common rank highest."""
+
+    def __init__(
+        self,
+        columns: Mapping[str, np.ndarray],
+        bucket: str = "day",
+        window: int = 7,
+        end_time: Optional[int] = None,
+    ):
+        if bucket not in BUCKET_SIZES:
+            raise ValueError(f"Unknown trend bucket '{bucket}'")
+        if not isinstance(window, (int, np.integer)) or window < 1:
+            raise ValueError(f"Trend window must be a positive integer, not {window!r}")
+        self.bucket = bucket
+        self.bucket_size = BUCKET_SIZES[bucket]
+        self.window = window
+        self.vocabulary = columns["vocabulary"]
+
+        create_time = columns["create_time"]
+        # Posts without a creation time can't be placed in a bucket
+        dated = create_time > 0
+        if end_time is not None:
+            dated &= create_time < end_time
+        lengths = np.diff(columns["hashtag_offsets"])
+        self.post_buckets = create_time[dated] // self.bucket_size
+        self.codes = columns["hashtag_codes"][np.repeat(dated, lengths)]
+        self.code_buckets = np.repeat(self.post_buckets, lengths[dated])
+
+        if end_time is not None:
+            self.last_bucket = (end_time - 1) // self.bucket_size
+        elif len(self.post_buckets):
+            self.last_bucket = int(self.post_buckets.max())
+        else:
+            self.last_bucket = 0
+        self.first_bucket = (
+            int(self.post_buckets.min()) if len(self.post_buckets) else self.last_bucket
+        )
+
+    def bucket_starts(self) -> np.ndarray:
+        """Return the start times of all buckets, as Unix timestamps."""
+        buckets = np.arange(self.first_bucket, self.last_bucket + 1)
+        return buckets * self.bucket_size
+
+    def counts(self, hashtags: List[str]) -> np.ndarray:
+        """Count the posts that used each of the specified hashtags in every
+        bucket, as an array of shape `(len(hashtags), number of buckets)`."""
+
+        rows = {hashtag: row for row, hashtag in enumerate(hashtags)}
+        code_rows = np.array(
+            [rows.get(hashtag, -1) for hashtag in self.vocabulary.tolist()],
+            dtype=np.int64,
+        )
+        selected = code_rows[self.codes] if len(code_rows) else self.codes
+        mask = selected >= 0
+        num_buckets = self.last_bucket - self.first_bucket + 1
+        keys = selected[mask] * num_buckets + (
+            self.code_buckets[mask] - self.first_bucket
+        )
+        counts = np.bincount(keys, minlength=len(hashtags) * num_buckets)
+        return counts.reshape(len(hashtags), num_buckets)
+
+    def rolling_counts(self, hashtags: List[str]) -> np.ndarray:
+        """Like `counts`, but summed over a rolling window of the latest
+        `window` buckets up to each bucket."""
+
+        counts = self.counts(hashtags)
+        cumulative = np.cumsum(counts, axis=1)
+        rolling = cumulative.copy()
+        rolling[:, self.window :] -= cumulative[:, : -self.window]
+        return rolling
+
+    def emerging(
+        self, number: int = 20, min_count: int = 1, exclude: Tuple[str, ...] = ()
+    ) -> List[Dict]:
+        """Return the `number` hashtags with the highest emerging scores that
+        were used in at least `min_count` posts in the latest window."""
+
+        recent = self.code_buckets > self.last_bucket - self.window
+        recent_counts = np.bincount(self.codes[recent], minlength=len(self.vocabulary))
+        baseline_counts = np.bincount(
+            self.codes[~recent], minlength=len(self.vocabulary)
+        )
+        recent_posts = np.count_nonzero(
+            self.post_buckets > self.last_bucket - self.window
+        )
+        baseline_posts = len(self.post_buckets) - recent_posts
+
+        if baseline_posts:
+            expected = baseline_counts / baseline_posts * recent_posts
+        else:
+            expected = np.zeros(len(self.vocabulary))
+        scores = (recent_counts - expected) / np.sqrt(expected + 1)
+
+        excluded = set(hashtag.lower() for hashtag in exclude)
+        candidates = np.flatnonzero(recent_counts >= max(min_count, 1))
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        rows = []
+        for code in candidates.tolist():
+            hashtag = self.vocabulary[code].item()
+            if hashtag.lower() in excluded:
+                continue
+            rows.append(
+                {
+                    "hashtag": hashtag,
+                    "recent": int(recent_counts[code]),
+                    "baseline": int(baseline_counts[code]),
+                    "expected": float(expected[code]),
+                    "score": float(scores[code]),
+                }
+            )
+            if len(rows) == number:
+                break
+        return rows